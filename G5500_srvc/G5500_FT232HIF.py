@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Control the Yaesu G-5500 through an Adafruit FT232H breakout and an ADS1115 ADC,
+using pyftdi directly rather than Blinka. The FT232H does I2C on D0-D2 to reach the
+ADS1115, and the four relay lines hang off C0-C3, which pyftdi lets us drive as GPIO
+through the same I2C controller.
+
+Two things make this fast enough for closed-loop moves:
+    All four relay lines live on one GPIO port, so any change is one port write.
+    The ADS1115 runs in continuous conversion at its top data rate and we step its
+        input multiplexer from channel to channel, instead of starting a single-shot
+        conversion and waiting on it for every reading like Blinka's AnalogIn does."""
+
+import threading
+import time
+import G5500
+from pyftdi.i2c import I2cController
+
+FTDI_URL = 'ftdi://ftdi:232h/1'
+I2C_FREQUENCY_HZ = 400000
+ADS1115_ADDRESS = 0x48
+
+# ADS1115 registers and config register fields, from the TI datasheet
+REG_CONVERSION = 0x00
+REG_CONFIG = 0x01
+MUX_SINGLE_ENDED = {0: 0x4000, 1: 0x5000, 2: 0x6000, 3: 0x7000}
+PGA_4_096V = 0x0200          # +/-4.096 V full scale. The rotator outputs 0 to 4 V.
+FULL_SCALE_V = 4.096
+MODE_CONTINUOUS = 0x0000
+DATA_RATES = {8: 0x0000, 16: 0x0020, 32: 0x0040, 64: 0x0060, 128: 0x0080, 250: 0x00A0, 475: 0x00C0, 860: 0x00E0}
+COMP_DISABLE = 0x0003
+
+class ADS1115RoundRobin:
+    '''Keeps an ADS1115 converting continuously and reads several channels by switching
+    the multiplexer between them. After a switch, the next finished conversion is from
+    the new channel, so each reading waits one conversion period at most. The channel
+    that was selected last keeps converting while the caller is off doing something
+    else, so that first wait is usually already over.'''
+
+    def __init__(self, port, channels : list[int], data_rate : int = 860, now=time.monotonic, sleep=time.sleep):
+        if data_rate not in DATA_RATES:
+            raise ValueError(f'ADS1115 data rate must be one of {sorted(DATA_RATES)}')
+        self.port = port
+        self.channels = channels
+        self.data_rate = data_rate
+        # One conversion plus a little for the ADS1115's internal oscillator being up to 10% slow
+        self.conversion_s = 1.1 / data_rate
+        self.now, self.sleep = now, sleep
+        self.current = 0          # Index into channels of the one being converted
+        self.selected_t = None
+        self.reads = 0
+        self._select(0)
+
+    def _select(self, ndx : int):
+        config = MUX_SINGLE_ENDED[self.channels[ndx]] | PGA_4_096V | MODE_CONTINUOUS \
+            | DATA_RATES[self.data_rate] | COMP_DISABLE
+        self.port.write_to(REG_CONFIG, config.to_bytes(2, 'big'))
+        self.current = ndx
+        self.selected_t = self.now()
+
+    def read_all(self) -> dict:
+        '''Returns {channel: volts} for every channel, starting from the one that has
+        been converting the longest.'''
+        volts = {}
+        for _ in range(len(self.channels)):
+            self.sleep(self.selected_t + self.conversion_s - self.now())
+            raw = int.from_bytes(self.port.read_from(REG_CONVERSION, 2), 'big', signed=True)
+            volts[self.channels[self.current]] = raw * FULL_SCALE_V / 32768
+            self.reads += 1
+            self._select((self.current + 1) % len(self.channels))
+        return volts
+
+class G5500_FT232H(G5500.G5500):
+    '''Class to control a Yaesu G5500 rotator through an FT232H and ADS1115.'''
+
+    @staticmethod
+    def pin_assignments():
+        """Return the GPIO bit for each relay line and the ADS1115 channel for each input.
+        In pyftdi's I2C GPIO port, C0-C7 are bits 8-15."""
+        INPUT_CHANNELS = {'az_in': 0,
+                          'el_in': 2,
+                          'pwr_on_in': 1}
+        OUTPUT_BITS = {'az_left': 8 + 2,
+                       'az_right': 8 + 3,
+                       'el_up': 8 + 1,
+                       'el_down': 8 + 0}
+        return INPUT_CHANNELS, OUTPUT_BITS
+
+    def __init__(self, cal_file : str = 'rotator_cal.txt', url : str = FTDI_URL,
+                 i2c_port=None, gpio=None, data_rate : int = 860):
+        '''Constructor. Opens the FT232H at url. i2c_port and gpio can be passed in
+        instead, e.g. for testing.'''
+        super().__init__(cal_file)
+        self.input_channels, self.output_bits = G5500_FT232H.pin_assignments()
+        self.i2c = None
+        if i2c_port is None:
+            self.i2c = I2cController()
+            self.i2c.configure(url, frequency=I2C_FREQUENCY_HZ)
+            i2c_port = self.i2c.get_port(ADS1115_ADDRESS)
+            gpio = self.i2c.get_gpio()
+        self.gpio = gpio
+        self.relay_mask = sum(1 << bit for bit in self.output_bits.values())
+        self.gpio.set_direction(self.relay_mask, self.relay_mask)
+        self.port_value = 0
+        self.gpio.write(self.port_value)
+
+        # The I2C and GPIO traffic share one USB link, so one thing at a time
+        self.io = threading.Lock()
+        self.adc = ADS1115RoundRobin(i2c_port, [self.input_channels['az_in'], self.input_channels['el_in'],
+                                                self.input_channels['pwr_on_in']], data_rate, self.now, self.sleep)
+
+    def __del__(self):
+        """
+        The destructor method, called when the object is about to be destroyed.
+        """
+        try:
+            if self.i2c is not None:
+                self.gpio.write(0)
+                self.i2c.close()
+                print("FT232H closed.")
+        except Exception as e:
+            print(f"Error closing FT232H: {e}")
+
+    def _write_outputs(self, changes : dict):
+        '''Sets the changed relay lines. Whatever changed, it's one port write.'''
+        for line, value in changes.items():
+            bit = 1 << self.output_bits[line]
+            self.port_value = (self.port_value | bit) if value == G5500_FT232H.MOVE else (self.port_value & ~bit)
+        with self.io:
+            self.gpio.write(self.port_value)
+
+    def _read_sensors(self) -> tuple[float, float, bool]:
+        '''Reads the current positions from the rotator and updates self.az and self.el.
+        Also reads the power-on state of the rotator.
+        Returns a tuple of (az, el, pwr_on) in (degrees, degrees, bool).'''
+        with self.io:
+            volts = self.adc.read_all()
+        self.az, self.el = self.voltage_to_degrees(volts[self.input_channels['az_in']],
+                                                   volts[self.input_channels['el_in']])
+        self.pwr_on = volts[self.input_channels['pwr_on_in']] > 2.5  # Assume power is on if voltage is > 2.5V
+        return (self.az, self.el, self.pwr_on)
+
+    def __str__(self):
+        # Keeping the name short to prevent the print statements from getting too long
+        D = u'\N{DEGREE SIGN}'
+        az_str = f'{self.az:7.2f}{D}' if self.az is not None else 'None'
+        el_str = f'{self.el:7.2f}{D}' if self.el is not None else 'None'
+        pwr_str = 'On' if self.pwr_on else 'Off'
+        return f'G5500_FT232H(az={az_str}, el={el_str}, pwr_on={pwr_str})'
+
+
+# Unit tests - run with pytest. pyftdi's virtual USB backend only ships in its source
+# tree and has no ADS1115 behind it, so these use a register-level stand-in for the
+# ADC and the GPIO port instead.
+import pytest
+
+class FakeADS1115:
+    '''Behaves like an ADS1115 on a pyftdi I2cPort, on a virtual clock.'''
+
+    def __init__(self, volts : dict):
+        self.volts = volts
+        self.t = 0.0
+        self.config = None
+        self.selected_t = None
+        self.last_channel = None
+        self.transactions = 0
+
+    def write_to(self, regaddr : int, out : bytes):
+        self.transactions += 1
+        assert(regaddr == REG_CONFIG)
+        config = int.from_bytes(out, 'big')
+        assert(config & 0x0100 == MODE_CONTINUOUS)
+        if self.config is not None:
+            self.last_channel = self.channel
+        self.config = config
+        self.selected_t = self.t
+
+    @property
+    def channel(self) -> int:
+        return ((self.config >> 12) & 0x7) - 4
+
+    def read_from(self, regaddr : int, readlen : int) -> bytes:
+        self.transactions += 1
+        assert(regaddr == REG_CONVERSION and readlen == 2)
+        # Until a conversion finishes on the new channel you get the old one's
+        done = self.t - self.selected_t >= 1.0 / 860
+        channel = self.channel if done or self.last_channel is None else self.last_channel
+        return int(self.volts[channel] / FULL_SCALE_V * 32768).to_bytes(2, 'big', signed=True)
+
+class FakeGpio:
+    def __init__(self):
+        self.direction = 0
+        self.writes = []
+
+    def set_direction(self, pins : int, direction : int):
+        self.direction = (self.direction & ~pins) | (direction & pins)
+
+    def write(self, value : int):
+        assert(value & ~self.direction == 0)
+        self.writes.append(value)
+
+@pytest.fixture
+def ft232h(tmp_path):
+    cal_file = tmp_path / 'rotator_cal.txt'
+    cal_file.write_text('Az, 0, 0, 0.0, 450, 0, 4.0\nEl, 0, 0, 0.0, 180, 0, 4.0\n')
+    ads = FakeADS1115({0: 2.0, 1: 3.3, 2: 1.0, 3: 0.0})
+    gpio = FakeGpio()
+    g5500 = G5500_FT232H(str(cal_file), i2c_port=ads, gpio=gpio)
+    def sleep(seconds):
+        ads.t += max(seconds, 0.0)
+    g5500.adc.now, g5500.adc.sleep = (lambda: ads.t), sleep
+    g5500.adc._select(0)     # Again, on the fake's clock
+    ads.transactions = 0
+    return g5500, ads, gpio
+
+class TestFT232H:
+    def test_reads_every_channel(self, ft232h):
+        g5500, ads, gpio = ft232h
+        az, el, pwr_on = g5500.read_sensors()
+        assert(abs(az - 225.0) < 0.01)
+        assert(abs(el - 45.0) < 0.01)
+        assert(pwr_on)
+
+    def test_read_takes_one_conversion_per_channel(self, ft232h):
+        g5500, ads, gpio = ft232h
+        start = ads.t
+        g5500.read_sensors()
+        assert(ads.t - start < 3 * 1.2 / 860)
+        # A config write and a conversion read per channel, nothing else
+        assert(ads.transactions == 2 * 3)
+
+    def test_relays_are_one_port_write(self, ft232h):
+        g5500, ads, gpio = ft232h
+        gpio.writes.clear()
+        g5500.move_az_right()
+        g5500.move_el_up()
+        g5500.stop_motion()
+        assert(gpio.writes == [1 << 11, (1 << 11) | (1 << 9), 0])
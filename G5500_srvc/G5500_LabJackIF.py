@@ -5,18 +5,23 @@ but I don't really expect there to be many other people who will have those two
 of hardware AND will want to use this software."""
 
 from math import isclose
+import threading
+import time
+import numpy as np
 import G5500
+from sample_ring import SampleRing
 from labjack import ljm
 
 # More details on the LabJack T4 can be found here: 
 # https://support.labjack.com/docs/4-0-hardware-overview-t-series-datasheet
 
+STREAM_SCAN_RATE_HZ = 200   # Scans per second in stream mode. Each scan is az, el and power.
+STREAM_RING_SECONDS = 60    # How much streamed history to keep
+STREAM_START_BLOCKS = 5     # Give up waiting for the first streamed block after this many block times
+STREAM_SKIPPED = -9999.0    # What LJM puts in place of samples the device had to drop
 
 class G5500_LabJack(G5500.G5500):
     '''Class to control a Yaesu G5500 rotator through a LabJack T4.'''
-    
-    MOVE = 1
-    STOP = 0
 
     @staticmethod
     def use_db15():
@@ -42,8 +47,9 @@ class G5500_LabJack(G5500.G5500):
                     'el_down': 'FIO4'}
         return INPUT_PORTS, OUPUT_PORTS
 
-    def __init__(self, cal_file : str = 'rotator_cal.txt'):
-        '''Constructor'''
+    def __init__(self, cal_file : str = 'rotator_cal.txt', identifier : str = 'ANY'):
+        '''Constructor. identifier picks the LabJack by serial number, IP address or
+        name. Use "LJM_DEMO_MODE" to run against LJM's pretend device.'''
         super().__init__(cal_file)
         self.input_ports, self.output_ports = G5500_LabJack.use_main_body()
         self.az_right = self.output_ports["az_right"]
@@ -57,118 +63,149 @@ class G5500_LabJack(G5500.G5500):
         # Open the first found LabJack T4. I only have one so conflicts aren't likely.
         # If you have more than one, you may need to specify the serial number or IP
         # address of the LabJack T4 you want to use.
-        self.handle = ljm.openS("T4", "ANY", "ANY")  # Any T4, Any connection, Any identifier
+        self.handle = ljm.openS("T4", "ANY", identifier)  # Any T4, Any connection
         assert(self.handle is not None), 'LabJack handle is not set. Call open_labjack() first.'
         #info = ljm.getHandleInfo(self.handle)
 
+        # Stream mode state. See start_streaming().
+        self.ring = None
+        self.stream_thread = None
+        self.stream_error = None
+        self.stream_stop = threading.Event()
+
     def __del__(self):
         """
         The destructor method, called when the object is about to be destroyed.
         """
         try:
+            self.stop_streaming()
             ljm.close(self.handle)
             print("LabJack handle closed.")
         except Exception as e:
             print(f"Error closing LabJack handle: {e}") 
 
-    def stop_motion(self):
-        '''Stops all motion of the rotator.'''
-        ljm.eWriteName(self.handle, self.az_left, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.az_right, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.el_up, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.el_down, G5500_LabJack.STOP)
-    
-    def stop_az_motion(self):
-        '''Stops azimuth motion of the rotator.'''
-        ljm.eWriteName(self.handle, self.az_left, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.az_right, G5500_LabJack.STOP)
-
-    def stop_el_motion(self):
-        '''Stops elevation motion of the rotator.'''
-        ljm.eWriteName(self.handle, self.el_up, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.el_down, G5500_LabJack.STOP)
-        
-    def move_to(self, az : float, el : float):
-        '''Moves to the specified az/el coordinates. This is a blocking call that returns
-        when the move is complete.'''
-        self.read_sensors()
-        if not self.pwr_on:
-            raise RuntimeError('Rotator power is off. Cannot move.')
-        cal = self.rotator.cal_data
-        if not (cal.az.min_angle <= az <= cal.az.max_angle):
-            raise ValueError(f'Azimuth {az} is out of range ({cal.az.min_angle} to {cal.az.max_angle})')
-        if not (cal.el.min_angle <= el <= cal.el.max_angle):
-            raise ValueError(f'Elevation {el} is out of range ({cal.el.min_angle} to {cal.el.max_angle})')
-
-        # Do the whole loop twice since the first time sometimes overshoots
-        for tries in range(2):
-            print(f'Move attempt {tries+1} to az={az}, el={el}')
-            self.read_sensors()
-
-            # Create "function pointers" and lambdas to simplify the motion logic in the loop below.
-            # The mover methods start motion in the desired direction. The lambdas
-            # return True if we have reached or passed the target position.
-            if az < self.az:
-                az_mover = self.move_az_left
-                az_at_target = lambda actual, target: actual < (target + 0.5)
-            else:
-                az_mover = self.move_az_right
-                az_at_target = lambda actual, target: (target - 0.5) < actual
-
-            if el < self.el:
-                el_mover = self.move_el_down
-                el_at_target = lambda actual, target: actual < (target + 0.5)
-            else:
-                el_mover = self.move_el_up
-                el_at_target = lambda actual, target: (target - 0.5) < actual
-
-            # The first stage of motion is to move both axes simultaneously to save time.
-            while not az_at_target(self.az, az) or not el_at_target(self.el, el):
-                if not az_at_target(self.az, az):
-                    az_mover()
-                else:
-                    self.stop_az_motion()
-
-                if not el_at_target(self.el, el):
-                    el_mover()
-                else:
-                    self.stop_el_motion()
-
-                self.read_sensors()
-
-            self.stop_motion()
-            print(f'Azimuth target {az} reached {self.az}')
-            print(f'Elevation target {el} reached {self.el}')
-    
-    def move_az_right(self):
-        '''Starts motion to increase azimuth.'''
-        ljm.eWriteName(self.handle, self.az_left, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.az_right, G5500_LabJack.MOVE)
-    
-    def move_az_left(self):
-        '''Starts motion to decrease azimuth.'''
-        ljm.eWriteName(self.handle, self.az_right, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.az_left, G5500_LabJack.MOVE)
-    
-    def move_el_up(self):
-        '''Starts motion to increase elevation.'''
-        ljm.eWriteName(self.handle, self.el_down, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.el_up, G5500_LabJack.MOVE)
-    
-    def move_el_down(self):
-        '''Starts motion to decrease elevation.'''
-        ljm.eWriteName(self.handle, self.el_up, G5500_LabJack.STOP)
-        ljm.eWriteName(self.handle, self.el_down, G5500_LabJack.MOVE)
-    
-    def read_sensors(self) -> tuple[float, float, bool]:
+    def _write_outputs(self, changes : dict):
+        '''Sets the changed output lines in one LJM transaction.'''
+        names = [self.output_ports[line] for line in changes]
+        ljm.eWriteNames(self.handle, len(names), names, list(changes.values()))
+
+    def _write_and_read(self, changes : dict) -> tuple[float, float, bool]:
+        '''Sets the changed output lines and reads the sensors in a single LJM transaction.
+        Every call to the LabJack is a USB or Ethernet round trip, so doing both at
+        once is what sets how fast a control loop can run.
+        Returns the same tuple as read_sensors().'''
+        if self.streaming:
+            # The sensors are already coming in so only the writes go out
+            if changes:
+                self._write_outputs(changes)
+            return self.read_sensors()
+        in_names = [self.az_in, self.el_in, self.pwr_on_in]
+        names = [self.output_ports[line] for line in changes] + in_names
+        writes = [ljm.constants.WRITE] * len(changes) + [ljm.constants.READ] * len(in_names)
+        values = list(changes.values()) + [0] * len(in_names)
+        results = ljm.eNames(self.handle, len(names), names, writes, [1] * len(names), values)
+        return self._update_from_voltages(*results[len(changes):])
+
+    def _read_sensors(self) -> tuple[float, float, bool]:
         '''Reads the current positions from the rotator and updates self.az and self.el.
-        Also reads the power-on state of the rotator.
+        Also reads the power-on state of the rotator. While streaming, this is just the
+        newest streamed sample and does no I/O.
         Returns a tuple of (az, el, pwr_on) in (degrees, degrees, bool).'''
+        if self.streaming:
+            return self.latest_sample()[1:]
         names = [self.az_in, self.el_in, self.pwr_on_in]
         numFrames = len(names)
 
         # Setup and call eReadNames to read values from the LabJack.
         az_v, el_v, pwr_on_v = ljm.eReadNames(self.handle, numFrames, names)
+        return self._update_from_voltages(az_v, el_v, pwr_on_v)
+
+    @property
+    def streaming(self) -> bool:
+        return self.stream_thread is not None
+
+    def start_streaming(self, scan_rate : float = STREAM_SCAN_RATE_HZ, ring_seconds : float = STREAM_RING_SECONDS):
+        '''Starts sampling az, el and power in LJM stream mode. The device clocks the
+        scans so the sample timing no longer depends on how fast anybody polls. A
+        background thread converts each block to degrees and adds it to self.ring.
+        Returns the scan rate the device actually chose.'''
+        if self.streaming:
+            raise RuntimeError('Already streaming')
+        names = [self.az_in, self.el_in, self.pwr_on_in]
+        addresses, _ = ljm.namesToAddresses(len(names), names)
+
+        # Free-running internal clock, no trigger
+        ljm.eWriteName(self.handle, 'STREAM_TRIGGER_INDEX', 0)
+        ljm.eWriteName(self.handle, 'STREAM_CLOCK_SOURCE', 0)
+
+        # Ask for about ten blocks a second so the newest sample is never very old
+        scans_per_read = max(1, int(scan_rate / 10))
+        self.scan_rate = ljm.eStreamStart(self.handle, scans_per_read, len(addresses), addresses, scan_rate)
+        self.stream_t0 = time.monotonic()
+        self.stream_start_timeout_s = STREAM_START_BLOCKS * scans_per_read / self.scan_rate
+        self.ring = SampleRing(int(self.scan_rate * ring_seconds), 3)
+        self.stream_error = None
+        self.stream_stop.clear()
+        self.stream_thread = threading.Thread(target=self._stream_loop, args=(len(addresses),), daemon=True)
+        self.stream_thread.start()
+        print(f'Streaming {len(addresses)} channels at {self.scan_rate:.1f} scans/s')
+        return self.scan_rate
+
+    def stop_streaming(self):
+        '''Stops stream mode. The ring keeps the samples that were collected.'''
+        if not self.streaming:
+            return
+        self.stream_stop.set()
+        self.stream_thread.join()
+        self.stream_thread = None
+
+    def _stream_loop(self, num_channels : int):
+        '''Runs on the stream thread. eStreamRead blocks until a block is ready.'''
+        scans = 0
+        try:
+            while not self.stream_stop.is_set():
+                data, device_backlog, ljm_backlog = ljm.eStreamRead(self.handle)
+                block = np.asarray(data, dtype=float).reshape(-1, num_channels)
+                block[block == STREAM_SKIPPED] = np.nan
+
+                # Time stamps come from the scan count, which follows the device's clock
+                times = self.stream_t0 + (scans + np.arange(len(block))) / self.scan_rate
+                scans += len(block)
+                az, el = self.voltage_to_degrees(block[:, 0], block[:, 1])
+                self.ring.append(times, np.column_stack([az, el, block[:, 2]]))
+        except Exception as e:
+            self.stream_error = e
+            print(f'Stream stopped: {e}')
+        finally:
+            try:
+                ljm.eStreamStop(self.handle)
+            except ljm.LJMError:
+                pass
+
+    def latest_sample(self) -> tuple[float, float, float, bool]:
+        '''Newest streamed sample as (time, az, el, pwr_on), where time is on the
+        time.monotonic() clock. Updates self.az, self.el and self.pwr_on.'''
+        if self.stream_error is not None:
+            raise RuntimeError(f'Streaming failed: {self.stream_error}')
+        sample = self.ring.latest()
+        deadline = time.monotonic() + self.stream_start_timeout_s
+        while sample is None:
+            # The first block hasn't arrived yet. Don't wait on a stream that has died.
+            if self.stream_error is not None:
+                raise RuntimeError(f'Streaming failed: {self.stream_error}')
+            if self.stream_thread is None or not self.stream_thread.is_alive():
+                raise RuntimeError('Streaming stopped before any samples came in')
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'No streamed samples after {self.stream_start_timeout_s:.2f} s')
+            time.sleep(0.01)
+            sample = self.ring.latest()
+        t, (az, el, pwr_on_v) = sample
+        self.az, self.el = float(az), float(el)
+        self.pwr_on = bool(pwr_on_v > 2.5)
+        return t, self.az, self.el, self.pwr_on
+
+    def _update_from_voltages(self, az_v : float, el_v : float, pwr_on_v : float) -> tuple[float, float, bool]:
+        '''Converts raw sensor voltages and updates self.az, self.el and self.pwr_on.'''
         self.az, self.el = self.voltage_to_degrees(az_v, el_v)
         self.pwr_on = pwr_on_v > 2.5  # Assume power is on if voltage is > 2.5V
 
@@ -185,4 +222,22 @@ class G5500_LabJack(G5500.G5500):
 
     
 
-    
\ No newline at end of file
+    
+
+
+# Unit tests - run with pytest. These need the LJM library but not a LabJack since
+# they use LJM's demo device.
+class TestStreaming:
+    def test_demo_stream(self):
+        g5500 = G5500_LabJack(identifier='LJM_DEMO_MODE')
+        try:
+            rate = g5500.start_streaming(scan_rate=100, ring_seconds=5)
+            time.sleep(0.5)
+            assert(len(g5500.ring) > 0)
+            t, az, el, pwr_on = g5500.latest_sample()
+            assert(t <= time.monotonic())
+            assert(g5500.read_sensors() == (g5500.az, g5500.el, g5500.pwr_on))
+            times, _ = g5500.ring.last(len(g5500.ring))
+            assert(np.allclose(np.diff(times), 1.0 / rate))
+        finally:
+            g5500.stop_streaming()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Pretend Yaesu G-5500 for testing without any hardware. The relays are the same four
+lines the real backends drive and the physics behind them is simple but covers
+what matters to the controllers: each axis speeds up and slows down at a fixed rate,
+tops out at its slew rate, coasts after the relay opens and stops at the ends of
+travel. The position comes back the way the real one does, as a voltage with
+noise that goes through an ADC with a finite step size.
+
+It can run in real time, faster than real time, or on a virtual clock that only
+moves when somebody sleeps, which makes a 30 second move take microseconds."""
+
+import os
+import threading
+import time
+import numpy as np
+import G5500
+from motion_model import MotionModel, motion_file_for
+
+ADC_STEP_V = 0.005      # About what the LabJack T4 high-voltage inputs resolve
+NOISE_V = 0.002         # Sensor noise, one sigma
+PWR_ON_V = 5.0
+
+# Used when there is no rotator_motion.txt. Roughly the spec sheet numbers.
+DEFAULT_MOTION = '''
+    Az, +, 20.0, 6.0, 0.9, 0.15
+    Az, -, 20.0, 6.0, 0.9, 0.15
+    El, +, 20.0, 2.69, 0.18, 0.067
+    El, -, 20.0, 2.69, 0.18, 0.067
+    '''
+
+class SimAxis:
+    '''Physics of one axis. Accelerates at accel toward the commanded speed and slows
+    down at whatever rate gives the measured coast.'''
+
+    def __init__(self, model : MotionModel, axis : str, min_angle : float, max_angle : float, pos : float):
+        self.up, self.down = model.get(axis, 1), model.get(axis, -1)
+        self.min_angle, self.max_angle = min_angle, max_angle
+        self.pos = pos
+        self.vel = 0.0
+        self.command = 0    # -1, 0 or +1
+
+    def _decel(self, d : int) -> float:
+        data = self.up if d > 0 else self.down
+        # Coasting from full speed to a stop covers rate^2 / (2 decel)
+        return data.rate ** 2 / (2 * data.coast) if data.coast > 0 else 1e9
+
+    def advance(self, dt : float):
+        '''Moves the physics on by dt seconds.'''
+        while dt > 0:
+            if self.command != 0:
+                data = self.up if self.command > 0 else self.down
+                target = self.command * data.rate
+            else:
+                target = 0.0
+            if self.vel == target:
+                self.pos += self.vel * dt
+                break
+            # Speeding up in the commanded direction uses accel, anything else is braking
+            speeding_up = self.command != 0 and np.sign(self.vel) in (0, self.command) and abs(target) > abs(self.vel)
+            if speeding_up:
+                a = (self.up if self.command > 0 else self.down).accel
+            else:
+                a = self._decel(np.sign(self.vel) if self.vel != 0 else self.command)
+            t_reach = abs(target - self.vel) / a
+            step = min(dt, t_reach)
+            accel = a * np.sign(target - self.vel)
+            self.pos += self.vel * step + 0.5 * accel * step * step
+            self.vel = target if step == t_reach else self.vel + accel * step
+            dt -= step
+        # The limit switches stop the motor at the ends of travel
+        if self.pos <= self.min_angle or self.pos >= self.max_angle:
+            self.pos = min(max(self.pos, self.min_angle), self.max_angle)
+            self.vel = 0.0
+
+class G5500_Sim(G5500.G5500):
+    '''Simulated rotator. With virtual_clock, time only passes in sleep(). Otherwise it
+    follows the real clock, speedup times faster.'''
+
+    def __init__(self, cal_file : str = 'rotator_cal.txt', speedup : float = 1.0, virtual_clock : bool = False,
+                 az : float = 180.0, el : float = 0.0, seed : int = None, noise_v : float = NOISE_V):
+        super().__init__(cal_file)
+        assert(speedup > 0)
+        self.speedup = speedup
+        self.virtual_clock = virtual_clock
+        self.lock = threading.RLock()
+        self.t = 0.0
+        self.real_t0 = time.monotonic()
+        self.sim_t = 0.0    # Time the physics has been advanced to
+        self.rng = np.random.default_rng(seed)
+        self.noise_v = noise_v
+        self.pwr_on_v = PWR_ON_V
+
+        # Behave like the rotator that was characterized if there is a model for it
+        motion_file = motion_file_for(cal_file)
+        model = MotionModel.from_file(motion_file) if os.path.exists(motion_file) else MotionModel.from_string(DEFAULT_MOTION)
+        cal = self.rotator.cal_data
+        self.axes = {'az': SimAxis(model, 'az', cal.az.min_angle, cal.az.max_angle, az),
+                     'el': SimAxis(model, 'el', cal.el.min_angle, cal.el.max_angle, el)}
+
+    def now(self) -> float:
+        if self.virtual_clock:
+            return self.t
+        return (time.monotonic() - self.real_t0) * self.speedup
+
+    def sleep(self, seconds : float):
+        if seconds <= 0:
+            return
+        if self.virtual_clock:
+            with self.lock:
+                self.t += seconds
+        else:
+            time.sleep(seconds / self.speedup)
+
+    def _advance(self):
+        '''Brings the physics up to now().'''
+        with self.lock:
+            t = self.now()
+            if t > self.sim_t:
+                for axis in self.axes.values():
+                    axis.advance(t - self.sim_t)
+                self.sim_t = t
+
+    def _write_outputs(self, changes : dict):
+        with self.lock:
+            self._advance()
+            lines = self.outputs.state
+            for name, up, down in (('az', 'az_right', 'az_left'), ('el', 'el_up', 'el_down')):
+                # Both relays on is a short in the real control box. Treat it as stopped.
+                self.axes[name].command = (lines[up] == G5500.G5500.MOVE) - (lines[down] == G5500.G5500.MOVE)
+
+    def _voltage(self, axis_cal, angle : float) -> float:
+        '''What the ADC would read for an angle, noise and quantization included.'''
+        v = axis_cal.min_voltage + (angle - axis_cal.min_angle) * (axis_cal.max_voltage - axis_cal.min_voltage) \
+            / (axis_cal.max_angle - axis_cal.min_angle)
+        v += self.rng.normal(0.0, self.noise_v) if self.noise_v > 0 else 0.0
+        return round(v / ADC_STEP_V) * ADC_STEP_V
+
+    def _read_sensors(self) -> tuple[float, float, bool]:
+        '''Reads the current positions from the rotator and updates self.az and self.el.
+        Also reads the power-on state of the rotator.
+        Returns a tuple of (az, el, pwr_on) in (degrees, degrees, bool).'''
+        with self.lock:
+            self._advance()
+            cal = self.rotator.cal_data
+            az_v = self._voltage(cal.az, self.axes['az'].pos)
+            el_v = self._voltage(cal.el, self.axes['el'].pos)
+        self.az, self.el = self.voltage_to_degrees(az_v, el_v)
+        self.pwr_on = self.pwr_on_v > 2.5
+        return (self.az, self.el, self.pwr_on)
+
+    def true_position(self) -> tuple[float, float]:
+        '''Where the simulated rotator really is, without sensor errors.'''
+        with self.lock:
+            self._advance()
+            return self.axes['az'].pos, self.axes['el'].pos
+
+    def __str__(self):
+        D = u'\N{DEGREE SIGN}'
+        az_str = f'{self.az:7.2f}{D}' if self.az is not None else 'None'
+        el_str = f'{self.el:7.2f}{D}' if self.el is not None else 'None'
+        pwr_str = 'On' if self.pwr_on else 'Off'
+        return f'G5500_Sim(az={az_str}, el={el_str}, pwr_on={pwr_str})'
+
+
+# Unit tests - run with pytest
+import pytest
+
+CAL = '''Az, 0, 0, 0.0, 450, 0, 4.0
+         El, 0, 0, 0.0, 180, 0, 4.0'''
+
+@pytest.fixture
+def cal_file(tmp_path):
+    filename = tmp_path / 'rotator_cal.txt'
+    filename.write_text(CAL)
+    return str(filename)
+
+class TestSimAxis:
+    def test_coast_matches_model(self):
+        model = MotionModel.from_string(DEFAULT_MOTION)
+        axis = SimAxis(model, 'az', 0, 450, 100.0)
+        axis.command = 1
+        axis.advance(5.0)
+        assert(axis.vel == 6.0)
+        released = axis.pos
+        axis.command = 0
+        axis.advance(5.0)
+        assert(axis.vel == 0.0)
+        assert(abs(axis.pos - released - 0.9) < 1e-9)
+
+    def test_end_stop(self):
+        axis = SimAxis(MotionModel.from_string(DEFAULT_MOTION), 'el', 0, 180, 170.0)
+        axis.command = 1
+        axis.advance(30.0)
+        assert(axis.pos == 180.0)
+        assert(axis.vel == 0.0)
+
+class TestG5500Sim:
+    def test_readings_are_quantized(self, cal_file):
+        g5500 = G5500_Sim(cal_file, virtual_clock=True, az=123.4, el=45.6, seed=1)
+        az, el, pwr_on = g5500.read_sensors()
+        assert(pwr_on)
+        step_deg = 450 * ADC_STEP_V / 4.0
+        assert(abs(az / step_deg - round(az / step_deg)) < 1e-6)
+        assert(abs(az - 123.4) < 3 * step_deg)
+
+    def test_move_on_virtual_clock(self, cal_file):
+        g5500 = G5500_Sim(cal_file, virtual_clock=True, seed=2)
+        wall = time.monotonic()
+        g5500.move_to(300, 60)
+        assert(time.monotonic() - wall < 5.0)
+        assert(g5500.now() > 15.0)   # 120 degrees of azimuth is 20 seconds of travel
+        az, el = g5500.true_position()
+        assert(abs(az - 300) < 1.0)
+        assert(abs(el - 60) < 1.0)
+
+    def test_precise_move(self, cal_file):
+        g5500 = G5500_Sim(cal_file, virtual_clock=True, seed=3, noise_v=0.0)
+        g5500.move_to(200.0, 30.0, tolerance=0.2)
+        az, el = g5500.true_position()
+        assert(abs(az - 200) < 0.3)
+        assert(abs(el - 30) < 0.3)
+
+    def test_speedup(self, cal_file):
+        g5500 = G5500_Sim(cal_file, speedup=50.0, seed=4)
+        wall = time.monotonic()
+        g5500.move_to(190, 10)
+        elapsed = time.monotonic() - wall
+        assert(elapsed < g5500.now() / 10)
@@ -11,7 +11,7 @@ import socket
 import sys
 import argparse_config_file
 from G5500 import G5500
-import simple_client_server
+import async_server
 
 CONFIG_FILE='G5500_config.txt'
 CAL_FILE='rotator_cal.txt'
@@ -22,32 +22,46 @@ DEFAULT_PORT=9040 # Default port for the service to listen on
 # Define the set of command-line arguments
 parser = argparse_config_file.ArgumentParserWithConfig(description=__doc__)
 parser.add_argument('--conf_export', action='store_true')
-parser.add_argument('--elevation_m', type=float, default=0)
-parser.add_argument('--longitude', type=float, default=0)
-parser.add_argument('--latitude', type=float, default=0)
+# The station location. TRACKSAT is turned off unless all three are given.
+parser.add_argument('--elevation_m', type=float, default=None)
+parser.add_argument('--longitude', type=float, default=None)
+parser.add_argument('--latitude', type=float, default=None)
 parser.add_argument('--interactive', action='store_true')
+parser.add_argument('--characterize', action='store_true',
+                    help='Time the rotator moving each way and save the motion model next to the cal file')
 parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+parser.add_argument('--rotctld_port', type=int, default=4533,
+                    help='Port for hamlib rotctld clients such as Gpredict. 0 turns it off.')
+parser.add_argument('--max_clients', type=int, default=256,
+                    help='Connections past this many are turned away')
 parser.add_argument(
     "--hw_interface",
-    choices=["LabJack", "FT232H"],
+    choices=["LabJack", "FT232H", "Sim"],
     default="LabJack",
-    help="Choose one of the allowed interfaces."
+    help="Choose one of the allowed interfaces. Sim is a pretend rotator for testing."
 )
+parser.add_argument('--sim_speedup', type=float, default=1.0,
+                    help='How many times faster than real time the Sim interface runs')
+parser.add_argument('--ftdi_url', type=str, default='ftdi://ftdi:232h/1',
+                    help='pyftdi URL of the FT232H to use with the FT232H interface')
 
 def sanity_test_config(args):
     '''Check that the configuration parameters are reasonable.'''
-    if args.longitude < -180 or args.longitude > 180:
+    if args.longitude is not None and (args.longitude < -180 or args.longitude > 180):
         print(f'Longitude {args.longitude} is out of range')
         sys.exit(1)
-    if args.latitude < -90 or args.latitude > 90:
+    if args.latitude is not None and (args.latitude < -90 or args.latitude > 90):
         print(f'Latitude {args.latitude} is out of range')
         sys.exit(1)
-    if args.elevation_m < -430 or args.elevation_m > 8850: # Dead Sea shore to Mt Everest
+    if args.elevation_m is not None and (args.elevation_m < -430 or args.elevation_m > 8850): # Dead Sea shore to Mt Everest
         print(f'Elevation {args.elevation_m} is out of range')
         sys.exit(1)
     if args.port < 1024 or args.port > 65535:
         print(f'Port {args.port} is out of range. Must be between 1024 and 65535')
         sys.exit(1)
+    if args.rotctld_port != 0 and (args.rotctld_port < 1024 or args.rotctld_port > 65535 or args.rotctld_port == args.port):
+        print(f'rotctld port {args.rotctld_port} is out of range or the same as --port. Must be between 1024 and 65535, or 0')
+        sys.exit(1)
 
 def interactive_mode( g5500 : G5500 ):
     '''Run the interactive mode. The user can control the rotator with the keyboard.'''
@@ -117,14 +131,24 @@ if __name__ == "__main__":
     if args.hw_interface == 'LabJack':
         import G5500_LabJackIF as G5500_IF
         g5500 = G5500_IF.G5500_LabJack(CAL_FILE)
+    elif args.hw_interface == 'Sim':
+        import G5500_SimIF as G5500_IF
+        g5500 = G5500_IF.G5500_Sim(CAL_FILE, speedup=args.sim_speedup)
     else:
-        #import G5500_FT232HIF as G5500_IF
-        g5500 = None
-        raise NotImplementedError('FT232H interface not implemented yet')
+        import G5500_FT232HIF as G5500_IF
+        g5500 = G5500_IF.G5500_FT232H(CAL_FILE, url=args.ftdi_url)
 
-    if args.interactive:
+    if args.characterize:
+        import motion_model
+        motion_model.characterize(g5500, filename=motion_model.motion_file_for(CAL_FILE))
+    elif args.interactive:
         print("Using interactive mode")
         interactive_mode(g5500)
     else:
         print("Using service mode")
-        simple_client_server.start_server(g5500, args.port)
+        observer = (args.latitude, args.longitude, args.elevation_m)
+        if None in observer:
+            print('No --latitude, --longitude and --elevation_m, so TRACKSAT is off')
+            observer = None
+        async_server.serve(g5500, args.port, max_clients=args.max_clients, observer=observer,
+                           rotctld_port=args.rotctld_port)
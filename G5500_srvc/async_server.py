@@ -0,0 +1,856 @@
+#!/usr/bin/env python3
+'''TCP command server for the G5500 service, built on asyncio so one thread looks
+after every connection. It speaks the same line-oriented protocol as
+simple_client_server, with these differences:
+
+    Commands are newline terminated and a client can send several at once without
+    waiting. Each gets its own response, in order.
+    MOVETO answers right away with "MOVETO az,el started." and the move runs in the
+    background. When it ends the client gets one more line, starting with DONE,
+    ABORTED or ERROR. Those lines can arrive in between other responses.
+    A client that disconnects only stops the rotator if it had it moving.
+    Past max_clients, new connections are told the server is busy and closed.
+    SUBSCRIBE rate_hz [deadband_deg] streams "POS time az=.. el=.. pwr=.." lines at up
+    to rate_hz, or with a deadband only when a position moved by more than that
+    (or the power changed). UNSUBSCRIBE ends it. One sampler in the actor feeds
+    every subscriber, running at the fastest rate anyone asked for.
+    READ answers from the latest sample when it is recent enough, so a room full of
+    clients polling the position doesn't turn into a room full of sensor reads.
+    TRACK [start_epoch] uploads a trajectory as "t az el" lines ending with END, and
+    TRACKB n [start_epoch] as n binary points right after the command line (see
+    track_job). The service then follows it on its own clock, even if the client
+    goes away. TRACKPOLY nbytes [start_epoch] does the same with nbytes of the
+    compact polynomial format from trajectory, which starts at its own t0 unless
+    start_epoch is given. TRACKSTATUS reports progress and pointing error, TRACKABORT ends
+    it, and when it ends the uploader gets a DONE, ABORTED or ERROR TRACK line.
+    MOVETO, manual moves and STOP all end a running track. STOP and QUIT also cut
+    short a TRACK or TRACKSAT upload.
+    TRACKSAT [norad_id] followed by a TLE (two lines, or three with the name first)
+    or one line of OMM JSON tracks that satellite from now, or its next rise, until
+    it sets. The service propagates it itself from its own latitude, longitude and
+    elevation (see sat_track). While any track runs, POS lines carry the pointing
+    error as well.
+
+All rotator I/O goes through a HardwareActor, so the event loop never waits on the
+hardware, commands from different clients never overlap on the wire, and STOP
+goes ahead of everything else. STATS reports the actor's queue depth and latency.
+rotctld_server puts a hamlib rotctld front end on the same RotatorServer.'''
+
+import asyncio
+import socket
+import time
+import G5500
+from hardware_actor import HardwareActor, Preempted, Sample, MAX_SAMPLE_HZ, READ_MAX_AGE_S
+from track_job import TrackJob, MAX_POINTS, POINT_BYTES
+from trajectory import Trajectory
+
+HOST = '127.0.0.1'
+PORT = 9040
+MAX_CLIENTS = 256
+MAX_LINE = 1024           # Longest command line accepted
+WATCH_PERIOD_S = 0.1      # How often to check on background moves
+MAX_BACKLOG_BYTES = 4096  # Skip position updates to a client with this much unsent
+MAX_POLY_BYTES = 1 << 20  # Largest TRACKPOLY upload
+UPLOAD_BREAKS = ['STOP', 'X', 'QUIT']  # These still work partway through a TRACK or TRACKSAT upload
+
+HELP_TEXT = ('Available commands: STOP, MOVETO az el, LEFT, RIGHT, UP, DOWN, READ, '
+             'SUBSCRIBE rate_hz [deadband_deg], UNSUBSCRIBE, TRACK [start_epoch], TRACKB n [start_epoch], '
+             'TRACKPOLY nbytes [start_epoch], TRACKSAT [norad_id], TRACKSTATUS, TRACKABORT, STATS, HELP, QUIT')
+
+async def read_command(reader : asyncio.StreamReader) -> bytes:
+    '''Reads one line, like reader.readline(). A line longer than the reader's limit
+    is thrown away in full, up to and including its newline, and None comes back.'''
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial    # Hung up. Whatever came before that is the last line.
+    except asyncio.LimitOverrunError:
+        pass
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as e:
+            # Drop what has arrived so far and keep looking for the newline
+            await reader.readexactly(e.consumed)
+
+class Client:
+    '''One connection.'''
+
+    def __init__(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self.manual = False    # Left a relay on with LEFT/RIGHT/UP/DOWN
+        self.subscription = None
+        self.upload = None     # Lines of a TRACK or TRACKSAT upload in progress
+        self.upload_kind = None
+        self.upload_start = None   # TRACK start time, or TRACKSAT NORAD id
+
+    async def send(self, line : str):
+        '''Sends one line. Waits if the client isn't keeping up, which also stops us
+        reading more commands from it until it does.'''
+        self.writer.write(line.encode('utf-8') + b'\n')
+        await self.writer.drain()
+
+    def notify(self, line : str):
+        '''Sends a line without waiting, for notices that aren't answers to anything.'''
+        if not self.writer.is_closing():
+            self.writer.write(line.encode('utf-8') + b'\n')
+
+    @property
+    def backlog(self) -> int:
+        '''Bytes written but not yet sent.'''
+        return self.writer.transport.get_write_buffer_size()
+
+class Subscription:
+    '''What a client asked for with SUBSCRIBE.'''
+
+    def __init__(self, rate_hz : float, deadband : float):
+        self.rate_hz = rate_hz
+        self.deadband = deadband
+        self.last = None       # Last Sample sent
+        self.dropped = 0
+
+    def wants(self, sample : Sample) -> bool:
+        if self.last is None:
+            return True
+        # A little slack so a subscriber at the sampler's own rate gets every sample
+        if sample.mono - self.last.mono < 0.9 / self.rate_hz:
+            return False
+        if self.deadband > 0:
+            return abs(sample.az - self.last.az) > self.deadband or abs(sample.el - self.last.el) > self.deadband \
+                or sample.pwr_on != self.last.pwr_on
+        return True
+
+class MoveWaiter:
+    '''A client waiting to hear how its MOVETO ended.'''
+
+    def __init__(self, client : Client, generation : int, az : float, el : float):
+        self.client = client
+        self.generation = generation
+        self.az, self.el = az, el
+
+    def finish(self, outcome : str, detail : str):
+        self.client.notify(f'{outcome} MOVETO {self.az},{self.el} {detail}')
+
+class RotatorServer:
+    '''Serves commands for one rotator. Use start() then serve_forever(), or serve().
+    Pass in actor to share one with another server. Otherwise it makes its own.
+    observer is (latitude, longitude, elevation_m) of the station, for TRACKSAT.'''
+
+    def __init__(self, g5500 : G5500.G5500, host : str = HOST, port : int = PORT, max_clients : int = MAX_CLIENTS,
+                 actor : HardwareActor = None, read_max_age_s : float = READ_MAX_AGE_S, observer : tuple = None):
+        self.g5500 = g5500
+        self.observer = observer
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.read_max_age_s = read_max_age_s
+        self.own_actor = actor is None
+        self.actor = HardwareActor(g5500) if actor is None else actor
+        self.clients = set()
+        self.move_waiters = []
+        self.watcher = None
+        self.server = None
+        self.loop = None
+        self.track_job = None
+        self.poll_rate_hz = 0.0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.actor.add_listener(self._on_sample)
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, limit=MAX_LINE)
+        # With port 0 the OS picks one
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f'Server listening on {self.host}:{self.port}')
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.actor.remove_listener(self._on_sample)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for client in list(self.clients):
+            client.writer.close()
+        if self.watcher is not None:
+            self.watcher.cancel()
+        self.clients.clear()
+        self._update_sample_rate()
+        await self._abort_track('server closing')
+        await self._stop()
+        if self.own_actor:
+            self.actor.close()
+
+    async def position(self, max_age_s : float = None) -> Sample:
+        '''The rotator position from the cached sample, reading the sensors only if
+        it is older than max_age_s (read_max_age_s by default).'''
+        sample = self.actor.fresh_sample(self.read_max_age_s if max_age_s is None else max_age_s)
+        if sample is None:
+            sample = await self._hw(self.actor.sample_now, key='sample')
+        return sample
+
+    async def retarget(self, az : float, el : float) -> int:
+        '''Starts a move to az/el without waiting for it, ending any track. A running
+        move just takes the new target. Returns the move generation. Raises
+        ValueError or RuntimeError if the rotator can't go there.'''
+        await self._abort_track('superseded')
+        def start():
+            self.g5500.start_move(az, el)
+            return self.g5500.move_generation
+        # Targets still waiting in the queue give way to the newest one
+        generation = await self._hw(start, key='target', motion=True)
+        # The new target ends whatever the move was going to before
+        self._finish_all('ABORTED', 'superseded')
+        return generation
+
+    async def stop(self):
+        '''STOP from any client. Ends moves and tracks too.'''
+        await self._stop()
+        self._finish_all('ABORTED', 'stopped')
+
+    def set_poll_rate(self, hz : float):
+        '''Keeps the sampler running at least at hz for clients that poll rather than
+        subscribe, so their polls are answered from the cache. 0 when there are none.'''
+        self.poll_rate_hz = hz
+        self._update_sample_rate()
+
+    async def _hw(self, fn, *args, **kwargs):
+        '''Runs fn on the hardware actor. kwargs go to HardwareActor.submit().'''
+        return await asyncio.wrap_future(self.actor.submit(fn, *args, **kwargs))
+
+    async def _stop(self):
+        await asyncio.wrap_future(self.actor.stop())
+
+    async def _handle_client(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        client = Client(reader, writer)
+        if len(self.clients) >= self.max_clients:
+            print(f'Turned away {client.addr}. Already have {len(self.clients)} clients.')
+            writer.write(b'Error: Server busy. Try again later.\n')
+            writer.close()
+            return
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Responses are short and someone is waiting on each one
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients.add(client)
+        print(f'Connected by {client.addr}')
+        try:
+            await client.send("Welcome to the command server! Type 'HELP' for commands.")
+            while True:
+                line = await read_command(reader)
+                if line is None:
+                    await client.send('Error: Command too long.')
+                    continue
+                if not line:
+                    break    # Client disconnected
+                response, keep_going = await self.execute(client, line.decode('utf-8', errors='replace'))
+                if response:
+                    await client.send(response)
+                if not keep_going:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            print(f'Client {client.addr} forcefully disconnected.')
+        finally:
+            self.clients.discard(client)
+            if client.subscription is not None:
+                self._update_sample_rate()
+            await self._disconnected(client)
+            writer.close()
+            print(f'Client {client.addr} disconnected.')
+
+    async def _disconnected(self, client : Client):
+        '''Stops the rotator if this client had it moving.'''
+        mine = [w for w in self.move_waiters if w.client is client]
+        if client.manual or mine:
+            await self._stop()
+            self._finish_all('ABORTED', 'client disconnected')
+
+    async def _manual(self, client : Client, fn):
+        '''Runs a manual relay command, first stopping any move that would fight it.'''
+        await self._abort_track('manual control')
+        def run():
+            self.g5500.cancel_move()
+            fn()
+        await self._hw(run, motion=True)
+        self._finish_all('ABORTED', 'manual control')
+        client.manual = True
+
+    def _finish_all(self, outcome : str, detail : str):
+        for waiter in self.move_waiters:
+            waiter.finish(outcome, detail)
+        self.move_waiters.clear()
+
+    async def execute(self, client : Client, line : str) -> tuple[str, bool]:
+        '''Runs one command line. Returns (response, keep_going).'''
+        args = line.strip().upper().split()
+        command = args[0] if args else ''
+        if client.upload is not None:
+            if command not in UPLOAD_BREAKS:
+                return await self._upload_line(client, line)
+            # Give up on the upload and run the command as usual
+            client.upload, client.upload_kind = None, None
+
+        try:
+            return await self._execute(client, command, args)
+        except asyncio.IncompleteReadError:
+            return '', False    # Hung up partway through a binary upload
+        except Preempted:
+            return f'{command} command preempted by STOP.', True
+
+    async def _execute(self, client : Client, command : str, args : list[str]) -> tuple[str, bool]:
+        if command == '':
+            return '', True
+        elif command in ['STOP', 'X']:
+            await self.stop()
+            client.manual = False
+            return 'STOP command executed.', True
+        elif command == 'MOVETO':
+            return await self._moveto(client, args), True
+        elif command == 'LEFT':
+            await self._manual(client, self.g5500.move_az_left)
+            return 'LEFT command executed.', True
+        elif command == 'RIGHT':
+            await self._manual(client, self.g5500.move_az_right)
+            return 'RIGHT command executed.', True
+        elif command == 'UP':
+            await self._manual(client, self.g5500.move_el_up)
+            return 'UP command executed.', True
+        elif command == 'DOWN':
+            await self._manual(client, self.g5500.move_el_down)
+            return 'DOWN command executed.', True
+        elif command == 'READ':
+            await self.position()
+            return f'READ command executed. {self.g5500}', True
+        elif command == 'SUBSCRIBE':
+            return self._subscribe(client, args), True
+        elif command == 'UNSUBSCRIBE':
+            client.subscription = None
+            self._update_sample_rate()
+            return 'UNSUBSCRIBE command executed.', True
+        elif command == 'TRACK':
+            if len(args) > 2:
+                return 'Error: TRACK command takes at most a start time.', True
+            try:
+                client.upload_start = float(args[1]) if len(args) == 2 else None
+            except ValueError:
+                return 'Error: TRACK start time must be numeric.', True
+            client.upload, client.upload_kind = [], 'TRACK'
+            return "TRACK send 't az el' lines, then END.", True
+        elif command == 'TRACKSAT':
+            if self.observer is None:
+                return 'Error: TRACKSAT needs the station location, which this service was not given.', True
+            if len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+                return 'Error: TRACKSAT command takes at most a NORAD catalog number.', True
+            client.upload_start = int(args[1]) if len(args) == 2 else None
+            client.upload, client.upload_kind = [], 'TRACKSAT'
+            return 'TRACKSAT send the TLE or one line of OMM JSON.', True
+        elif command == 'TRACKB':
+            return await self._track_binary(client, args), True
+        elif command == 'TRACKPOLY':
+            return await self._track_poly(client, args), True
+        elif command == 'TRACKSTATUS':
+            job = self.track_job
+            return f'TRACKSTATUS {job.status() if job is not None else "idle"}', True
+        elif command == 'TRACKABORT':
+            await self._abort_track('aborted by client')
+            return 'TRACKABORT command executed.', True
+        elif command == 'STATS':
+            stats = self.actor.stats()
+            return 'STATS ' + ' '.join(f'{name}={value:.2f}' if isinstance(value, float) else f'{name}={value}'
+                                       for name, value in stats.items()), True
+        elif command == 'HELP':
+            return HELP_TEXT, True
+        elif command == 'QUIT':
+            await self.stop()
+            client.manual = False
+            return 'STOP command executed. Exiting.', False
+        else:
+            return f"Unknown command: '{command}'. Type 'HELP' for commands.", True
+
+    async def _moveto(self, client : Client, args : list[str]) -> str:
+        if len(args) != 3:
+            return 'Error: MOVETO command requires two arguments: az and el.'
+        try:
+            az = float(args[1])
+            el = float(args[2])
+        except ValueError:
+            return 'Error: MOVETO command arguments must be numeric.'
+
+        try:
+            generation = await self.retarget(az, el)
+        except (ValueError, RuntimeError) as e:
+            return f'Error: {e}'
+        self.move_waiters.append(MoveWaiter(client, generation, az, el))
+        if self.watcher is None or self.watcher.done():
+            self.watcher = asyncio.create_task(self._watch_moves())
+        return f'MOVETO {az},{el} started.'
+
+    async def _upload_line(self, client : Client, line : str) -> tuple[str, bool]:
+        '''One line of a text TRACK upload. Points get no reply. END starts the track.'''
+        if client.upload_kind == 'TRACKSAT':
+            return await self._tracksat_line(client, line), True
+        if line.strip().upper() != 'END':
+            if len(client.upload) >= MAX_POINTS:
+                client.upload = None
+                return f'Error: TRACK has more than {MAX_POINTS} points.', True
+            client.upload.append(line)
+            return '', True
+        lines, client.upload = client.upload, None
+        try:
+            job = TrackJob.from_text(self.actor, lines, start_epoch=client.upload_start)
+        except ValueError as e:
+            return f'Error: {e}', True
+        return await self._start_track(client, job), True
+
+    async def _tracksat_line(self, client : Client, line : str) -> str:
+        '''One line of a TRACKSAT upload. It's complete after line 2 of a TLE or a
+        line of JSON.'''
+        client.upload.append(line)
+        line = line.strip()
+        if not (line.startswith('{') or line.startswith('2 ')):
+            if len(client.upload) < 3:
+                return ''
+            client.upload = None
+            return 'Error: TRACKSAT expected a TLE or one line of OMM JSON.'
+        lines, norad_id, client.upload = client.upload, client.upload_start, None
+        try:
+            import sat_track
+        except ImportError as e:
+            return f'Error: TRACKSAT needs skyfield. {e}'
+
+        def plan():
+            sat = sat_track.load_satellite(lines)
+            if norad_id is not None and sat.model.satnum != norad_id:
+                raise ValueError(f'The elements are for {sat.model.satnum}, not {norad_id}')
+            return sat_track.plan_pass(sat, *self.observer, self.g5500.rotator.cal_data, time.time(),
+                                       start_az=self.g5500.az)
+        try:
+            # Finding the pass takes a moment, so not on the event loop
+            plan = await asyncio.get_running_loop().run_in_executor(None, plan)
+            job = TrackJob(self.actor, plan.t, plan.az, plan.el, start_epoch=plan.start_epoch, name=plan.name)
+        except ValueError as e:
+            return f'Error: {e}'
+        await self._start_track(client, job)
+        return f'TRACKSAT {plan}'
+
+    async def _track_binary(self, client : Client, args : list[str]) -> str:
+        if len(args) not in (2, 3):
+            return 'Error: TRACKB command requires a point count and optionally a start time.'
+        try:
+            count = int(args[1])
+            start_epoch = float(args[2]) if len(args) == 3 else None
+        except ValueError:
+            return 'Error: TRACKB command arguments must be numeric.'
+        if not (1 <= count <= MAX_POINTS):
+            return f'Error: TRACKB point count must be between 1 and {MAX_POINTS}.'
+        data = await client.reader.readexactly(count * POINT_BYTES)
+        try:
+            job = TrackJob.from_binary(self.actor, data, start_epoch=start_epoch)
+        except ValueError as e:
+            return f'Error: {e}'
+        return await self._start_track(client, job)
+
+    async def _track_poly(self, client : Client, args : list[str]) -> str:
+        if len(args) not in (2, 3):
+            return 'Error: TRACKPOLY command requires a byte count and optionally a start time.'
+        try:
+            count = int(args[1])
+            start_epoch = float(args[2]) if len(args) == 3 else None
+        except ValueError:
+            return 'Error: TRACKPOLY command arguments must be numeric.'
+        if not (1 <= count <= MAX_POLY_BYTES):
+            return f'Error: TRACKPOLY byte count must be between 1 and {MAX_POLY_BYTES}.'
+        data = await client.reader.readexactly(count)
+        try:
+            traj = Trajectory.from_bytes(data)
+            kwargs = {'start_epoch': start_epoch} if start_epoch is not None else {}
+            job = TrackJob.from_trajectory(self.actor, traj, start_az=self.g5500.az, **kwargs)
+        except ValueError as e:
+            return f'Error: {e}'
+        return await self._start_track(client, job)
+
+    async def _start_track(self, client : Client, job : TrackJob) -> str:
+        '''Replaces whatever the rotator was doing with job.'''
+        await self._abort_track('superseded')
+        self._finish_all('ABORTED', 'superseded')
+        self.track_job = job
+        job.start()
+        asyncio.create_task(self._report_track(client, job))
+        return f'TRACK {len(job.t)} points, {job.duration:.1f} s, started.'
+
+    async def _abort_track(self, reason : str):
+        job = self.track_job
+        if job is not None and job.active:
+            await asyncio.get_running_loop().run_in_executor(None, job.abort, reason)
+
+    async def _report_track(self, client : Client, job : TrackJob):
+        '''Tells the uploader how the track ended.'''
+        await asyncio.get_running_loop().run_in_executor(None, job.wait)
+        outcome = {TrackJob.DONE: 'DONE', TrackJob.ABORTED: 'ABORTED'}.get(job.state, 'ERROR')
+        client.notify(f'{outcome} TRACK {job.status()}')
+
+    def _subscribe(self, client : Client, args : list[str]) -> str:
+        if len(args) not in (2, 3):
+            return 'Error: SUBSCRIBE command requires a rate in Hz and optionally a deadband in degrees.'
+        try:
+            rate_hz = float(args[1])
+            deadband = float(args[2]) if len(args) == 3 else 0.0
+        except ValueError:
+            return 'Error: SUBSCRIBE command arguments must be numeric.'
+        if not (0 < rate_hz <= MAX_SAMPLE_HZ):
+            return f'Error: SUBSCRIBE rate must be more than 0 and at most {MAX_SAMPLE_HZ} Hz.'
+        if deadband < 0:
+            return 'Error: SUBSCRIBE deadband can not be negative.'
+        client.subscription = Subscription(rate_hz, deadband)
+        self._update_sample_rate()
+        return f'SUBSCRIBE {rate_hz} Hz, deadband {deadband} deg.'
+
+    def _update_sample_rate(self):
+        '''Runs the sampler as fast as the most demanding subscriber or poller wants, or not at all.'''
+        rates = [c.subscription.rate_hz for c in self.clients if c.subscription is not None]
+        self.actor.set_sample_rate(max(rates + [self.poll_rate_hz]))
+
+    def _on_sample(self, sample : Sample):
+        '''Called on the sampler thread. Hands the sample over to the event loop.'''
+        try:
+            self.loop.call_soon_threadsafe(self._publish, sample)
+        except RuntimeError:
+            pass    # Event loop already closed
+
+    def _publish(self, sample : Sample):
+        line = f'POS {sample}'
+        job = self.track_job
+        if job is not None and job.state == TrackJob.RUNNING:
+            line += f' track_err az={job.az_error:+.2f} el={job.el_error:+.2f}'
+        for client in self.clients:
+            sub = client.subscription
+            if sub is None or not sub.wants(sample):
+                continue
+            if client.backlog > MAX_BACKLOG_BYTES:
+                # Not keeping up. It gets a newer one when it catches up.
+                sub.dropped += 1
+                continue
+            client.notify(line)
+            sub.last = sample
+
+    async def _watch_moves(self):
+        '''Tells clients when their moves end. Runs while anyone is waiting.'''
+        while self.move_waiters:
+            await asyncio.sleep(WATCH_PERIOD_S)
+            if self.g5500.moving or not self.move_waiters:
+                continue
+            try:
+                await self._hw(self.g5500.wait_move, 0)
+            except Exception as e:
+                self._finish_all('ERROR', str(e))
+            else:
+                self._finish_all('DONE', str(self.g5500))
+
+def serve(g5500 : G5500.G5500, port : int = PORT, host : str = HOST, max_clients : int = MAX_CLIENTS,
+          observer : tuple = None, rotctld_port : int = None):
+    '''Runs the server until interrupted. observer is (latitude, longitude, elevation_m).
+    With rotctld_port, a hamlib rotctld front end (see rotctld_server) listens there too.'''
+    async def main():
+        server = RotatorServer(g5500, host, port, max_clients, observer=observer)
+        await server.start()
+        servers = [server]
+        if rotctld_port:
+            from rotctld_server import RotctldServer
+            servers.insert(0, RotctldServer(server, host, rotctld_port, max_clients))
+            await servers[0].start()
+        try:
+            await asyncio.gather(*(s.serve_forever() for s in servers))
+        finally:
+            for s in servers:
+                await s.close()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('Server stopped')
+
+
+# Unit tests - run with pytest
+import numpy as np
+import pytest
+
+CAL = '''Az, 0, 0, 0.0, 450, 0, 4.0
+         El, 0, 0, 0.0, 180, 0, 4.0'''
+
+@pytest.fixture
+def sim(tmp_path):
+    from G5500_SimIF import G5500_Sim
+    filename = tmp_path / 'rotator_cal.txt'
+    filename.write_text(CAL)
+    return G5500_Sim(str(filename), virtual_clock=True, seed=1)
+
+def run_with_server(g5500, test, **kwargs):
+    '''Runs the coroutine test(server) against a server on a free port.'''
+    async def main():
+        server = RotatorServer(g5500, port=0, **kwargs)
+        await server.start()
+        try:
+            await asyncio.wait_for(test(server), 10.0)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+async def connect(server):
+    reader, writer = await asyncio.open_connection(HOST, server.port)
+    assert((await reader.readline()).startswith(b'Welcome'))
+    return reader, writer
+
+class TestRotatorServer:
+    def test_pipelined_commands(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            # Three commands in one packet, then one split across two
+            writer.write(b'HELP\nREAD\nBOGUS\nRE')
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            writer.write(b'AD\n')
+            assert((await reader.readline()).startswith(b'Available commands'))
+            assert((await reader.readline()).startswith(b'READ command executed.'))
+            assert(b'Unknown command' in await reader.readline())
+            assert((await reader.readline()).startswith(b'READ command executed.'))
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_moveto_does_not_block(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'MOVETO 200 30\nREAD\n')
+            assert(await reader.readline() == b'MOVETO 200.0,30.0 started.\n')
+            assert((await reader.readline()).startswith(b'READ command executed.'))
+            done = await reader.readline()
+            assert(done.startswith(b'DONE MOVETO 200.0,30.0'))
+            az, el = sim.true_position()
+            assert(abs(az - 200) < 1.0 and abs(el - 30) < 1.0)
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_new_target_supersedes(self, sim):
+        # Without noise the move comes out the same however the threads interleave
+        sim.noise_v = 0.0
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'MOVETO 300 60\nMOVETO 190 10\n')
+            lines = [await reader.readline() for _ in range(4)]
+            assert(b'ABORTED MOVETO 300.0,60.0 superseded\n' in lines)
+            assert(any(line.startswith(b'DONE MOVETO 190.0,10.0') for line in lines))
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_bad_moveto(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'MOVETO 1000 10\nMOVETO a b\n' + b'X' * (MAX_LINE * 2) + b'\nHELP\n')
+            assert((await reader.readline()).startswith(b'Error: Azimuth 1000.0 is out of range'))
+            assert(await reader.readline() == b'Error: MOVETO command arguments must be numeric.\n')
+            assert(await reader.readline() == b'Error: Command too long.\n')
+            assert((await reader.readline()).startswith(b'Available commands'))
+
+            # The end of a long line that arrives later is thrown away too, not run
+            writer.write(b'X' * (MAX_LINE * 2))
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            writer.write(b' QUIT\nHELP\n')
+            assert(await reader.readline() == b'Error: Command too long.\n')
+            assert((await reader.readline()).startswith(b'Available commands'))
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_many_idle_clients(self, sim):
+        async def test(server):
+            clients = [await connect(server) for _ in range(300)]
+            assert(len(server.clients) == 300)
+            reader, writer = clients[-1]
+            start = time.monotonic()
+            writer.write(b'READ\n')
+            assert((await reader.readline()).startswith(b'READ'))
+            assert(time.monotonic() - start < 1.0)
+            for _, writer in clients:
+                writer.close()
+        run_with_server(sim, test, max_clients=300)
+
+    def test_connection_limit(self, sim):
+        async def test(server):
+            first = await connect(server)
+            reader, writer = await asyncio.open_connection(HOST, server.port)
+            assert((await reader.readline()).startswith(b'Error: Server busy'))
+            assert(await reader.read() == b'')
+            first[1].close()
+        run_with_server(sim, test, max_clients=1)
+
+    def test_disconnect_stops_own_move_only(self, sim):
+        async def test(server):
+            mover = await connect(server)
+            watcher = await connect(server)
+            mover[1].write(b'RIGHT\n')
+            await mover[0].readline()
+            watcher[1].close()
+            await asyncio.sleep(0.2)
+            assert(sim.outputs.state['az_right'] == G5500.G5500.MOVE)
+            mover[1].close()
+            await asyncio.sleep(0.2)
+            assert(sim.outputs.state['az_right'] == G5500.G5500.STOP)
+        run_with_server(sim, test)
+
+    def test_stats(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'READ\nSTATS\n')
+            await reader.readline()
+            stats = (await reader.readline()).decode()
+            assert(stats.startswith('STATS depth=0 executed='))
+            assert('mean_wait_ms=' in stats)
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_subscribe(self, sim):
+        async def test(server):
+            fast = await connect(server)
+            slow = await connect(server)
+            fast[1].write(b'SUBSCRIBE 10\n')
+            slow[1].write(b'SUBSCRIBE 2.5 1.5\n')
+            assert(await fast[0].readline() == b'SUBSCRIBE 10.0 Hz, deadband 0.0 deg.\n')
+            assert(await slow[0].readline() == b'SUBSCRIBE 2.5 Hz, deadband 1.5 deg.\n')
+            await asyncio.sleep(1.0)
+            fast[1].write(b'UNSUBSCRIBE\n')
+            lines = []
+            while (line := await fast[0].readline()) != b'UNSUBSCRIBE command executed.\n':
+                lines.append(line)
+            assert(8 <= len(lines) <= 12)
+            assert(all(line.startswith(b'POS ') and b' az=180.' in line for line in lines))
+            # The rotator isn't moving, so past the first update the deadband holds the rest back
+            slow[1].write(b'HELP\n')
+            assert((await slow[0].readline()).startswith(b'POS '))
+            assert((await slow[0].readline()).startswith(b'Available commands'))
+            # Both subscribers came from one sampler
+            assert(server.actor.stats()['sensor_reads'] <= 12)
+            slow[1].close()
+            await asyncio.sleep(0.05)
+            assert(server.actor.sample_period is None)
+            fast[1].close()
+        run_with_server(sim, test)
+
+    def test_read_is_cached(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'READ\nREAD\nREAD\nSUBSCRIBE 0\nSUBSCRIBE 5 x\n')
+            for _ in range(3):
+                assert((await reader.readline()).startswith(b'READ command executed.'))
+            assert((await reader.readline()).startswith(b'Error: SUBSCRIBE rate'))
+            assert((await reader.readline()).startswith(b'Error: SUBSCRIBE command arguments'))
+            assert(server.actor.stats()['sensor_reads'] == 1)
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_track_upload(self, tmp_path):
+        from G5500_SimIF import G5500_Sim
+        filename = tmp_path / 'rotator_cal.txt'
+        filename.write_text(CAL)
+        sim = G5500_Sim(str(filename), speedup=20.0, az=100.0, el=10.0, seed=2)
+        async def test(server):
+            reader, writer = await connect(server)
+            points = ''.join(f'{t} {100 + 3 * t} {10 + t}\n' for t in range(21))
+            writer.write(b'TRACK\n' + points.encode() + b'END\nTRACKSTATUS\n')
+            assert((await reader.readline()).startswith(b'TRACK send'))
+            assert(await reader.readline() == b'TRACK 21 points, 20.0 s, started.\n')
+            assert((await reader.readline()).startswith(b'TRACKSTATUS '))
+            done = await reader.readline()
+            assert(done.startswith(b'DONE TRACK done 20.0/20.0 s error'))
+            az, el = sim.true_position()
+            assert(abs(az - 160) < 2.0 and abs(el - 30) < 2.0)
+
+            # The same thing backwards in binary, then abort it
+            t = np.arange(21.0)
+            writer.write(b'TRACKB 21\n' + TrackJob.to_binary(t, 160 - 3 * t, 30 - t) + b'TRACKSTATUS\n')
+            assert(await reader.readline() == b'TRACK 21 points, 20.0 s, started.\n')
+            assert((await reader.readline()).startswith(b'TRACKSTATUS '))
+            writer.write(b'TRACKABORT\nTRACKB 2\n' + TrackJob.to_binary([0, 1], [10, 999], [0, 0]))
+            lines = [await reader.readline() for _ in range(3)]
+            assert(b'TRACKABORT command executed.\n' in lines)
+            assert(any(line.startswith(b'ABORTED TRACK') and b'(aborted by client)' in line for line in lines))
+            assert(any(line.startswith(b'Error: Trajectory azimuth') for line in lines))
+            assert(not sim.moving)
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_stop_during_upload(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'TRACK\n0 100 10\nstop\nTRACKSTATUS\n')
+            assert((await reader.readline()).startswith(b'TRACK send'))
+            assert(await reader.readline() == b'STOP command executed.\n')
+            assert((await reader.readline()).startswith(b'TRACKSTATUS '))
+            server.observer = (38.9596, -104.7695, 2092)
+            writer.write(b'TRACKSAT\nQUIT\n')
+            assert((await reader.readline()).startswith(b'TRACKSAT send'))
+            assert(await reader.readline() == b'STOP command executed. Exiting.\n')
+            assert(await reader.readline() == b'')
+        run_with_server(sim, test)
+
+    def test_track_poly(self, tmp_path):
+        from G5500_SimIF import G5500_Sim
+        filename = tmp_path / 'rotator_cal.txt'
+        filename.write_text(CAL)
+        sim = G5500_Sim(str(filename), speedup=20.0, az=100.0, el=10.0, seed=3)
+        async def test(server):
+            reader, writer = await connect(server)
+            t = np.arange(0.0, 20.05, 0.1)
+            data = Trajectory.fit(t, 100 + 3 * t, 10 + t, t0=0.0).to_bytes()
+            # Start it on the service's clock rather than at its own t0
+            writer.write(f'TRACKPOLY {len(data)} {time.time()}\n'.encode() + data)
+            assert(await reader.readline() == b'TRACK 21 points, 20.0 s, started.\n')
+            assert((await reader.readline()).startswith(b'DONE TRACK done 20.0/20.0 s error'))
+            az, el = sim.true_position()
+            assert(abs(az - 160) < 2.0 and abs(el - 30) < 2.0)
+
+            damaged = data[:-1] + bytes([data[-1] ^ 0xff])
+            writer.write(f'TRACKPOLY {len(damaged)}\n'.encode() + damaged + b'TRACKPOLY 0\n')
+            assert(await reader.readline() == b'Error: Trajectory checksum does not match\n')
+            assert((await reader.readline()).startswith(b'Error: TRACKPOLY byte count'))
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_tracksat_needs_location(self, sim):
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'TRACKSAT\n')
+            assert((await reader.readline()).startswith(b'Error: TRACKSAT needs the station location'))
+            writer.close()
+        run_with_server(sim, test)
+
+    def test_tracksat(self, sim):
+        # AO-7 is high enough that two year old elements still give a sensible orbit
+        omm = ('{"OBJECT_NAME":"OSCAR 7 (AO-7)","OBJECT_ID":"1974-089B","EPOCH":"2024-10-27T11:24:08.044704",'
+               '"MEAN_MOTION":12.53681533,"ECCENTRICITY":0.001207,"INCLINATION":101.9888,"RA_OF_ASC_NODE":297.4083,'
+               '"ARG_OF_PERICENTER":190.741,"MEAN_ANOMALY":324.0528,"EPHEMERIS_TYPE":0,"CLASSIFICATION_TYPE":"U",'
+               '"NORAD_CAT_ID":7530,"ELEMENT_SET_NO":999,"REV_AT_EPOCH":28585,"BSTAR":0.00025342,'
+               '"MEAN_MOTION_DOT":-6.0e-8,"MEAN_MOTION_DDOT":0}')
+        async def test(server):
+            reader, writer = await connect(server)
+            writer.write(b'TRACKSAT 7530\n' + omm.encode() + b'\nTRACKSTATUS\n')
+            assert((await reader.readline()).startswith(b'TRACKSAT send'))
+            assert((await reader.readline()).startswith(b'TRACKSAT OSCAR 7 (AO-7) from '))
+            status = await reader.readline()
+            assert(status.startswith(b'TRACKSTATUS waiting') or status.startswith(b'TRACKSTATUS running'))
+            # Tracking carries on after the client leaves
+            writer.close()
+            await asyncio.sleep(0.2)
+            assert(server.track_job.active)
+
+            reader, writer = await connect(server)
+            writer.write(b'TRACKSAT 25544\n' + omm.encode() + b'\nTRACKABORT\n')
+            await reader.readline()
+            assert(await reader.readline() == b'Error: The elements are for 7530, not 25544\n')
+            assert(await reader.readline() == b'TRACKABORT command executed.\n')
+            assert(not server.track_job.active)
+            writer.close()
+        run_with_server(sim, test, observer=(38.9596, -104.7695, 2092))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+'''Times the LabJack control loop against the fake LJM in fake_ljm.py. No LabJack needed.
+Each move is driven the way the old move_to() did it, heading for the target until
+each axis gets there, with nothing holding the loop to a period, so every pass goes
+as fast as its LJM calls let it. Two ways of doing a pass's I/O are compared:
+
+    separate  What move_to() used to do. Each axis stops the direction it isn't
+              going and then sets the one it is, an eWriteName each, and then one
+              eReadNames for the sensors. Five round trips.
+    combined  What the move loop does now. The relay lines that changed and the
+              sensor reads go out in one eNames, through _flush_outputs(read=True).
+
+Reports for each connection type how many LJM calls a pass took, the mean and 99th
+percentile time of a pass, and the loop rate that comes to.'''
+
+import argparse
+import time
+import numpy as np
+import fake_ljm
+from G5500 import G5500, RelayOutputs
+
+TOLERANCE_DEG = 0.5   # Same as the old move_to()
+MAX_LOOPS = 1000000
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--cal_file', type=str, default='rotator_cal.txt')
+parser.add_argument('--connection', choices=['USB', 'Ethernet', 'none', 'all'], default='all')
+parser.add_argument('--latency_ms', type=float, help='Overrides the per-call latency of the connection type')
+parser.add_argument('--moves', type=int, default=4, help='How many moves to time')
+parser.add_argument('--step', type=float, default=20.0, help='Degrees of azimuth per move')
+parser.add_argument('--io', choices=['combined', 'separate', 'both'], default='both')
+
+# A few moves back and forth, each with a bit of elevation too
+def targets(n : int, step : float):
+    for k in range(n):
+        sign = 1 if k % 2 == 0 else -1
+        yield 180.0 + sign * step / 2, 20.0 + sign * step / 4
+
+def relay_lines(moving : dict) -> dict:
+    '''Line values for each axis that is still moving. moving maps the line to drive
+    for each axis to whether it should be on.'''
+    lines = {line: G5500.STOP for line in RelayOutputs.LINES}
+    for line, on in moving.items():
+        if on:
+            lines[line] = G5500.MOVE
+    return lines
+
+def separate_pass(ljm, g5500, lines : dict) -> tuple[float, float]:
+    '''The old I/O: two eWriteNames per axis, the line going off first, then one
+    eReadNames.'''
+    for pair in (('az_left', 'az_right'), ('el_down', 'el_up')):
+        for line in sorted(pair, key=lambda line: lines[line]):
+            ljm.eWriteName(g5500.handle, g5500.output_ports[line], lines[line])
+    az, el, _ = g5500._read_sensors()
+    return az, el
+
+def combined_pass(ljm, g5500, lines : dict) -> tuple[float, float]:
+    '''The new I/O: whatever changed and the reads in one eNames.'''
+    for line, value in lines.items():
+        g5500.outputs.set(line, value)
+    az, el, _ = g5500._flush_outputs(read=True)
+    return az, el
+
+def drive(fake : fake_ljm.FakeLJM, g5500, do_pass, az : float, el : float) -> tuple[list, int]:
+    '''Moves to az/el with no pacing. Returns the time of each pass and the LJM calls
+    they made.'''
+    cur_az, cur_el, _ = g5500.read_sensors()
+    az_line = 'az_right' if az > cur_az else 'az_left'
+    el_line = 'el_up' if el > cur_el else 'el_down'
+    az_sign, el_sign = (1 if az > cur_az else -1), (1 if el > cur_el else -1)
+    fake.reset_counts()
+    times = []
+    start = time.perf_counter()
+    for _ in range(MAX_LOOPS):
+        # An axis is done once it reaches or passes its target
+        az_going = (az - cur_az) * az_sign > TOLERANCE_DEG
+        el_going = (el - cur_el) * el_sign > TOLERANCE_DEG
+        if not (az_going or el_going):
+            break
+        cur_az, cur_el = do_pass(fake, g5500, relay_lines({az_line: az_going, el_line: el_going}))
+        now = time.perf_counter()
+        times.append(now - start)
+        start = now
+    calls = sum(fake.calls.values())
+    g5500.stop_motion()
+    return times, calls
+
+def run(fake : fake_ljm.FakeLJM, g5500, label : str, do_pass, n : int, step : float):
+    times, calls, errors = [], 0, []
+    for az, el in targets(n, step):
+        move_times, move_calls = drive(fake, g5500, do_pass, az, el)
+        times += move_times
+        calls += move_calls
+        time.sleep(0.5)     # Let it coast to a stop before looking
+        errors.append((fake.axes['az'].pos - az, fake.axes['el'].pos - el))
+    times = np.array(times)
+    worst = np.max(np.abs(errors), axis=0)
+    print(f'{label:>20} {len(times):7d} {calls / len(times):10.2f} {times.mean() * 1000:8.3f} '
+          f'{np.percentile(times, 99) * 1000:8.3f} {1.0 / times.mean():9.1f} {worst[0]:5.2f},{worst[1]:5.2f}')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    fake = fake_ljm.install(seed=1)
+    import G5500_LabJackIF   # After install() so it picks up the fake
+
+    g5500 = G5500_LabJackIF.G5500_LabJack(args.cal_file)
+    fake.attach(g5500, args.cal_file, az=180.0, el=20.0)
+
+    connections = ['USB', 'Ethernet', 'none'] if args.connection == 'all' else [args.connection]
+    passes = {'separate': separate_pass, 'combined': combined_pass}
+    io_modes = list(passes) if args.io == 'both' else [args.io]
+    print(f'{"Connection, I/O":>20} {"Loops":>7} {"Calls/loop":>10} {"Mean ms":>8} {"p99 ms":>8} '
+          f'{"Loop Hz":>9} {"Worst error":>11}')
+    for connection in connections:
+        fake.latency_s = args.latency_ms / 1000 if args.latency_ms is not None else fake_ljm.LATENCY_S[connection]
+        for io_mode in io_modes:
+            run(fake, g5500, f'{connection}, {io_mode}', passes[io_mode], args.moves, args.step)
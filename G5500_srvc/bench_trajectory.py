@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+'''Times the compact trajectory format in trajectory.py on a made-up pass. Reports
+for each tolerance how many knots it took, how big it is next to the TRACK and
+TRACKB formats, how long fitting, encoding, decoding and evaluating take, and the
+worst error against the samples it was fitted to.'''
+
+import argparse
+import time
+import numpy as np
+from trajectory import Trajectory, flyover
+from track_job import TrackJob
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--duration', type=float, default=900.0, help='Seconds in the pass')
+parser.add_argument('--step', type=float, default=0.1, help='Seconds between samples')
+parser.add_argument('--tolerances', type=float, nargs='+', default=[0.01, 0.05, 0.25])
+parser.add_argument('--repeat', type=int, default=1000, help='How many times to encode and decode')
+
+def timed(fn, repeat : int) -> float:
+    '''Seconds per call.'''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    t, az, el = flyover(args.duration, args.step)
+    text_bytes = len(''.join(f'{a:.3f} {b:.3f} {c:.3f}\n' for a, b, c in zip(t, az, el)))
+    binary_bytes = len(TrackJob.to_binary(t, az, el))
+    print(f'{len(t)} samples over {args.duration:.0f} s: TRACK text {text_bytes} bytes, TRACKB {binary_bytes} bytes')
+    print(f'{"Tolerance":>9} {"Knots":>6} {"Bytes":>6} {"Fit ms":>7} {"Encode MB/s":>12} {"Decode MB/s":>12} '
+          f'{"Eval us":>8} {"Eval M/s":>9} {"Max err":>8}')
+    stamps = np.linspace(0.0, args.duration, 100000)
+    for tolerance in args.tolerances:
+        start = time.perf_counter()
+        traj = Trajectory.fit(t, az, el, tolerance=tolerance, t0=0.0)
+        fit_s = time.perf_counter() - start
+        data = traj.to_bytes()
+        encode_s = timed(traj.to_bytes, args.repeat)
+        decode_s = timed(lambda: Trajectory.from_bytes(data), args.repeat)
+        scalar_s = timed(lambda: traj.evaluate(args.duration / 3), args.repeat)
+        vector_s = timed(lambda: traj.evaluate(stamps), 10)
+        print(f'{tolerance:9.3f} {len(traj):6d} {len(data):6d} {fit_s * 1000:7.1f} '
+              f'{len(data) / encode_s / 1e6:12.1f} {len(data) / decode_s / 1e6:12.1f} '
+              f'{scalar_s * 1e6:8.1f} {len(stamps) / vector_s / 1e6:9.1f} {traj.max_error:8.4f}')
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+'''Stand-in for LabJack's ljm module so G5500_LabJack can run without a LabJack. The
+DIO lines drive the same simulated rotator as G5500_SimIF and the AIN channels read
+its position back as voltages. Every call takes as long as a real round trip would
+(configurable) and is counted, so control loops can be timed and compared.
+
+Use install() before G5500_LabJackIF is imported:
+
+    import fake_ljm
+    fake = fake_ljm.install(latency_s=fake_ljm.LATENCY_S['USB'])
+    import G5500_LabJackIF
+    g5500 = G5500_LabJackIF.G5500_LabJack('rotator_cal.txt')
+    fake.attach(g5500)'''
+
+import os
+import sys
+import threading
+import time
+import types
+from collections import Counter
+import numpy as np
+from G5500 import CalibrationData
+from G5500_SimIF import SimAxis, DEFAULT_MOTION, ADC_STEP_V, NOISE_V, PWR_ON_V
+from motion_model import MotionModel, motion_file_for
+
+# Rough command-response times for a LabJack T4
+LATENCY_S = {'USB': 0.0006, 'Ethernet': 0.0015, 'none': 0.0}
+
+class LJMError(Exception):
+    pass
+
+class FakeLJM:
+    '''The parts of labjack.ljm that G5500_LabJack uses.'''
+
+    LJMError = LJMError
+    constants = types.SimpleNamespace(READ=0, WRITE=1)
+
+    def __init__(self, latency_s : float = LATENCY_S['USB'], seed : int = None):
+        self.latency_s = latency_s
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng(seed)
+        self.outputs = {}       # Pin name to value
+        self.pin_lines = {}     # Pin name to relay line
+        self.inputs = {}        # Pin name to 'az', 'el' or 'pwr_on'
+        self.axes = None
+        self.cal = None
+        self.sim_t = None
+        self.stream = None
+        self.stream_fault = None    # Set to an LJMError for eStreamRead to raise, like an unplugged device
+
+    def attach(self, g5500, cal_file : str = None, az : float = 180.0, el : float = 0.0):
+        '''Wires the fake device to the pins a G5500_LabJack uses and puts the simulated
+        rotator at az/el.'''
+        self.pin_lines = {pin: line for line, pin in g5500.output_ports.items()}
+        self.inputs = {pin: name.replace('_in', '') for name, pin in g5500.input_ports.items()}
+        self.cal = g5500.rotator.cal_data
+        motion_file = motion_file_for(cal_file) if cal_file else None
+        model = MotionModel.from_file(motion_file) if motion_file and os.path.exists(motion_file) \
+            else MotionModel.from_string(DEFAULT_MOTION)
+        self.axes = {'az': SimAxis(model, 'az', self.cal.az.min_angle, self.cal.az.max_angle, az),
+                     'el': SimAxis(model, 'el', self.cal.el.min_angle, self.cal.el.max_angle, el)}
+        self.sim_t = time.monotonic()
+
+    def reset_counts(self):
+        self.calls.clear()
+
+    def _call(self, name : str):
+        '''Every ljm call is one round trip to the device.'''
+        self.calls[name] += 1
+        if self.latency_s > 0:
+            time.sleep(self.latency_s)
+
+    def _advance(self):
+        if self.axes is None:
+            return
+        t = time.monotonic()
+        for axis in self.axes.values():
+            axis.advance(t - self.sim_t)
+        self.sim_t = t
+
+    def _write(self, name : str, value : float):
+        self.outputs[name] = value
+        if self.axes is None or name not in self.pin_lines:
+            return
+        on = {line: self.outputs.get(pin, 0) == 1 for pin, line in self.pin_lines.items()}
+        self.axes['az'].command = on['az_right'] - on['az_left']
+        self.axes['el'].command = on['el_up'] - on['el_down']
+
+    def _read(self, name : str) -> float:
+        if name not in self.inputs or self.axes is None:
+            return 0.0
+        what = self.inputs[name]
+        if what == 'pwr_on':
+            return PWR_ON_V
+        axis_cal = self.cal.az if what == 'az' else self.cal.el
+        angle = self.axes[what].pos
+        v = axis_cal.min_voltage + (angle - axis_cal.min_angle) * (axis_cal.max_voltage - axis_cal.min_voltage) \
+            / (axis_cal.max_angle - axis_cal.min_angle)
+        v += self.rng.normal(0.0, NOISE_V)
+        return round(v / ADC_STEP_V) * ADC_STEP_V
+
+    # The ljm functions themselves
+    def openS(self, device_type : str, connection_type : str, identifier : str) -> int:
+        self._call('openS')
+        return 1
+
+    def close(self, handle : int):
+        self._call('close')
+
+    def eWriteName(self, handle : int, name : str, value : float):
+        self._call('eWriteName')
+        with self.lock:
+            self._advance()
+            self._write(name, value)
+
+    def eWriteNames(self, handle : int, num_frames : int, names : list, values : list):
+        self._call('eWriteNames')
+        with self.lock:
+            self._advance()
+            for name, value in zip(names[:num_frames], values):
+                self._write(name, value)
+
+    def eReadName(self, handle : int, name : str) -> float:
+        self._call('eReadName')
+        with self.lock:
+            self._advance()
+            return self._read(name)
+
+    def eReadNames(self, handle : int, num_frames : int, names : list) -> list:
+        self._call('eReadNames')
+        with self.lock:
+            self._advance()
+            return [self._read(name) for name in names[:num_frames]]
+
+    def eNames(self, handle : int, num_frames : int, names : list, writes : list, num_values : list, values : list) -> list:
+        self._call('eNames')
+        results = list(values)
+        with self.lock:
+            self._advance()
+            for ndx in range(num_frames):
+                if writes[ndx] == FakeLJM.constants.WRITE:
+                    self._write(names[ndx], values[ndx])
+                else:
+                    results[ndx] = self._read(names[ndx])
+        return results
+
+    def namesToAddresses(self, num_frames : int, names : list):
+        # Any numbers will do as long as they map back to the names
+        self._address_names = list(names[:num_frames])
+        return list(range(num_frames)), [3] * num_frames
+
+    def eStreamStart(self, handle : int, scans_per_read : int, num_addresses : int, addresses : list, scan_rate : float) -> float:
+        self._call('eStreamStart')
+        names = [self._address_names[a] for a in addresses[:num_addresses]]
+        self.stream = {'names': names, 'scans_per_read': scans_per_read, 'scan_rate': scan_rate,
+                       'next': time.monotonic() + scans_per_read / scan_rate}
+        return scan_rate
+
+    def eStreamRead(self, handle : int):
+        if self.stream is None:
+            raise LJMError('Stream is not running')
+        self.calls['eStreamRead'] += 1
+        time.sleep(max(0.0, self.stream['next'] - time.monotonic()))
+        if self.stream_fault is not None:
+            raise self.stream_fault
+        self.stream['next'] += self.stream['scans_per_read'] / self.stream['scan_rate']
+        data = []
+        with self.lock:
+            self._advance()
+            for _ in range(self.stream['scans_per_read']):
+                data += [self._read(name) for name in self.stream['names']]
+        return data, 0, 0
+
+    def eStreamStop(self, handle : int):
+        self._call('eStreamStop')
+        self.stream = None
+
+def install(latency_s : float = LATENCY_S['USB'], seed : int = None) -> FakeLJM:
+    '''Puts a FakeLJM where "from labjack import ljm" will find it and returns it.
+    Must be called before G5500_LabJackIF is imported (or reload it afterward).'''
+    fake = FakeLJM(latency_s, seed)
+    labjack = types.ModuleType('labjack')
+    labjack.ljm = fake
+    sys.modules['labjack'] = labjack
+    return fake
+
+
+# Unit tests - run with pytest
+import importlib
+import pytest
+
+@pytest.fixture
+def labjack(tmp_path):
+    '''A G5500_LabJack talking to a fake LJM, with the real modules put back after.'''
+    saved = sys.modules.get('labjack')
+    fake = install(latency_s=0.0, seed=1)
+    import G5500_LabJackIF
+    importlib.reload(G5500_LabJackIF)
+    cal_file = tmp_path / 'rotator_cal.txt'
+    cal_file.write_text('Az, 0, 0, 0.0, 450, 0, 4.0\nEl, 0, 0, 0.0, 180, 0, 4.0\n')
+    g5500 = G5500_LabJackIF.G5500_LabJack(str(cal_file))
+    fake.attach(g5500, str(cal_file), az=100.0, el=20.0)
+    yield g5500, fake
+    if saved is None:
+        del sys.modules['labjack']
+    else:
+        sys.modules['labjack'] = saved
+
+class TestFakeLJM:
+    def test_reads_position(self, labjack):
+        g5500, fake = labjack
+        az, el, pwr_on = g5500.read_sensors()
+        assert(pwr_on)
+        assert(abs(az - 100.0) < 1.0 and abs(el - 20.0) < 1.0)
+        assert(fake.calls['eReadNames'] == 1)
+
+    def test_relays_move_rotator(self, labjack):
+        g5500, fake = labjack
+        g5500.move_az_right()
+        time.sleep(0.3)
+        g5500.stop_motion()
+        assert(fake.axes['az'].pos > 100.5)
+        assert(fake.calls['eWriteNames'] == 2)
+
+    def test_stream(self, labjack):
+        g5500, fake = labjack
+        g5500.start_streaming(scan_rate=100)
+        try:
+            t, az, el, pwr_on = g5500.latest_sample()
+            assert(abs(az - 100.0) < 1.0 and pwr_on)
+        finally:
+            g5500.stop_streaming()
+
+    def test_stream_fails_before_first_block(self, labjack):
+        g5500, fake = labjack
+        fake.stream_fault = LJMError('LJME_NO_RESPONSE_BYTES_RECEIVED')
+        g5500.start_streaming(scan_rate=100)
+        try:
+            start = time.monotonic()
+            with pytest.raises(RuntimeError):
+                g5500.latest_sample()
+            assert(time.monotonic() - start < 1.0)
+        finally:
+            g5500.stop_streaming()
+
+    def test_move_to(self, labjack):
+        g5500, fake = labjack
+        g5500.move_to(104.0, 22.0)
+        assert(abs(fake.axes['az'].pos - 104.0) < 1.0)
+        assert(abs(fake.axes['el'].pos - 22.0) < 1.0)
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+'''One owner for the rotator hardware. Servers hand it commands instead of calling
+the G5500 object themselves, and a single thread runs them one at a time, so LJM or
+I2C transactions from different clients can never interleave.
+
+The queue has two priorities. stop() always goes first, and it also tells a running
+move to quit right away, so the relays open within one loop period even if the
+actor is busy with something else. Anything queued behind it that would move the
+rotator is thrown out with Preempted. Commands submitted with a key replace a
+queued command with the same key, so a burst of new targets only moves to the
+last one.
+
+It also keeps the latest position reading. One sampler thread reads the sensors
+through the queue at whatever rate set_sample_rate() asks for and hands each Sample
+to the listeners, and read() answers from that cache when it is recent enough. While
+a move is running the move loop is already reading the sensors, so the sampler uses
+its readings instead of adding its own.
+
+The one thing that doesn't go through the queue is the move loop that start_move()
+runs on its own thread, since it has to keep its timing while the actor is busy.
+It is kept apart by the G5500's io_lock instead. Every relay write and sensor read
+holds that, so nothing the actor runs can overlap a transaction of the move loop's.
+
+    actor = HardwareActor(g5500)
+    actor.call(g5500.read_sensors)                       # Waits for the answer
+    future = actor.submit(g5500.start_move, 200, 30, key='target', motion=True)
+    actor.stop()'''
+
+import heapq
+import itertools
+import threading
+import time
+import concurrent.futures
+import G5500
+from G5500 import LOOP_PERIOD_S
+
+STOP_PRIORITY = 0
+NORMAL_PRIORITY = 1
+MAX_SAMPLE_HZ = 20.0      # Fastest the sampler will read the sensors
+READ_MAX_AGE_S = 0.5      # read() does I/O only if the cached sample is older than this
+
+class Preempted(Exception):
+    '''A queued command that was dropped because of a STOP.'''
+    pass
+
+class Sample:
+    '''One position reading. t is wall-clock time (time.time()) to tell clients when it
+    was taken. mono is time.monotonic(), for judging how old it is.'''
+
+    def __init__(self, az : float, el : float, pwr_on : bool):
+        self.t = time.time()
+        self.mono = time.monotonic()
+        self.az, self.el, self.pwr_on = az, el, pwr_on
+
+    def age(self) -> float:
+        return time.monotonic() - self.mono
+
+    def __str__(self):
+        return f'{self.t:.3f} az={self.az:.2f} el={self.el:.2f} pwr={"On" if self.pwr_on else "Off"}'
+
+class Command:
+    def __init__(self, fn, args : tuple, priority : int, key, motion : bool):
+        self.fn, self.args = fn, args
+        self.priority = priority
+        self.key = key
+        self.motion = motion
+        self.futures = [concurrent.futures.Future()]
+        self.submitted = time.monotonic()
+
+    def finish(self, result=None, error : BaseException = None):
+        for future in self.futures:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+class HardwareActor:
+    '''Runs every command for one G5500 on one thread. See the module docstring.'''
+
+    def __init__(self, g5500 : G5500.G5500):
+        self.g5500 = g5500
+        self.queue = []          # Heap of (priority, sequence, Command)
+        self.pending = {}        # Key to queued Command, for coalescing
+        self.sequence = itertools.count()
+        self.cv = threading.Condition()
+        self.closed = False
+        # Statistics
+        self.executed = 0
+        self.coalesced = 0
+        self.preempted = 0
+        self.stop_count = 0        # Bumped by every stop(), so long-running jobs can notice
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.total_run_s = 0.0
+        self.max_run_s = 0.0
+        self.sensor_reads = 0      # Samples that took a sensor read
+        self.shared_reads = 0      # Samples taken from a running move's reads
+        self.cache_hits = 0        # read() calls answered without I/O
+        self.thread = threading.Thread(target=self._run, name='g5500-actor', daemon=True)
+        self.thread.start()
+
+        # Position sampling. See set_sample_rate().
+        self.sample = None
+        self.listeners = []
+        self.sample_period = None
+        self.sampler = None
+        self.sampler_wake = threading.Event()
+
+    def submit(self, fn, *args, priority : int = NORMAL_PRIORITY, key=None, motion : bool = False) -> concurrent.futures.Future:
+        '''Queues fn(*args) and returns a Future for its result. If a command with the
+        same key is still waiting, it runs this fn and args instead and both callers
+        get the same result. Commands with motion set are dropped by stop().'''
+        with self.cv:
+            if self.closed:
+                raise RuntimeError('Hardware actor is closed')
+            queued = self.pending.get(key) if key is not None else None
+            if queued is not None:
+                queued.fn, queued.args = fn, args
+                queued.motion = queued.motion or motion
+                queued.futures.append(concurrent.futures.Future())
+                self.coalesced += 1
+                return queued.futures[-1]
+            command = Command(fn, args, priority, key, motion)
+            if key is not None:
+                self.pending[key] = command
+            heapq.heappush(self.queue, (priority, next(self.sequence), command))
+            self.cv.notify()
+            return command.futures[0]
+
+    def call(self, fn, *args, **kwargs):
+        '''submit() and wait for the result.'''
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stop(self) -> concurrent.futures.Future:
+        '''Stops all motion ahead of anything else in the queue. A running move sees
+        the cancel on its next loop period without waiting for the actor.'''
+        self.g5500.move_cancel.set()
+        with self.cv:
+            self.stop_count += 1
+            dropped = [entry for entry in self.queue if entry[2].motion]
+            if dropped:
+                self.queue = [entry for entry in self.queue if not entry[2].motion]
+                heapq.heapify(self.queue)
+                for _, _, command in dropped:
+                    if command.key is not None:
+                        self.pending.pop(command.key, None)
+                    command.finish(error=Preempted('Stopped before it could run'))
+                self.preempted += len(dropped)
+        return self.submit(self._stop, priority=STOP_PRIORITY)
+
+    def _stop(self):
+        self.g5500.cancel_move()
+        self.g5500.stop_motion()
+
+    def close(self, timeout : float = None):
+        '''Stops the rotator, finishes what's queued and ends the thread.'''
+        self.stop()
+        with self.cv:
+            self.closed = True
+            self.cv.notify()
+        self.sampler_wake.set()
+        if self.sampler is not None:
+            self.sampler.join(timeout)
+        self.thread.join(timeout)
+
+    def sample_now(self) -> Sample:
+        '''Takes a new sample and caches it. Only call this on the actor thread, i.e.
+        through submit(). read() is the way in from anywhere else.'''
+        g5500 = self.g5500
+        state_t = g5500.state.t if g5500.moving else None
+        if state_t is not None and g5500.now() - state_t < (self.sample_period or LOOP_PERIOD_S):
+            sample = Sample(g5500.az, g5500.el, g5500.pwr_on)
+            self.shared_reads += 1
+        else:
+            sample = Sample(*g5500.read_sensors())
+            self.sensor_reads += 1
+        self.sample = sample
+        return sample
+
+    def fresh_sample(self, max_age_s : float = READ_MAX_AGE_S) -> Sample:
+        '''The cached sample if it is no older than max_age_s, otherwise None.'''
+        sample = self.sample
+        if sample is not None and sample.age() <= max_age_s:
+            self.cache_hits += 1
+            return sample
+        return None
+
+    def read(self, max_age_s : float = READ_MAX_AGE_S) -> Sample:
+        '''The rotator position, no older than max_age_s. Only reads the sensors if
+        the cache is too old.'''
+        sample = self.fresh_sample(max_age_s)
+        if sample is None:
+            sample = self.call(self.sample_now, key='sample')
+        return sample
+
+    def add_listener(self, fn):
+        '''fn(sample) gets called with every sample the sampler takes, on the sampler
+        thread, so it should be quick.'''
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        self.listeners.remove(fn)
+
+    def set_sample_rate(self, hz : float):
+        '''Runs the sampler at hz, capped at MAX_SAMPLE_HZ. 0 or None pauses it.'''
+        self.sample_period = 1.0 / min(hz, MAX_SAMPLE_HZ) if hz else None
+        if self.sample_period is not None and self.sampler is None:
+            self.sampler = threading.Thread(target=self._sample_loop, name='g5500-sampler', daemon=True)
+            self.sampler.start()
+        self.sampler_wake.set()
+
+    def _sample_loop(self):
+        '''Body of the sampler thread.'''
+        next_t = time.monotonic()
+        while not self.closed:
+            self.sampler_wake.clear()
+            period = self.sample_period
+            if period is None:
+                self.sampler_wake.wait()
+                next_t = time.monotonic()
+                continue
+            try:
+                sample = self.call(self.sample_now, key='sample')
+            except Exception as e:
+                print(f'Sampler could not read the rotator: {e}')
+            else:
+                for fn in list(self.listeners):
+                    fn(sample)
+            # Keep to the schedule, but don't try to catch up after falling behind
+            next_t = max(next_t + period, time.monotonic())
+            self.sampler_wake.wait(next_t - time.monotonic())
+
+    @property
+    def depth(self) -> int:
+        '''Commands waiting to run.'''
+        with self.cv:
+            return len(self.queue)
+
+    def stats(self) -> dict:
+        '''Queue depth, counts, and how long commands waited in the queue and took to
+        run, in milliseconds.'''
+        with self.cv:
+            n = max(self.executed, 1)
+            return {'depth': len(self.queue), 'executed': self.executed, 'coalesced': self.coalesced,
+                    'preempted': self.preempted,
+                    'mean_wait_ms': 1000 * self.total_wait_s / n, 'max_wait_ms': 1000 * self.max_wait_s,
+                    'mean_run_ms': 1000 * self.total_run_s / n, 'max_run_ms': 1000 * self.max_run_s,
+                    'sensor_reads': self.sensor_reads, 'shared_reads': self.shared_reads,
+                    'cache_hits': self.cache_hits}
+
+    def _run(self):
+        '''Body of the actor thread.'''
+        while True:
+            with self.cv:
+                while not self.queue and not self.closed:
+                    self.cv.wait()
+                if not self.queue:
+                    return
+                _, _, command = heapq.heappop(self.queue)
+                if command.key is not None:
+                    self.pending.pop(command.key, None)
+
+            started = time.monotonic()
+            try:
+                result = command.fn(*command.args)
+            except BaseException as e:
+                command.finish(error=e)
+            else:
+                command.finish(result)
+            finished = time.monotonic()
+
+            with self.cv:
+                self.executed += 1
+                wait_s, run_s = started - command.submitted, finished - started
+                self.total_wait_s += wait_s
+                self.max_wait_s = max(self.max_wait_s, wait_s)
+                self.total_run_s += run_s
+                self.max_run_s = max(self.max_run_s, run_s)
+
+
+# Unit tests - run with pytest
+import pytest
+
+CAL = '''Az, 0, 0, 0.0, 450, 0, 4.0
+         El, 0, 0, 0.0, 180, 0, 4.0'''
+
+@pytest.fixture
+def cal_file(tmp_path):
+    filename = tmp_path / 'rotator_cal.txt'
+    filename.write_text(CAL)
+    return str(filename)
+
+@pytest.fixture
+def actor(cal_file):
+    from G5500_SimIF import G5500_Sim
+    actor = HardwareActor(G5500_Sim(cal_file, virtual_clock=True, seed=1))
+    yield actor
+    actor.close(1.0)
+
+def block(actor : HardwareActor) -> threading.Event:
+    '''Keeps the actor busy until the returned event is set.'''
+    release = threading.Event()
+    started = threading.Event()
+    def wait():
+        started.set()
+        release.wait(5.0)
+    actor.submit(wait)
+    started.wait(5.0)
+    return release
+
+class TestHardwareActor:
+    def test_one_at_a_time(self, actor):
+        busy = []
+        def work():
+            assert(not busy)
+            busy.append(1)
+            time.sleep(0.001)
+            busy.pop()
+        threads = [threading.Thread(target=lambda: [actor.call(work) for _ in range(10)]) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(actor.stats()['executed'] == 50)
+
+    def test_stop_jumps_queue(self, actor):
+        order = []
+        release = block(actor)
+        read = actor.submit(lambda: order.append('read'))
+        move = actor.submit(lambda: order.append('move'), motion=True)
+        stopped = actor.stop()
+        stopped.add_done_callback(lambda f: order.append('stop'))
+        assert(actor.depth == 2)
+        release.set()
+        read.result(1.0)
+        with pytest.raises(Preempted):
+            move.result(1.0)
+        assert(order == ['stop', 'read'])
+        assert(actor.stats()['preempted'] == 1)
+
+    def test_targets_coalesce(self, actor):
+        targets = []
+        release = block(actor)
+        futures = [actor.submit(targets.append, az, key='target', motion=True) for az in (100, 110, 120)]
+        release.set()
+        for future in futures:
+            future.result(1.0)
+        assert(targets == [120])
+        assert(actor.stats()['coalesced'] == 2)
+
+    def test_stop_preempts_move(self, cal_file):
+        from G5500_SimIF import G5500_Sim
+        g5500 = G5500_Sim(cal_file, seed=2)    # Real time, so the move takes a while
+        actor = HardwareActor(g5500)
+        actor.call(g5500.start_move, 300, 60, motion=True)
+        assert(g5500.moving)
+        time.sleep(0.1)
+        start = time.monotonic()
+        actor.stop().result(1.0)
+        assert(time.monotonic() - start < 0.1)
+        assert(not g5500.moving)
+        assert(all(value == G5500.G5500.STOP for value in g5500.outputs.state.values()))
+        actor.close(1.0)
+
+    def test_errors_reach_caller(self, actor):
+        with pytest.raises(ValueError):
+            actor.call(actor.g5500.start_move, 1000, 0)
+        stats = actor.stats()
+        assert(stats['executed'] == 1 and stats['depth'] == 0)
+        assert(stats['max_wait_ms'] >= 0 and stats['max_run_ms'] >= 0)
+
+    def test_read_uses_cache(self, actor):
+        first = actor.read()
+        assert(actor.read() is first)
+        assert(actor.stats()['sensor_reads'] == 1 and actor.stats()['cache_hits'] == 1)
+        assert(actor.read(max_age_s=0.0) is not first)
+        assert(actor.stats()['sensor_reads'] == 2)
+
+    def test_sampler_feeds_listeners(self, actor):
+        samples = []
+        actor.add_listener(samples.append)
+        actor.set_sample_rate(10.0)
+        time.sleep(0.55)
+        actor.set_sample_rate(0)
+        time.sleep(0.05)
+        count = len(samples)
+        assert(5 <= count <= 7)
+        assert(all(b.t > a.t for a, b in zip(samples, samples[1:])))
+        time.sleep(0.2)
+        assert(len(samples) == count)
+        assert(actor.fresh_sample(1.0) is samples[-1])
+
+    def test_sampler_shares_move_reads(self, cal_file):
+        from G5500_SimIF import G5500_Sim
+        g5500 = G5500_Sim(cal_file, seed=3)
+        actor = HardwareActor(g5500)
+        actor.call(g5500.start_move, 300, 60, motion=True)
+        actor.set_sample_rate(10.0)
+        time.sleep(0.5)
+        stats = actor.stats()
+        assert(stats['shared_reads'] >= 3)
+        assert(stats['sensor_reads'] <= 1)
+        actor.close(1.0)
+
+    def test_reads_never_overlap_move_io(self, cal_file):
+        from G5500_SimIF import G5500_Sim
+        g5500 = G5500_Sim(cal_file, speedup=20.0, seed=4)
+        inside, overlaps = [], []
+        def exclusive(fn):
+            def wrapper(*args):
+                if inside:
+                    overlaps.append(fn.__name__)
+                inside.append(1)
+                time.sleep(0.0005)    # Long enough for another thread to get in
+                try:
+                    return fn(*args)
+                finally:
+                    inside.pop()
+            return wrapper
+        g5500._read_sensors = exclusive(g5500._read_sensors)
+        g5500._write_outputs = exclusive(g5500._write_outputs)
+        actor = HardwareActor(g5500)
+        actor.call(g5500.start_move, 300, 60, motion=True)
+        # Reads from the actor while the move loop does its own
+        for _ in range(100):
+            actor.call(lambda: g5500.read_sensors())
+        actor.stop().result(1.0)
+        assert(g5500.state.t is not None and not overlaps)
+        actor.close(1.0)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+'''Measured motion model for the rotator: how fast each axis gets going, how fast it
+goes once it is going, and how far it keeps going after the relay opens, separately
+for each direction. The Yaesu spec sheet gives one speed for each axis, but the real
+numbers change with direction, antenna load and how cold it is outside.
+
+characterize() measures the numbers by making timed moves through any G5500 backend
+and the results are stored in rotator_motion.txt next to rotator_cal.txt. The file
+looks like the cal file:
+
+    # Axis, Direction, Accel, Rate, Coast, CoastTime
+    Az, +, 20.0, 6.02, 0.90, 0.150
+
+Accel is in deg/s^2, Rate in deg/s, Coast in degrees and CoastTime in seconds (the
+coast divided by the speed when the relay opened).'''
+
+import datetime
+import os
+from io import StringIO
+import numpy as np
+
+MOTION_FILE = 'rotator_motion.txt'
+RUN_DISTANCE_DEG = 30.0   # How far each timed run goes
+SAMPLE_PERIOD_S = 0.02
+EDGE_MARGIN_DEG = 5.0     # Stay this far from the ends of travel
+STILL_DEG_S = 0.2         # Slower than this counts as stopped
+MAX_RUN_S = 120.0
+
+class AxisMotionData:
+    '''Motion model for one axis in one direction.'''
+
+    def __init__(self, line : str):
+        # Axis, Direction, Accel, Rate, Coast, CoastTime
+        fields = [f.strip() for f in line.split(',')]
+        if len(fields) != 6:
+            raise ValueError(f'Wrong number of fields. Should be 6\n{line}')
+        if fields[1] not in ('+', '-'):
+            raise ValueError(f'Direction must be + or -\n{line}')
+        self.axis = fields[0]
+        self.direction = 1 if fields[1] == '+' else -1
+        self.accel = float(fields[2])
+        self.rate = float(fields[3])
+        self.coast = float(fields[4])
+        self.coast_s = float(fields[5])
+        assert(self.accel > 0)
+        assert(self.rate > 0)
+        assert(self.coast >= 0)
+
+    @classmethod
+    def from_values(cls, axis : str, direction : int, accel : float, rate : float, coast : float, coast_s : float):
+        return cls(f'{axis}, {"+" if direction > 0 else "-"}, {accel}, {rate}, {coast}, {coast_s}')
+
+    def time_to_move(self, distance : float) -> float:
+        '''Seconds to move distance degrees from a standstill and stop there, using
+        the constant-acceleration approximation.'''
+        ramp = self.rate / self.accel
+        if distance <= self.rate * ramp:
+            # Never gets up to full speed
+            return 2 * np.sqrt(distance / self.accel)
+        return ramp + distance / self.rate
+
+    def __str__(self):
+        sign = '+' if self.direction > 0 else '-'
+        return f'{self.axis}, {sign}, {self.accel:.2f}, {self.rate:.3f}, {self.coast:.3f}, {self.coast_s:.3f}'
+
+class MotionModel:
+    '''Motion data for both directions of both axes. Like CalibrationData, use
+    from_file() or from_string() rather than the constructor.'''
+
+    def __init__(self, readable):
+        self.data = {}
+        linenum = 0
+        for line in readable:
+            linenum += 1
+            line = line.strip()
+            if line.startswith('#') or line == '':
+                continue
+            elif line.startswith('Az') or line.startswith('El'):
+                d = AxisMotionData(line)
+                self.data[(d.axis, d.direction)] = d
+            else:
+                raise ValueError(f'Unrecognized contents in motion file on line {linenum}\n{line}')
+        for key in (('Az', 1), ('Az', -1), ('El', 1), ('El', -1)):
+            if key not in self.data:
+                raise ValueError(f'Motion file is missing {key[0]} {"+" if key[1] > 0 else "-"}')
+
+    @classmethod
+    def from_file(cls, filename : str):
+        with open(filename) as f:
+            return cls(f)
+
+    @classmethod
+    def from_string(cls, raw_string : str):
+        return cls(StringIO(raw_string))
+
+    @classmethod
+    def from_runs(cls, runs : list[AxisMotionData]):
+        return cls.from_string('\n'.join(str(run) for run in runs))
+
+    def get(self, axis : str, direction : int) -> AxisMotionData:
+        '''axis is 'Az' or 'El' (any case), direction is +1 or -1.'''
+        return self.data[(axis.capitalize(), 1 if direction > 0 else -1)]
+
+    def slowest_rate(self, axis : str) -> float:
+        '''The rate a planner can count on in either direction.'''
+        return min(self.get(axis, 1).rate, self.get(axis, -1).rate)
+
+    def save(self, filename : str):
+        with open(filename, 'w') as f:
+            f.write(f'# Motion model for the Yaesu G-5500, measured by motion_model.characterize()\n')
+            f.write(f'# Captured {datetime.date.today()}\n')
+            f.write('# Axis, Direction, Accel (deg/s^2), Rate (deg/s), Coast (deg), CoastTime (s)\n')
+            f.write(str(self) + '\n')
+
+    def __str__(self):
+        return '\n'.join(str(self.get(axis, d)) for axis in ('Az', 'El') for d in (1, -1))
+
+def motion_file_for(cal_file : str) -> str:
+    '''Where the motion model lives for a given cal file.'''
+    return os.path.join(os.path.dirname(cal_file), MOTION_FILE)
+
+def fit_run(axis : str, direction : int, t, pos, t_on : float, t_off : float) -> AxisMotionData:
+    '''Fits the motion model to one timed run. t and pos are the samples, the relay
+    was closed at t_on and opened at t_off.
+
+    The rate is the slope of a straight line through the middle of the driven part.
+    Where that line crosses the starting position says how much time was lost
+    getting up to speed, and with constant acceleration that is rate / (2 accel).
+    The coast is how far it went after t_off.'''
+    t = np.asarray(t, dtype=float)
+    pos = direction * (np.asarray(pos, dtype=float) - pos[0])   # Distance travelled, always increasing
+    driven = (t >= t_on) & (t <= t_off)
+    t_drive, p_drive = t[driven], pos[driven]
+    middle = (t_drive >= t_on + (t_off - t_on) * 0.4) & (t_drive <= t_off - (t_off - t_on) * 0.1)
+    if middle.sum() < 3:
+        raise ValueError(f'Not enough samples to fit {axis} {direction:+d}')
+    rate, intercept = np.polyfit(t_drive[middle], p_drive[middle], 1)
+    if rate <= 0:
+        raise ValueError(f'{axis} did not move in the {direction:+d} direction')
+    lost_s = max((-intercept / rate) - t_on, 1e-3)
+    accel = rate / (2 * lost_s)
+
+    # Position and speed at release come from the fitted line, which is steadier
+    # than the one sample nearest to t_off
+    released_at = rate * t_off + intercept
+    coast = max(pos[-1] - released_at, 0.0)
+    return AxisMotionData.from_values(axis.capitalize(), direction, accel, rate, coast, coast / rate)
+
+def _timed_run(g5500, axis : str, direction : int, distance : float):
+    '''Drives one axis for distance degrees, then lets it coast to a stop, sampling
+    all the way. Returns (t, pos, t_on, t_off).'''
+    ndx = 0 if axis == 'az' else 1
+    start_motion = {('az', 1): g5500.move_az_right, ('az', -1): g5500.move_az_left,
+                    ('el', 1): g5500.move_el_up, ('el', -1): g5500.move_el_down}[(axis, direction)]
+    stop = g5500.stop_az_motion if axis == 'az' else g5500.stop_el_motion
+
+    t, pos = [g5500.now()], [g5500.read_sensors()[ndx]]
+    t_on = g5500.now()
+    t_off = None
+    start_motion()
+    try:
+        while t[-1] - t_on < MAX_RUN_S:
+            g5500.sleep(SAMPLE_PERIOD_S)
+            t.append(g5500.now())
+            pos.append(g5500.read_sensors()[ndx])
+            if t_off is None:
+                if direction * (pos[-1] - pos[0]) >= distance:
+                    stop()
+                    t_off = t[-1]
+            elif abs(pos[-1] - pos[-2]) / SAMPLE_PERIOD_S < STILL_DEG_S and t[-1] - t_off > 0.5:
+                break
+    finally:
+        g5500.stop_motion()
+    if t_off is None:
+        raise RuntimeError(f'{axis} did not move {distance} degrees in {MAX_RUN_S} s')
+    return t, pos, t_on, t_off
+
+def characterize(g5500, distance : float = RUN_DISTANCE_DEG, filename : str = None) -> MotionModel:
+    '''Measures the motion model with timed runs of each axis in each direction, and
+    saves it to filename if given. Moves the rotator over a good part of its range.'''
+    cal = g5500.rotator.cal_data
+    runs = []
+    for axis, axis_cal in (('az', cal.az), ('el', cal.el)):
+        low = axis_cal.min_angle + EDGE_MARGIN_DEG
+        assert(low + distance + EDGE_MARGIN_DEG + 5 <= axis_cal.max_angle), 'Run distance is too long for this axis'
+        # Park the other axis where it is and start from near the low end
+        g5500.read_sensors()
+        if axis == 'az':
+            g5500.move_to(low, g5500.el)
+        else:
+            g5500.move_to(g5500.az, low)
+        for direction in (1, -1):
+            print(f'Timing {axis} {direction:+d}')
+            t, pos, t_on, t_off = _timed_run(g5500, axis, direction, distance)
+            run = fit_run(axis, direction, t, pos, t_on, t_off)
+            print(run)
+            runs.append(run)
+    model = MotionModel.from_runs(runs)
+    if filename is not None:
+        model.save(filename)
+        print(f'Saved motion model to {filename}')
+    return model
+
+
+# Unit tests - run with pytest
+from math import isclose
+import pytest
+
+TEST_MODEL = '''# Test motion model
+    # Axis, Direction, Accel, Rate, Coast, CoastTime
+    Az, +, 20.0, 6.2, 0.93, 0.15
+    Az, -, 20.0, 5.8, 0.87, 0.15
+    El, +, 15.0, 2.7, 0.27, 0.10
+    El, -, 15.0, 3.1, 0.31, 0.10
+    '''
+
+class TestMotionModel:
+    def test_round_trip(self, tmp_path):
+        model = MotionModel.from_string(TEST_MODEL)
+        assert(model.get('az', -1).rate == 5.8)
+        assert(model.slowest_rate('El') == 2.7)
+        filename = str(tmp_path / MOTION_FILE)
+        model.save(filename)
+        again = MotionModel.from_file(filename)
+        assert(str(again) == str(model))
+
+    def test_missing_direction(self):
+        with pytest.raises(ValueError):
+            MotionModel.from_string('Az, +, 20.0, 6.2, 0.93, 0.15')
+
+    def test_time_to_move(self):
+        d = MotionModel.from_string(TEST_MODEL).get('az', 1)
+        assert(isclose(d.time_to_move(62.0), 6.2 / 20.0 + 10.0))
+        assert(d.time_to_move(0.1) < 0.1 / 6.2 + 6.2 / 20.0)
+
+    def test_characterize(self, tmp_path):
+        from G5500 import CoastingRotator
+        g5500 = CoastingRotator(tmp_path)
+        filename = str(tmp_path / MOTION_FILE)
+        model = characterize(g5500, filename=filename)
+        # A first-order lag with time constant tau loses tau seconds getting going,
+        # which a constant acceleration does with rate / (2 tau), and coasts rate * tau
+        for axis, rate in (('az', 6.0), ('el', 3.0)):
+            for d in (1, -1):
+                run = model.get(axis, d)
+                assert(isclose(run.rate, rate, rel_tol=0.02))
+                assert(isclose(run.accel, rate / 0.3, rel_tol=0.1))
+                assert(isclose(run.coast_s, 0.15, rel_tol=0.1))
+        assert(str(MotionModel.from_file(filename)) == str(model))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+'''Smoothed position and velocity for the rotator. The position sensors on the G-5500
+are just potentiometers read through an ADC, so each reading is good to maybe half
+a degree. A small Kalman filter per axis turns the readings into a position, a
+velocity and how sure we are of each, and can say where the axis will be a moment
+from now.
+
+There are two ways in:
+    RotatorState.update() takes one reading at a time, for live use. Each update is
+        a handful of float operations.
+    filter_batch() runs a whole recording at once with NumPy, for replaying telemetry
+        or fitting models. It uses the steady-state version of the same filter (an
+        alpha-beta filter), which is what the live filter settles into anyway.'''
+
+from math import isclose, sqrt
+import numpy as np
+
+MEAS_SIGMA_DEG = 0.25     # Sensor noise, one sigma
+ACCEL_SIGMA_DEG_S2 = 10.0 # How hard the motors can change the speed. They start and stop in a fraction of a second.
+
+class AxisFilter:
+    '''Constant-velocity Kalman filter for one axis. The state is (position, velocity)
+    with a 2x2 covariance, all kept as plain floats.'''
+
+    def __init__(self, meas_sigma : float = MEAS_SIGMA_DEG, accel_sigma : float = ACCEL_SIGMA_DEG_S2):
+        self.r = meas_sigma ** 2
+        self.q = accel_sigma ** 2
+        self.t = None
+        self.pos = self.vel = 0.0
+        self.p11 = self.p12 = self.p22 = 0.0
+
+    def update(self, t : float, z : float):
+        '''Adds a reading z taken at time t (seconds).'''
+        if self.t is None:
+            # First reading. We know where it is about as well as the sensor does, and
+            # nothing about the velocity except that it is slower than the motors go.
+            self.t, self.pos, self.vel = t, z, 0.0
+            self.p11, self.p12, self.p22 = self.r, 0.0, 10.0 ** 2
+            return
+        dt = t - self.t
+        if dt < 0:
+            raise ValueError('Readings must be in time order')
+        self.t = t
+
+        # Predict, with white-noise acceleration as the process noise
+        pos = self.pos + self.vel * dt
+        dt2 = dt * dt
+        p11 = self.p11 + dt * (2 * self.p12 + dt * self.p22) + self.q * dt2 * dt2 / 4
+        p12 = self.p12 + dt * self.p22 + self.q * dt2 * dt / 2
+        p22 = self.p22 + self.q * dt2
+
+        # Correct
+        s = p11 + self.r
+        k1, k2 = p11 / s, p12 / s
+        residual = z - pos
+        self.pos = pos + k1 * residual
+        self.vel = self.vel + k2 * residual
+        self.p11 = (1 - k1) * p11
+        self.p12 = (1 - k1) * p12
+        self.p22 = p22 - k2 * p12
+
+    def predict(self, t : float) -> tuple[float, float]:
+        '''Position and its sigma at time t, which is usually a little in the future.'''
+        dt = t - self.t
+        p11 = self.p11 + dt * (2 * self.p12 + dt * self.p22) + self.q * dt ** 4 / 4
+        return self.pos + self.vel * dt, sqrt(max(p11, 0.0))
+
+    @property
+    def pos_sigma(self) -> float:
+        return sqrt(self.p11)
+
+    @property
+    def vel_sigma(self) -> float:
+        return sqrt(self.p22)
+
+class RotatorState:
+    '''Filtered state of both axes.'''
+
+    def __init__(self, meas_sigma : float = MEAS_SIGMA_DEG, accel_sigma : float = ACCEL_SIGMA_DEG_S2):
+        self.az = AxisFilter(meas_sigma, accel_sigma)
+        self.el = AxisFilter(meas_sigma, accel_sigma)
+
+    def update(self, t : float, az : float, el : float):
+        '''Adds one reading of both axes.'''
+        self.az.update(t, az)
+        self.el.update(t, el)
+
+    @property
+    def t(self) -> float:
+        return self.az.t
+
+    def predict(self, t : float) -> tuple[float, float]:
+        '''Where the rotator will be at time t, as (az, el).'''
+        return self.az.predict(t)[0], self.el.predict(t)[0]
+
+    def __str__(self):
+        D = u'\N{DEGREE SIGN}'
+        return (f'Az {self.az.pos:7.2f}{D} ±{self.az.pos_sigma:.2f} {self.az.vel:+6.2f}{D}/s  '
+                f'El {self.el.pos:7.2f}{D} ±{self.el.pos_sigma:.2f} {self.el.vel:+6.2f}{D}/s')
+
+def alpha_beta_gains(dt : float, meas_sigma : float = MEAS_SIGMA_DEG,
+                     accel_sigma : float = ACCEL_SIGMA_DEG_S2) -> tuple[float, float]:
+    '''Steady-state gains of the filter above for readings every dt seconds, from
+    Kalata's tracking index.'''
+    lam = accel_sigma * dt * dt / meas_sigma
+    r = (4 + lam - sqrt(8 * lam + lam * lam)) / 4
+    alpha = 1 - r * r
+    beta = 2 * (2 - alpha) - 4 * sqrt(1 - alpha)
+    return alpha, beta
+
+def filter_batch(t, z, meas_sigma : float = MEAS_SIGMA_DEG, accel_sigma : float = ACCEL_SIGMA_DEG_S2):
+    '''Filters a whole recording of one axis. t and z are arrays of times and readings.
+    Returns (pos, vel, pos_sigma, vel_sigma) arrays.
+
+    Each step of an alpha-beta filter is an affine map of the previous state,
+    x_k = A_k x_k-1 + b_k, so every state is a prefix of a chain of those maps. The
+    maps compose associatively, which lets a prefix scan work out all of them in
+    log2(N) rounds of batched 2x2 products instead of N Python-level steps.'''
+    t = np.asarray(t, dtype=float)
+    z = np.asarray(z, dtype=float)
+    n = len(t)
+    assert(n == len(z))
+    if n == 0:
+        empty = np.zeros(0)
+        return empty, empty, empty, empty
+    dt = np.diff(t)
+    if np.any(dt <= 0):
+        raise ValueError('Times must be increasing')
+    nominal_dt = float(np.median(dt)) if n > 1 else 1.0
+    alpha, beta = alpha_beta_gains(nominal_dt, meas_sigma, accel_sigma)
+
+    # Step k takes x_k-1 to x_k:
+    #   predicted = [p + v dt, v], residual = z - (p + v dt)
+    #   p' = predicted p + alpha residual, v' = v + beta / dt residual
+    g = beta / dt
+    A = np.empty((n - 1, 2, 2))
+    A[:, 0, 0] = 1 - alpha
+    A[:, 0, 1] = (1 - alpha) * dt
+    A[:, 1, 0] = -g
+    A[:, 1, 1] = 1 - g * dt
+    b = np.stack([alpha * z[1:], g * z[1:]], axis=-1)
+
+    # Inclusive prefix scan: afterwards (A[k], b[k]) takes x_0 straight to x_k+1
+    shift = 1
+    while shift < n - 1:
+        later_A, later_b = A[shift:], b[shift:]
+        b = np.concatenate([b[:shift], np.einsum('kij,kj->ki', later_A, b[:-shift]) + later_b])
+        A = np.concatenate([A[:shift], later_A @ A[:-shift]])
+        shift *= 2
+
+    x0 = np.array([z[0], 0.0])
+    states = np.concatenate([x0[None, :], np.einsum('kij,j->ki', A, x0) + b])
+
+    # Steady-state sigmas, also from Kalata
+    r = meas_sigma ** 2
+    pos_sigma = np.full(n, sqrt(alpha * r))
+    vel_sigma = np.full(n, sqrt(max(beta * (alpha - beta / 2) / (1 - alpha), 0.0) * r) / nominal_dt)
+    return states[:, 0], states[:, 1], pos_sigma, vel_sigma
+
+
+# Unit tests - run with pytest
+def _ramp(n=500, dt=0.05, rate=6.0, sigma=0.25, seed=1):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) * dt
+    truth = 10.0 + rate * t
+    return t, truth, truth + rng.normal(0.0, sigma, n)
+
+class TestAxisFilter:
+    def test_tracks_constant_rate(self):
+        t, truth, z = _ramp()
+        f = AxisFilter()
+        for tk, zk in zip(t, z):
+            f.update(tk, zk)
+        assert(abs(f.vel - 6.0) < 0.5)
+        assert(abs(f.pos - truth[-1]) < 3 * f.pos_sigma)
+        assert(f.pos_sigma < MEAS_SIGMA_DEG)
+        pos, sigma = f.predict(t[-1] + 1.0)
+        assert(abs(pos - (truth[-1] + 6.0)) < 1.0)
+        assert(sigma > f.pos_sigma)
+
+    def test_smoother_than_raw(self):
+        t, truth, z = _ramp(rate=0.0)
+        f = AxisFilter()
+        filtered = []
+        for tk, zk in zip(t, z):
+            f.update(tk, zk)
+            filtered.append(f.pos)
+        settled = slice(50, None)
+        assert(np.std(np.array(filtered)[settled] - truth[settled]) < 0.6 * np.std(z[settled] - truth[settled]))
+
+class TestFilterBatch:
+    def test_matches_step_by_step(self):
+        t, truth, z = _ramp(n=300)
+        t[150:] += 0.013   # One uneven gap
+        pos, vel, pos_sigma, vel_sigma = filter_batch(t, z)
+
+        # Same alpha-beta filter one step at a time
+        alpha, beta = alpha_beta_gains(float(np.median(np.diff(t))))
+        p, v = z[0], 0.0
+        for k in range(1, len(t)):
+            dt = t[k] - t[k - 1]
+            residual = z[k] - (p + v * dt)
+            p, v = p + v * dt + alpha * residual, v + beta / dt * residual
+            assert(isclose(pos[k], p, abs_tol=1e-9))
+            assert(isclose(vel[k], v, abs_tol=1e-9))
+        assert(abs(vel[-1] - 6.0) < 0.5)
+
+    def test_live_filter_settles_to_batch(self):
+        t, truth, z = _ramp()
+        f = AxisFilter()
+        for tk, zk in zip(t, z):
+            f.update(tk, zk)
+        pos, vel, pos_sigma, vel_sigma = filter_batch(t, z)
+        assert(isclose(f.pos_sigma, pos_sigma[-1], rel_tol=0.05))
+        assert(isclose(f.pos, pos[-1], abs_tol=0.05))
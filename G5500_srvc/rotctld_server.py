@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+'''Hamlib rotctld compatible front end for the G5500 service, so tracking programs
+like Gpredict, or anything that uses hamlib's network rotator (model 2), can drive
+the rotator directly. It runs in the same event loop as the asyncio command server
+and goes through the same RotatorServer, so it shares its HardwareActor, cached
+samples and track handling. A P from here ends a MOVETO or TRACK from there and a
+STOP from either side stops everything.
+
+Commands, one per line, in the short or long form:
+    p, \\get_pos          Answers "az" and "el" lines from the cached sample. While
+                         any rotctld client is connected the sampler keeps that
+                         sample fresh, so polls are answered without waiting on
+                         the hardware.
+    P, \\set_pos az el    Starts heading to az/el and answers right away. A move
+                         that is already running just takes the new target.
+    S, \\stop             Stops the rotator.
+    _, \\get_info         Which interface the service is running.
+    \\dump_state          Protocol version, model and the rotator's limits.
+    q, Q                 Closes the connection.
+
+Commands that change something answer "RPRT 0", or "RPRT -n" with hamlib's error
+number. Start a command with + for hamlib's extended responses, which label each
+value.'''
+
+import asyncio
+import socket
+from async_server import RotatorServer, Client, read_command, MAX_LINE
+
+HOST = '127.0.0.1'
+PORT = 4533               # rotctld's usual port
+MAX_CLIENTS = 256
+POLL_SAMPLE_HZ = 10.0     # Sampler rate while anyone is connected
+POLL_MAX_AGE_S = 0.5      # Older than this and p reads the sensors itself
+PROTOCOL_VERSION = 1
+ROT_MODEL = 1             # What hamlib calls its dummy rotator
+
+RIG_OK = 0                # hamlib error numbers
+RIG_EINVAL = -1
+RIG_ENIMPL = -4
+RIG_EPROTO = -8
+
+COMMANDS = {'p': 'get_pos', 'P': 'set_pos', 'S': 'stop', '_': 'get_info', 'q': 'quit', 'Q': 'quit',
+            '\\get_pos': 'get_pos', '\\set_pos': 'set_pos', '\\stop': 'stop', '\\get_info': 'get_info',
+            '\\dump_state': 'dump_state', '\\quit': 'quit'}
+
+class RotctldServer:
+    '''Speaks rotctld on top of a RotatorServer. Start that one first, then this one
+    in the same event loop.'''
+
+    def __init__(self, rotator_server : RotatorServer, host : str = HOST, port : int = PORT,
+                 max_clients : int = MAX_CLIENTS, max_age_s : float = POLL_MAX_AGE_S):
+        self.rotator_server = rotator_server
+        self.g5500 = rotator_server.g5500
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.max_age_s = max_age_s
+        self.clients = set()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, limit=MAX_LINE)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f'rotctld listening on {self.host}:{self.port}')
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for client in list(self.clients):
+            client.writer.close()
+        self.clients.clear()
+        self.rotator_server.set_poll_rate(0)
+
+    async def _handle_client(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        client = Client(reader, writer)
+        if len(self.clients) >= self.max_clients:
+            print(f'Turned away rotctld client {client.addr}. Already have {len(self.clients)}.')
+            writer.close()
+            return
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients.add(client)
+        self.rotator_server.set_poll_rate(POLL_SAMPLE_HZ)
+        print(f'rotctld connected by {client.addr}')
+        try:
+            while True:
+                line = await read_command(reader)
+                if line is None:
+                    await client.send(f'RPRT {RIG_EPROTO}')
+                    continue
+                if not line:
+                    break
+                response, keep_going = await self.execute(line.decode('utf-8', errors='replace'))
+                if not keep_going:
+                    break
+                if response:
+                    await client.send(response)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            # Unlike the command server, hanging up leaves the rotator alone. Pollers
+            # come and go all the time.
+            self.clients.discard(client)
+            if not self.clients:
+                self.rotator_server.set_poll_rate(0)
+            writer.close()
+            print(f'rotctld client {client.addr} disconnected.')
+
+    async def execute(self, line : str) -> tuple[str, bool]:
+        '''Runs one command line. Returns (response, keep_going).'''
+        line = line.strip()
+        extended = line.startswith('+')
+        args = line.lstrip('+').split()
+        if not args:
+            return '', True
+        name = COMMANDS.get(args[0])
+        if name == 'quit':
+            return '', False
+        if name is None:
+            values, code = [], RIG_ENIMPL
+        else:
+            try:
+                values, code = await getattr(self, '_' + name)(args[1:])
+            except (ValueError, RuntimeError):
+                values, code = [], RIG_EINVAL
+
+        if extended:
+            lines = [f'{name or args[0]}:' + ''.join(f' {arg}' for arg in args[1:])]
+            lines += [f'{label}: {value}' for label, value in values]
+            lines.append(f'RPRT {code}')
+        else:
+            lines = [str(value) for _, value in values]
+            # Like rotctld, a command with something to say doesn't also report success
+            if code != RIG_OK or not values:
+                lines.append(f'RPRT {code}')
+        return '\n'.join(lines), True
+
+    async def _get_pos(self, args : list[str]):
+        sample = await self.rotator_server.position(self.max_age_s)
+        return [('Azimuth', f'{sample.az:.6f}'), ('Elevation', f'{sample.el:.6f}')], RIG_OK
+
+    async def _set_pos(self, args : list[str]):
+        if len(args) != 2:
+            return [], RIG_EINVAL
+        await self.rotator_server.retarget(float(args[0]), float(args[1]))
+        return [], RIG_OK
+
+    async def _stop(self, args : list[str]):
+        await self.rotator_server.stop()
+        return [], RIG_OK
+
+    async def _get_info(self, args : list[str]):
+        return [('Info', f'Yaesu G-5500 via {type(self.g5500).__name__}')], RIG_OK
+
+    async def _dump_state(self, args : list[str]):
+        cal = self.g5500.rotator.cal_data
+        return [('rotctld Protocol Ver', PROTOCOL_VERSION), ('Rotor Model', ROT_MODEL),
+                ('Minimum Azimuth', f'{cal.az.min_angle:.6f}'), ('Maximum Azimuth', f'{cal.az.max_angle:.6f}'),
+                ('Minimum Elevation', f'{cal.el.min_angle:.6f}'), ('Maximum Elevation', f'{cal.el.max_angle:.6f}')], RIG_OK
+
+
+# Unit tests - run with pytest
+import time
+import pytest
+from async_server import sim, connect
+
+def run_with_servers(g5500, test):
+    '''Runs the coroutine test(server, rotctld) against both servers on free ports.'''
+    async def main():
+        server = RotatorServer(g5500, port=0)
+        await server.start()
+        rotctld = RotctldServer(server, port=0)
+        await rotctld.start()
+        try:
+            await asyncio.wait_for(test(server, rotctld), 10.0)
+        finally:
+            await rotctld.close()
+            await server.close()
+    asyncio.run(main())
+
+async def rotctl(rotctld):
+    return await asyncio.open_connection(HOST, rotctld.port)
+
+class TestRotctldServer:
+    def test_commands(self, sim):
+        async def test(server, rotctld):
+            reader, writer = await rotctl(rotctld)
+            writer.write(b'p\n\\get_info\n\\dump_state\nBOGUS\n+\\get_pos\nP 500 10\nP x\n')
+            az, el = float(await reader.readline()), float(await reader.readline())
+            assert(abs(az - sim.az) < 1.0 and abs(el - sim.el) < 1.0)
+            assert(await reader.readline() == b'Yaesu G-5500 via G5500_Sim\n')
+            state = [await reader.readline() for _ in range(6)]
+            assert(state[:2] == [b'1\n', b'1\n'] and float(state[3]) == 450.0)
+            assert(await reader.readline() == b'RPRT -4\n')
+            assert(await reader.readline() == b'get_pos:\n')
+            assert((await reader.readline()).startswith(b'Azimuth: '))
+            assert((await reader.readline()).startswith(b'Elevation: '))
+            assert(await reader.readline() == b'RPRT 0\n')
+            assert(await reader.readline() == b'RPRT -1\n')     # Past the end of azimuth
+            assert(await reader.readline() == b'RPRT -1\n')
+            writer.write(b'p' * 2000 + b' S\n')
+            assert(await reader.readline() == b'RPRT -8\n')
+            writer.write(b'q\n')
+            assert(await reader.readline() == b'')
+        run_with_servers(sim, test)
+
+    def test_set_pos_retargets(self, sim):
+        async def test(server, rotctld):
+            reader, writer = await rotctl(rotctld)
+            # A MOVETO from the command server gets superseded by P
+            cmd_reader, cmd_writer = await connect(server)
+            cmd_writer.write(b'MOVETO 300 60\n')
+            assert((await cmd_reader.readline()).startswith(b'MOVETO 300.0,60.0 started'))
+            writer.write(b'P 100 20\n')
+            assert(await reader.readline() == b'RPRT 0\n')
+            assert((await cmd_reader.readline()).startswith(b'ABORTED MOVETO 300.0,60.0 superseded'))
+            writer.write(b'P 120.5 25\n')
+            assert(await reader.readline() == b'RPRT 0\n')
+            assert(sim.move_target == (120.5, 25.0))
+            while sim.moving:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(2 / POLL_SAMPLE_HZ)     # For the sampler to catch up
+            writer.write(b'S\np\n')
+            assert(await reader.readline() == b'RPRT 0\n')
+            az, el = float(await reader.readline()), float(await reader.readline())
+            assert(abs(az - 120.5) < 2.0 and abs(el - 25.0) < 2.0)
+            cmd_writer.close()
+            writer.close()
+        run_with_servers(sim, test)
+
+    def test_many_pollers(self, sim):
+        async def test(server, rotctld):
+            pollers = [await rotctl(rotctld) for _ in range(50)]
+            await asyncio.sleep(0.2)    # Let the sampler fill the cache
+            reads_before = server.actor.stats()['sensor_reads']
+            start = time.perf_counter()
+            for _ in range(10):
+                for reader, writer in pollers:
+                    writer.write(b'p\n')
+                for reader, writer in pollers:
+                    assert(float(await reader.readline()) >= 0.0)
+                    await reader.readline()
+            per_poll = (time.perf_counter() - start) / (10 * len(pollers))
+            # 500 polls and only the sampler's own reads of the sensors
+            assert(server.actor.stats()['sensor_reads'] - reads_before <= 5)
+            assert(per_poll < 0.001)
+            for reader, writer in pollers:
+                writer.close()
+        run_with_servers(sim, test)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+'''Fixed-size ring buffer of timestamped sensor samples. One thread writes blocks of
+samples as they arrive from the hardware and any number of readers can ask for the
+newest one or the last few seconds' worth. All the storage is allocated up front so
+nothing gets allocated while streaming.'''
+
+import threading
+import numpy as np
+
+class SampleRing:
+    '''Holds the most recent capacity samples of num_channels values each.'''
+
+    def __init__(self, capacity : int, num_channels : int):
+        assert(capacity > 0)
+        assert(num_channels > 0)
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.data = np.zeros((capacity, num_channels))
+        self.count = 0   # Total samples ever written. The next one goes at count % capacity.
+        self.lock = threading.Lock()
+
+    def append(self, times, block):
+        '''Adds a block of samples. times has shape (n,) and block has (n, num_channels).'''
+        times = np.asarray(times, dtype=float)
+        block = np.asarray(block, dtype=float)
+        n = len(times)
+        assert(block.shape == (n, self.data.shape[1]))
+        if n > self.capacity:
+            # Only the newest ones would survive anyway
+            times, block = times[-self.capacity:], block[-self.capacity:]
+            skipped, n = n - self.capacity, self.capacity
+        else:
+            skipped = 0
+        with self.lock:
+            start = (self.count + skipped) % self.capacity
+            first = min(n, self.capacity - start)
+            self.times[start:start + first] = times[:first]
+            self.data[start:start + first] = block[:first]
+            self.times[:n - first] = times[first:]
+            self.data[:n - first] = block[first:]
+            self.count += skipped + n
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self):
+        '''Returns (time, values) of the newest sample, or None if there isn't one yet.'''
+        with self.lock:
+            if self.count == 0:
+                return None
+            ndx = (self.count - 1) % self.capacity
+            return self.times[ndx], self.data[ndx].copy()
+
+    def last(self, n : int):
+        '''Returns (times, values) of the newest n samples, oldest first.'''
+        with self.lock:
+            n = min(n, len(self))
+            ndx = (np.arange(self.count - n, self.count)) % self.capacity
+            return self.times[ndx], self.data[ndx]
+
+
+# Unit tests - run with pytest
+class TestSampleRing:
+    def test_empty(self):
+        ring = SampleRing(4, 2)
+        assert(ring.latest() is None)
+        assert(len(ring) == 0)
+
+    def test_wraps_around(self):
+        ring = SampleRing(4, 2)
+        for k in range(3):
+            times = np.arange(3) + 3 * k
+            ring.append(times, np.column_stack([times, -times]))
+        assert(len(ring) == 4)
+        assert(ring.count == 9)
+        t, values = ring.latest()
+        assert(t == 8 and list(values) == [8, -8])
+        times, values = ring.last(4)
+        assert(list(times) == [5, 6, 7, 8])
+        assert(list(values[:, 1]) == [-5, -6, -7, -8])
+
+    def test_block_bigger_than_ring(self):
+        ring = SampleRing(4, 1)
+        ring.append(np.arange(10), np.arange(10).reshape(-1, 1))
+        times, _ = ring.last(10)
+        assert(list(times) == [6, 7, 8, 9])
+        assert(ring.latest()[0] == 9)
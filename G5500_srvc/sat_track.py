@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+'''Satellite tracking inside the service. Given a TLE or OMM and where the station
+is, plan_pass() finds the pass that is up now (or the next one), propagates it in
+one vectorized skyfield call at STEP_S spacing, and turns it into a rotator
+trajectory that TrackJob follows, interpolating between the steps at the control
+rate. The service does all of it itself, so tracking doesn't depend on a client
+staying connected.
+
+The azimuth is unwrapped over the pass and shifted by whole turns so the pass fits
+inside the rotator's travel without having to unwind, picking the shift closest to
+where the rotator is now. SatTrack1's wrap_planner does the same with flip mode as
+well, for whole schedules of passes.
+
+skyfield is only needed here, so the rest of the service runs without it.'''
+
+import datetime
+import json
+import numpy as np
+from skyfield.api import EarthSatellite, load, wgs84
+from track_job import wrap_offset
+
+STEP_S = 1.0              # Spacing of the propagated points
+SEARCH_DAYS = 1.0         # How far ahead to look for a pass
+MIN_EL_DEG = 0.0
+
+class SatellitePlan:
+    '''A pass as a rotator trajectory. t is seconds from start_epoch (POSIX time).'''
+
+    def __init__(self, name : str, start_epoch : float, t, az, el, max_el : float):
+        self.name = name
+        self.start_epoch = start_epoch
+        self.t, self.az, self.el = t, az, el
+        self.max_el = max_el
+
+    @property
+    def los_epoch(self) -> float:
+        return self.start_epoch + float(self.t[-1])
+
+    def __str__(self):
+        start = datetime.datetime.fromtimestamp(self.start_epoch, datetime.timezone.utc)
+        return f'{self.name} from {start:%Y-%m-%d %H:%M:%S} UTC for {self.t[-1]:.0f} s, ' \
+               f'max elevation {self.max_el:.1f}, az {self.az[0]:.1f} -> {self.az[-1]:.1f}'
+
+def load_satellite(lines : list[str], ts=None) -> EarthSatellite:
+    '''Makes a satellite from a TLE (two lines, or three with a name first) or from
+    one line of OMM JSON as Celestrak serves it.'''
+    ts = ts or load.timescale()
+    lines = [line.strip() for line in lines if line.strip()]
+    if len(lines) == 1 and lines[0].startswith('{'):
+        try:
+            return EarthSatellite.from_omm(ts, json.loads(lines[0]))
+        except (json.JSONDecodeError, KeyError) as e:
+            raise ValueError(f'Bad OMM: {e}')
+    if len(lines) == 3:
+        name, line1, line2 = lines
+    elif len(lines) == 2:
+        name, (line1, line2) = None, lines
+    else:
+        raise ValueError('Expected a two or three line TLE or one line of OMM JSON')
+    if not (line1.startswith('1 ') and line2.startswith('2 ')):
+        raise ValueError('TLE lines must start with 1 and 2')
+    return EarthSatellite(line1, line2, name, ts)
+
+def plan_pass(sat : EarthSatellite, latitude : float, longitude : float, elevation_m : float, cal,
+              now_epoch : float, start_az : float = None, min_el : float = MIN_EL_DEG,
+              step_s : float = STEP_S) -> SatellitePlan:
+    '''Plans tracking sat from now_epoch (or its next rise) until it sets. cal is the
+    rotator CalibrationData, for the limits. Raises ValueError if there is no pass
+    in the next SEARCH_DAYS or it can't be followed without unwinding.'''
+    ts = load.timescale()
+    observer = wgs84.latlon(latitude, longitude, elevation_m)
+    difference = sat - observer
+    t0 = ts.from_datetime(datetime.datetime.fromtimestamp(now_epoch, datetime.timezone.utc))
+    times, events = sat.find_events(observer, t0, t0 + SEARCH_DAYS, altitude_degrees=min_el)
+
+    alt_now = difference.at(t0).altaz()[0].degrees
+    if alt_now >= min_el:
+        start = t0
+    else:
+        rises = np.flatnonzero(events == 0)
+        if len(rises) == 0:
+            raise ValueError(f'{sat.name} does not rise in the next {SEARCH_DAYS} days')
+        start = times[rises[0]]
+    sets = [ndx for ndx in np.flatnonzero(events == 2) if times[ndx].tt > start.tt]
+    end = times[sets[0]] if sets else t0 + SEARCH_DAYS
+
+    # One call for the whole pass
+    duration_s = (end.tt - start.tt) * 86400.0
+    t = np.arange(int(np.ceil(duration_s / step_s)) + 1) * step_s
+    alt, az, _ = difference.at(ts.tt_jd(start.tt + t / 86400.0)).altaz()
+
+    # Pick the whole-turn shift that fits the rotator and starts nearest to it
+    az_track = np.unwrap(az.degrees, period=360.0)
+    try:
+        offset = wrap_offset(az_track, cal, start_az)
+    except ValueError:
+        raise ValueError(f'{sat.name} pass needs more azimuth travel than the rotator has')
+    el = np.clip(alt.degrees, cal.el.min_angle, cal.el.max_angle)
+    return SatellitePlan(sat.name or str(sat.model.satnum), start.utc_datetime().timestamp(), t,
+                         az_track + offset, el, float(alt.degrees.max()))
+
+
+# Unit tests - run with pytest
+import pytest
+from G5500 import CalibrationData
+
+# From the skyfield documentation
+ISS_TLE = ['ISS (ZARYA)',
+           '1 25544U 98067A   14020.93268519  .00009878  00000-0  18200-3 0  5082',
+           '2 25544  51.6498 109.4756 0003572  55.9686 274.8005 15.50377579 73486']
+CAL = CalibrationData.from_string('Az, 0, 0, 0.0, 450, 0, 4.0\nEl, 0, 0, 0.0, 180, 0, 4.0')
+COS = (38.9596, -104.7695, 2092)
+JAN21_2014 = datetime.datetime(2014, 1, 21, tzinfo=datetime.timezone.utc).timestamp()
+
+class TestSatTrack:
+    def test_plan_next_pass(self):
+        sat = load_satellite(ISS_TLE)
+        plan = plan_pass(sat, *COS, CAL, JAN21_2014)
+        assert(plan.name == 'ISS (ZARYA)')
+        assert(plan.start_epoch > JAN21_2014)
+        assert(60 < plan.t[-1] < 900)
+        assert(np.all(np.diff(plan.t) == STEP_S))
+        assert(CAL.az.min_angle <= plan.az.min() and plan.az.max() <= CAL.az.max_angle)
+        assert(np.all(plan.el >= 0.0))
+        # Rise and set are on the horizon. The steps between move less than a degree.
+        assert(plan.el[0] < 0.5 and plan.el[-1] < 1.0)
+        assert(np.max(np.abs(np.diff(plan.az))) < 1.0)
+
+    def test_plan_pass_in_progress(self):
+        sat = load_satellite(ISS_TLE)
+        first = plan_pass(sat, *COS, CAL, JAN21_2014)
+        middle = first.start_epoch + first.t[-1] / 2
+        plan = plan_pass(sat, *COS, CAL, middle)
+        assert(abs(plan.start_epoch - middle) < 1e-3)
+        assert(abs(plan.los_epoch - first.los_epoch) < 2.0)
+        assert(plan.el[0] > 1.0)
+
+    def test_omm(self):
+        omm = {'OBJECT_NAME': 'OSCAR 7 (AO-7)', 'OBJECT_ID': '1974-089B', 'EPOCH': '2024-10-27T11:24:08.044704',
+               'MEAN_MOTION': 12.53681533, 'ECCENTRICITY': 0.001207, 'INCLINATION': 101.9888,
+               'RA_OF_ASC_NODE': 297.4083, 'ARG_OF_PERICENTER': 190.741, 'MEAN_ANOMALY': 324.0528,
+               'EPHEMERIS_TYPE': 0, 'CLASSIFICATION_TYPE': 'U', 'NORAD_CAT_ID': 7530, 'ELEMENT_SET_NO': 999,
+               'REV_AT_EPOCH': 28585, 'BSTAR': 0.00025342, 'MEAN_MOTION_DOT': -6.0e-8, 'MEAN_MOTION_DDOT': 0}
+        sat = load_satellite([json.dumps(omm)])
+        assert(sat.model.satnum == 7530)
+        epoch = datetime.datetime(2024, 10, 28, tzinfo=datetime.timezone.utc).timestamp()
+        plan = plan_pass(sat, *COS, CAL, epoch, start_az=400.0)
+        assert(plan.t[-1] > 60)
+
+    def test_bad_input(self):
+        with pytest.raises(ValueError):
+            load_satellite(ISS_TLE[1:2])
+        with pytest.raises(ValueError):
+            load_satellite(['{"OBJECT_NAME": "nothing else"}'])
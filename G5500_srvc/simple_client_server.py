@@ -3,6 +3,7 @@ import threading
 import datetime
 import platform
 import G5500
+from hardware_actor import HardwareActor, Preempted
 
 # Server configuration
 HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
@@ -11,8 +12,9 @@ PORT = 65432        # Port to listen on (non-privileged ports are > 1023)
 CONFIG_FILE='G5500_config.txt'
 CAL_FILE='rotator_cal.txt'
 
-def handle_client(conn, addr, g5500 : G5500):
-    """Handles individual client connections to the G5500 az/el rotator."""
+def handle_client(conn, addr, g5500 : G5500, actor : HardwareActor):
+    """Handles individual client connections to the G5500 az/el rotator. Everything
+    that touches the hardware goes through actor."""
     print(f"Connected by {addr}")
     conn.sendall(b"Welcome to the command server! Type 'HELP' for commands.\n")
 
@@ -27,7 +29,7 @@ def handle_client(conn, addr, g5500 : G5500):
             response = ""
 
             if command in ["STOP", "X"]:
-                g5500.stop_motion()
+                actor.stop().result()
                 response = f"STOP command executed."
             elif command == "MOVETO":
                 if len(args) != 3:
@@ -39,27 +41,33 @@ def handle_client(conn, addr, g5500 : G5500):
                     except ValueError:
                         response = "Error: MOVETO command arguments must be numeric."
                     else:
-                        g5500.move_to(az, el) # Blocking call
-                        response = f"MOVETO {az},{el} command executed."
+                        try:
+                            actor.call(g5500.start_move, az, el, key='target', motion=True)
+                            g5500.wait_move() # Blocking call
+                            response = f"MOVETO {az},{el} command executed."
+                        except Preempted:
+                            response = f"MOVETO {az},{el} preempted by STOP."
+                        except (ValueError, RuntimeError) as e:
+                            response = f"Error: {e}"
             elif command == "LEFT":
-                g5500.move_az_left()
+                actor.call(g5500.move_az_left, motion=True)
                 response = f"LEFT command executed."
             elif command == "RIGHT":
-                g5500.move_az_right()
+                actor.call(g5500.move_az_right, motion=True)
                 response = f"RIGHT command executed."
             elif command == "UP":
-                g5500.move_el_up()
+                actor.call(g5500.move_el_up, motion=True)
                 response = f"UP command executed."
             elif command == "DOWN":
-                g5500.move_el_down()
+                actor.call(g5500.move_el_down, motion=True)
                 response = f"DOWN command executed."
             elif command == "READ":
-                g5500.read_sensors()
+                actor.read()    # From the cache if it's recent
                 response = f"READ command executed. {g5500}"
             elif command == "HELP":
                 response = "Available commands: STOP, LEFT, RIGHT, UP, DOWN, READ, HELP, QUIT"
             elif command == "QUIT":
-                g5500.stop_motion()
+                actor.stop().result()
                 response = "STOP command executed. Exiting."
                 conn.sendall(response.encode('utf-8') + b'\n')
                 break
@@ -75,12 +83,13 @@ def handle_client(conn, addr, g5500 : G5500):
             print(f"Error with client {addr}: {e}")
             break
 
-    g5500.stop_motion()
+    actor.stop().result()
     print(f"Client {addr} disconnected.")
     conn.close()
 
 def start_server(g5500 : G5500, portnum : int = PORT):
     """Starts the main server loop."""
+    actor = HardwareActor(g5500)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.bind((HOST, portnum))
         s.listen()
@@ -88,7 +97,7 @@ def start_server(g5500 : G5500, portnum : int = PORT):
         while True:
             conn, addr = s.accept()
             # Handle client in a new thread to allow multiple connections
-            client_handler = threading.Thread(target=handle_client, args=(conn, addr, g5500))
+            client_handler = threading.Thread(target=handle_client, args=(conn, addr, g5500, actor))
             client_handler.start()
 
 if __name__ == "__main__":
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+'''Follows an uploaded trajectory on the service's own clock. A trajectory is a list
+of time-tagged az/el points, with times in seconds from the start of the job. The
+job runs on its own thread: every period it works out where the trajectory will be
+a little ahead, hands that to the rotator's move loop as the new target, and keeps
+track of how far off the antenna is. Nothing the client or the network does after
+the upload changes the timing.
+
+The rotator follows with a holding move (G5500.start_move() with hold), so an axis
+that is keeping up just keeps driving from one target to the next. All the rotator
+calls go through the HardwareActor, so a STOP from anywhere ends the job too.
+
+Trajectories come in three wire formats, all handled by the servers:
+    Text, one "t az el" line per point.
+    Binary, n little-endian float32 triples of (t, az, el). See from_binary().
+    Polynomial, a trajectory.Trajectory, which the job evaluates directly rather
+    than interpolating between points. See from_trajectory().'''
+
+import threading
+import time
+import numpy as np
+from hardware_actor import HardwareActor
+
+PERIOD_S = 0.1             # How often the target is updated
+LEAD_S = 0.5               # Aim this far ahead to make up for the time it takes to react
+TRACK_TOLERANCE_DEG = 1.0  # Same deadband the SatTrack1 tracker uses
+MAX_POINTS = 100000
+POINT_BYTES = 12           # Three float32s
+WRAP_OFFSETS = np.array([-360.0, 0.0, 360.0, 720.0])  # Whole turns a track can be shifted by
+
+def wrap_offset(az, cal, reference : float = None) -> float:
+    '''The whole turn from WRAP_OFFSETS to add to an unwrapped azimuth track so it
+    fits the rotator's travel and starts nearest reference (the middle of the travel
+    if that's None). Raises ValueError if no shift fits.'''
+    az = np.asarray(az, dtype=float)
+    candidates = az[0] + WRAP_OFFSETS
+    fits = (az.min() + WRAP_OFFSETS >= cal.az.min_angle) & (az.max() + WRAP_OFFSETS <= cal.az.max_angle)
+    if not fits.any():
+        raise ValueError('Trajectory needs more azimuth travel than the rotator has')
+    if reference is None:
+        reference = (cal.az.min_angle + cal.az.max_angle) / 2
+    return float(WRAP_OFFSETS[fits][np.argmin(np.abs(candidates[fits] - reference))])
+
+class TrackJob:
+    '''One trajectory and the thread that follows it. Make it, then start().'''
+
+    WAITING, RUNNING, DONE, ABORTED, FAILED = 'waiting', 'running', 'done', 'aborted', 'failed'
+
+    def __init__(self, actor : HardwareActor, t, az, el, start_epoch : float = None,
+                 lead_s : float = LEAD_S, period_s : float = PERIOD_S, tolerance : float = TRACK_TOLERANCE_DEG,
+                 name : str = ''):
+        '''t, az and el are same-length sequences, t in seconds from the start of the
+        job. The job starts when start() is called, or at start_epoch (POSIX time) if
+        that is given. name shows up in status(). Raises ValueError if the trajectory
+        is no good.'''
+        self.t = np.asarray(t, dtype=float)
+        self.az = np.asarray(az, dtype=float)
+        self.el = np.asarray(el, dtype=float)
+        if not (len(self.t) == len(self.az) == len(self.el)):
+            raise ValueError('t, az and el must be the same length')
+        if not (1 <= len(self.t) <= MAX_POINTS):
+            raise ValueError(f'Trajectory must have between 1 and {MAX_POINTS} points')
+        if not np.all(np.isfinite(self.t)) or not np.all(np.isfinite(self.az)) or not np.all(np.isfinite(self.el)):
+            raise ValueError('Trajectory has a point that is not a number')
+        if np.any(np.diff(self.t) <= 0):
+            raise ValueError('Trajectory times must be increasing')
+        cal = actor.g5500.rotator.cal_data
+        if self.az.min() < cal.az.min_angle or self.az.max() > cal.az.max_angle:
+            raise ValueError(f'Trajectory azimuth goes outside {cal.az.min_angle} to {cal.az.max_angle}')
+        if self.el.min() < cal.el.min_angle or self.el.max() > cal.el.max_angle:
+            raise ValueError(f'Trajectory elevation goes outside {cal.el.min_angle} to {cal.el.max_angle}')
+
+        self.actor = actor
+        self.g5500 = actor.g5500
+        self.name = name
+        self.start_epoch = start_epoch
+        self.lead_s = lead_s
+        self.period_s = period_s
+        self.tolerance = tolerance
+        self.state = TrackJob.WAITING
+        self.reason = ''
+        self.start_t = None        # On the G5500's clock
+        self.elapsed = 0.0
+        self.ticks = 0
+        self.az_error = self.el_error = 0.0
+        self.sum_sq_error = 0.0
+        self.max_error = 0.0
+        self.abort_event = threading.Event()
+        self.thread = None
+        self.path = None           # A Trajectory to follow instead of the points
+
+    @classmethod
+    def from_text(cls, actor : HardwareActor, lines : list[str], **kwargs):
+        '''Makes a job from "t az el" lines.'''
+        points = []
+        for linenum, line in enumerate(lines, 1):
+            fields = line.replace(',', ' ').split()
+            if len(fields) != 3:
+                raise ValueError(f'Point {linenum} should be "t az el"')
+            points.append([float(f) for f in fields])
+        if not points:
+            raise ValueError('Trajectory has no points')
+        t, az, el = np.array(points).T
+        return cls(actor, t, az, el, **kwargs)
+
+    @classmethod
+    def from_binary(cls, actor : HardwareActor, data : bytes, **kwargs):
+        '''Makes a job from little-endian float32 (t, az, el) triples.'''
+        if len(data) % POINT_BYTES != 0:
+            raise ValueError(f'Binary trajectory must be a multiple of {POINT_BYTES} bytes')
+        t, az, el = np.frombuffer(data, dtype='<f4').reshape(-1, 3).T
+        return cls(actor, t, az, el, **kwargs)
+
+    @classmethod
+    def from_trajectory(cls, actor : HardwareActor, traj, step_s : float = 1.0, start_az : float = None,
+                        **kwargs):
+        '''Makes a job that follows a trajectory.Trajectory, starting at its t0 unless
+        start_epoch says otherwise. Its azimuth is unwrapped, so it is first shifted by
+        the whole turn that fits the rotator and starts nearest start_az. The points,
+        every step_s, are only there for the limit checks and status.'''
+        kwargs.setdefault('start_epoch', traj.t0)
+        t, az, el = traj.sample(step_s)
+        offset = wrap_offset(az, actor.g5500.rotator.cal_data, start_az)
+        if offset != 0.0:
+            traj = traj.shifted(offset)
+        job = cls(actor, t, az + offset, el, **kwargs)
+        job.path = traj
+        return job
+
+    @staticmethod
+    def to_binary(t, az, el) -> bytes:
+        '''The other end of from_binary(), for clients.'''
+        return np.column_stack([t, az, el]).astype('<f4').tobytes()
+
+    @property
+    def duration(self) -> float:
+        return float(self.t[-1])
+
+    @property
+    def active(self) -> bool:
+        return self.state in (TrackJob.WAITING, TrackJob.RUNNING)
+
+    def target_at(self, t : float) -> tuple[float, float]:
+        '''Where the trajectory is t seconds into the job. Before the first point it
+        is at the first point and after the last one it stays at the last.'''
+        if self.path is not None:
+            return self.path.evaluate(t)
+        return float(np.interp(t, self.t, self.az)), float(np.interp(t, self.t, self.el))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='track-job', daemon=True)
+        self.thread.start()
+
+    def abort(self, reason : str = 'aborted'):
+        '''Ends the job and stops the rotator. Returns once the job thread has quit.'''
+        if self.active:
+            self.reason = reason
+            self.abort_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def wait(self, timeout : float = None) -> bool:
+        '''Waits for the job to end. Returns False on timeout.'''
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def status(self) -> str:
+        s = f'{self.state} {self.elapsed:.1f}/{self.duration:.1f} s'
+        if self.name:
+            s += f' {self.name}'
+        if self.ticks:
+            rms = np.sqrt(self.sum_sq_error / self.ticks)
+            s += f' error az={self.az_error:+.2f} el={self.el_error:+.2f} rms={rms:.2f} max={self.max_error:.2f}'
+        if self.reason:
+            s += f' ({self.reason})'
+        return s
+
+    def _steer(self, az : float, el : float):
+        '''Gives the move loop a new target. Runs on the actor thread.'''
+        self.g5500.start_move(az, el, self.tolerance, hold=True)
+
+    def _release(self):
+        '''Ends the holding move. Runs on the actor thread.'''
+        self.g5500.cancel_move()
+        self.g5500.stop_motion()
+
+    def _run(self):
+        '''Body of the job thread.'''
+        g5500 = self.g5500
+        stops = self.actor.stop_count
+        # Head for the first point while waiting for the start time
+        pending = self.actor.submit(self._steer, *self.target_at(0.0), key='target', motion=True)
+        start_t = g5500.now()
+        if self.start_epoch is not None:
+            start_t += self.start_epoch - time.time()
+        self.start_t = start_t
+        try:
+            while not self.abort_event.is_set():
+                if self.actor.stop_count != stops:
+                    self.reason = 'stopped'
+                    self.state = TrackJob.ABORTED
+                    return
+                if pending.done() and pending.exception() is not None:
+                    raise pending.exception()
+                now = g5500.now()
+                self.elapsed = max(now - start_t, 0.0)
+                if now - start_t > self.duration:
+                    self.elapsed = self.duration
+                    self.state = TrackJob.DONE
+                    return
+                if now >= start_t:
+                    self.state = TrackJob.RUNNING
+                    # How far off we are from where the trajectory is right now
+                    if g5500.az is not None:
+                        az_now, el_now = self.target_at(now - start_t)
+                        self.az_error, self.el_error = az_now - g5500.az, el_now - g5500.el
+                        error = max(abs(self.az_error), abs(self.el_error))
+                        self.sum_sq_error += error ** 2
+                        self.max_error = max(self.max_error, error)
+                        self.ticks += 1
+                    pending = self.actor.submit(self._steer, *self.target_at(now - start_t + self.lead_s),
+                                                key='target', motion=True)
+                g5500.sleep(self.period_s)
+            self.state = TrackJob.ABORTED
+        except Exception as e:
+            self.reason = str(e)
+            self.state = TrackJob.FAILED
+        finally:
+            if self.actor.stop_count == stops:
+                try:
+                    self.actor.call(self._release)
+                except RuntimeError:
+                    pass    # The actor has been closed
+
+
+# Unit tests - run with pytest
+import pytest
+
+CAL = '''Az, 0, 0, 0.0, 450, 0, 4.0
+         El, 0, 0, 0.0, 180, 0, 4.0'''
+
+@pytest.fixture
+def actor(tmp_path):
+    from G5500_SimIF import G5500_Sim
+    filename = tmp_path / 'rotator_cal.txt'
+    filename.write_text(CAL)
+    actor = HardwareActor(G5500_Sim(str(filename), speedup=20.0, az=100.0, el=10.0, seed=1))
+    yield actor
+    actor.close(1.0)
+
+def sweep(duration : float = 30.0, step : float = 1.0):
+    '''Az at 3 deg/s, el at 1 deg/s. Both well inside what the rotator can do.'''
+    t = np.arange(0.0, duration + step / 2, step)
+    return t, 100.0 + 3.0 * t, 10.0 + 1.0 * t
+
+class TestTrackJob:
+    def test_follows_trajectory(self, actor):
+        job = TrackJob(actor, *sweep())
+        job.start()
+        assert(job.wait(5.0))
+        assert(job.state == TrackJob.DONE)
+        az, el = actor.g5500.true_position()
+        assert(abs(az - 190.0) < 2.0 and abs(el - 40.0) < 2.0)
+        # Past the first couple of seconds it should stay within about the deadband
+        assert(job.max_error < 5.0)
+        assert(np.sqrt(job.sum_sq_error / job.ticks) < 2.0)
+        assert(not actor.g5500.moving)
+
+    def test_stop_aborts(self, actor):
+        job = TrackJob(actor, *sweep())
+        job.start()
+        time.sleep(0.3)
+        actor.stop().result(1.0)
+        job.wait(1.0)
+        assert(job.state == TrackJob.ABORTED and job.reason == 'stopped')
+        assert(not actor.g5500.moving)
+
+    def test_abort(self, actor):
+        job = TrackJob(actor, *sweep())
+        job.start()
+        time.sleep(0.2)
+        job.abort('client asked')
+        assert(job.state == TrackJob.ABORTED)
+        assert('client asked' in job.status())
+        assert(not actor.g5500.moving)
+
+    def test_formats(self, actor):
+        t, az, el = sweep(5.0)
+        job = TrackJob.from_binary(actor, TrackJob.to_binary(t, az, el))
+        assert(np.allclose(job.az, az) and np.allclose(job.t, t))
+        job = TrackJob.from_text(actor, [f'{a} {b} {c}' for a, b, c in zip(t, az, el)])
+        assert(job.target_at(2.5) == (107.5, 12.5))
+        assert(job.target_at(-1.0) == (100.0, 10.0))
+
+    def test_trajectory(self, actor):
+        from trajectory import Trajectory
+        t, az, el = sweep()
+        traj = Trajectory.fit(1.7e9 + t, az, el + 0.01 * t ** 2)
+        job = TrackJob.from_trajectory(actor, traj)
+        assert(job.start_epoch == 1.7e9 and job.duration == 30.0)
+        target = job.target_at(12.5)
+        assert(abs(target[0] - 137.5) < 0.01 and abs(target[1] - (22.5 + 0.01 * 12.5 ** 2)) < 0.06)
+
+    def test_trajectory_through_north(self, actor):
+        from trajectory import Trajectory
+        # Westward through north, so it unwraps to below zero
+        t = np.arange(0.0, 20.5, 1.0)
+        traj = Trajectory.fit(t, (10.0 - 2.0 * t) % 360.0, np.full(len(t), 20.0), t0=0.0)
+        assert(traj.evaluate(20.0)[0] < 0.0)
+        job = TrackJob.from_trajectory(actor, traj, start_az=30.0)
+        assert(abs(job.target_at(0.0)[0] - 370.0) < 0.01 and abs(job.target_at(20.0)[0] - 330.0) < 0.01)
+        assert(np.allclose(job.az, 370.0 - 2.0 * job.t, atol=0.01))
+        # With room below, the turn that starts nearest wins
+        job = TrackJob.from_trajectory(actor, traj.shifted(100.0), start_az=30.0)
+        assert(abs(job.target_at(0.0)[0] - 110.0) < 0.01)
+        with pytest.raises(ValueError):
+            TrackJob.from_trajectory(actor, Trajectory.fit(t, 40.0 * t, 20.0 + 0.0 * t, t0=0.0))
+
+    def test_bad_trajectories(self, actor):
+        with pytest.raises(ValueError):
+            TrackJob(actor, [0, 1, 1], [10, 11, 12], [5, 5, 5])     # Times not increasing
+        with pytest.raises(ValueError):
+            TrackJob(actor, [0, 1], [10, 500], [5, 5])              # Past the end of azimuth
+        with pytest.raises(ValueError):
+            TrackJob.from_text(actor, ['0 10'])
+        with pytest.raises(ValueError):
+            TrackJob.from_binary(actor, b'\0' * 13)
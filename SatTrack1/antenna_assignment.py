@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+'''Hands out passes to several rotators. Each rotator can have its own limits and
+slew rates. The goal is the largest total pass value across all of them.
+
+The approach is greedy plus repair. Rotators take turns running the single-rotator
+scheduler over whatever passes are still unassigned. That usually leaves a few good
+passes on the table, so the repair step tries to squeeze each of them in, bumping
+cheaper passes off a rotator when that is a net win and re-homing the bumped passes
+elsewhere if they fit.'''
+
+from bisect import bisect_left
+import numpy as np
+from rotator import Rotator
+from wrap_planner import plan_wraps
+from pass_scheduler import schedule, pass_value, SETUP_TIME_S
+
+# Samples per pass used to check that a rotator can follow it without unwinding
+SAMPLES_PER_PASS = 16
+
+class RotatorTimeline:
+    '''The passes given to one rotator, kept in time order, plus what we need to
+    check whether another pass fits in between them.'''
+
+    def __init__(self, rotator : Rotator, start, end, aos, los, setup_time):
+        self.rotator = rotator
+        self.start, self.end = start, end   # shared arrays, indexed by pass number
+        self.aos, self.los = aos, los       # (az, el) arrays in this rotator's coordinates
+        self.setup_time = setup_time
+        self.passes = []                    # pass numbers sorted by start time
+
+    def _gap_ok(self, a : int, b : int) -> bool:
+        '''True if the rotator can finish pass a and get to the start of pass b.'''
+        slew = self.rotator.slew_time(self.los[0][a], self.los[1][a], self.aos[0][b], self.aos[1][b])
+        return self.end[a] + slew + self.setup_time <= self.start[b]
+
+    def fits(self, ndx : int, skip=()) -> bool:
+        '''True if pass ndx can be added, pretending the passes in skip are gone.'''
+        kept = [p for p in self.passes if p not in skip]
+        pos = bisect_left([self.start[p] for p in kept], self.start[ndx])
+        if pos > 0 and not self._gap_ok(kept[pos - 1], ndx):
+            return False
+        if pos < len(kept) and not self._gap_ok(ndx, kept[pos]):
+            return False
+        return True
+
+    def conflicts(self, ndx : int) -> list[int]:
+        '''Passes that would have to go for pass ndx to fit.'''
+        return [p for p in self.passes
+                if not (self._gap_ok(p, ndx) or self._gap_ok(ndx, p))]
+
+    def add(self, ndx : int):
+        pos = bisect_left([self.start[p] for p in self.passes], self.start[ndx])
+        self.passes.insert(pos, ndx)
+
+    def remove(self, ndx : int):
+        self.passes.remove(ndx)
+
+def assign_passes(passes, obs_pos, rotators : list[Rotator], priorities : dict = None,
+                  setup_time : float = SETUP_TIME_S, repair_rounds : int = 3) -> list[list]:
+    '''Assigns passes to rotators. Returns one list of passes per rotator, in time
+    order. priorities maps a satellite catalog number to a multiplier for its passes.'''
+    if priorities is None:
+        priorities = {}
+    num_passes = len(passes)
+    if num_passes == 0:
+        return [[] for _ in rotators]
+
+    # Sample every pass once. The samples are shared by all of the rotators.
+    az = np.zeros((num_passes, SAMPLES_PER_PASS))
+    el = np.zeros((num_passes, SAMPLES_PER_PASS))
+    start, end = np.zeros(num_passes), np.zeros(num_passes)
+    for ndx, sat_pass in enumerate(passes):
+        ts = sat_pass.peak_time.ts
+        times = ts.tt_jd(np.linspace(sat_pass.ascend_time.tt, sat_pass.descend_time.tt, SAMPLES_PER_PASS))
+        alt, pass_az, _ = (sat_pass.sat - obs_pos).at(times).altaz()
+        az[ndx], el[ndx] = pass_az.degrees, alt.degrees
+        start[ndx], end[ndx] = times.tt[0] * 86400.0, times.tt[-1] * 86400.0
+
+    priority = np.array([priorities.get(p.sat.model.satnum, 1.0) for p in passes])
+    weight = pass_value(el.max(axis=1), end - start, priority)
+
+    # Each rotator gets its own wrap plan since the limits may differ
+    timelines, feasible = [], []
+    for rotator in rotators:
+        plans = plan_wraps(az, el, rotator)
+        aos = (plans.az[:, 0], plans.el[:, 0])
+        los = (plans.az[:, -1], plans.el[:, -1])
+        timelines.append(RotatorTimeline(rotator, start, end, aos, los, setup_time))
+        feasible.append(plans.feasible)
+
+    # Greedy pass. The most limited rotators choose first so they get the passes
+    # they can actually do.
+    owner = np.full(num_passes, -1)
+    for r in sorted(range(len(rotators)), key=lambda r: np.count_nonzero(feasible[r])):
+        tl = timelines[r]
+        avail = np.flatnonzero(feasible[r] & (owner < 0))
+        chosen = schedule(start[avail], end[avail], weight[avail],
+                          tl.aos[0][avail], tl.aos[1][avail], tl.los[0][avail], tl.los[1][avail],
+                          tl.rotator, setup_time)
+        for ndx in avail[chosen]:
+            owner[ndx] = r
+            tl.add(ndx)
+
+    # Repair pass. Try to fit each leftover pass, best first.
+    for _ in range(repair_rounds):
+        improved = False
+        for ndx in sorted(np.flatnonzero(owner < 0), key=lambda i: -weight[i]):
+            for r, tl in enumerate(timelines):
+                if not feasible[r][ndx]:
+                    continue
+                bumped = tl.conflicts(ndx)
+                if weight[bumped].sum() >= weight[ndx] or not tl.fits(ndx, skip=bumped):
+                    continue
+                for b in bumped:
+                    tl.remove(b)
+                    owner[b] = -1
+                tl.add(ndx)
+                owner[ndx] = r
+                improved = True
+                # Give the bumped passes a chance on another rotator
+                for b in bumped:
+                    for r2, tl2 in enumerate(timelines):
+                        if r2 != r and feasible[r2][b] and tl2.fits(b):
+                            tl2.add(b)
+                            owner[b] = r2
+                            break
+                break
+        if not improved:
+            break
+
+    return [[passes[ndx] for ndx in tl.passes] for tl in timelines]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+'''Propagates a whole group of satellites for one instant with a single SatrecArray
+call instead of asking Skyfield about them one at a time. Even a group with
+thousands of satellites takes a few milliseconds.'''
+
+from dataclasses import dataclass
+import numpy as np
+from sgp4.api import SatrecArray, jday
+from skyfield.api import EarthSatellite
+from skyfield.timelib import Time
+from topocentric import Observer, teme_to_itrs
+
+@dataclass
+class Snapshot:
+    '''Where every satellite in a catalog is at one instant, one array entry each.'''
+    t : Time
+    az : np.ndarray             # degrees
+    el : np.ndarray             # degrees
+    range_km : np.ndarray
+    range_rate : np.ndarray     # km/s, positive when moving away
+
+class Catalog:
+    '''A group of satellites that can be propagated all at once for one observer.'''
+
+    def __init__(self, sats : list[EarthSatellite], obs_pos):
+        self.sats = sats
+        self.observer = Observer(obs_pos)
+        self.sat_array = SatrecArray([sat.model for sat in sats])
+        self.order = np.arange(len(sats))   # Last display order, highest first
+
+    def snapshot(self, t : Time) -> Snapshot:
+        '''Propagates the whole catalog to time t in one array call.'''
+        jd, fr = jday(*t.utc)
+        errors, r, v = self.sat_array.sgp4(np.array([jd]), np.array([fr]))
+        r, v = r[:, 0, :], v[:, 0, :]
+        r_itrs, v_itrs = teme_to_itrs(r, v, t.whole, t.ut1_fraction)
+        az, el, rng, range_rate = self.observer.look_angles(r_itrs, v_itrs)
+        # Decayed or otherwise broken element sets should never show up as visible
+        el = np.where(errors[:, 0] == 0, el, np.nan)
+        return Snapshot(t, az, el, rng, range_rate)
+
+    def visible(self, snap : Snapshot) -> np.ndarray:
+        '''Indices of the satellites above the horizon, highest first.
+
+        The previous frame's order is the starting point. Satellites barely move
+        in a second so the order is almost right already and the stable sort
+        (timsort) only has to patch up a few neighbors.'''
+        el = np.nan_to_num(snap.el[self.order], nan=-90.0)
+        self.order = self.order[np.argsort(-el, kind='stable')]
+        num_up = np.count_nonzero(snap.el[self.order] > 0.0)
+        return self.order[:num_up]
+
+    def table(self, snap : Snapshot, max_rows : int = 40, tz=None) -> str:
+        '''Formats the visible satellites as a text table.'''
+        up = self.visible(snap)
+        dt_str = snap.t.utc_datetime().astimezone(tz).strftime('%Y-%m-%d %H:%M:%S %Z')
+        s = f'{dt_str}   {len(up)} of {len(self.sats)} satellites up\n'
+        s += f'{"Cat #":>6} {"Name":24} {"Az":>7} {"El":>6} {"Range":>8} {"Rate":>7}\n'
+        for ndx in up[:max_rows]:
+            sat = self.sats[ndx]
+            s += f'{sat.model.satnum:6} {sat.name[:24]:24} {snap.az[ndx]:7.2f} {snap.el[ndx]:6.2f} '
+            s += f'{snap.range_km[ndx]:8.1f} {snap.range_rate[ndx]:7.3f}\n'
+        return s
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+'''Chebyshev ephemeris for satellites. SGP4 is not expensive but the tracking loop,
+a sky view and the live table all keep asking it about the same satellites at
+nearly the same times. This fits each satellite's Earth-fixed (ITRS) position with
+a Chebyshev polynomial per time segment, once, and stores the coefficients in a
+.npy file that is memory-mapped on load so any number of processes can share one
+copy. After that, a position is a few multiply-adds.
+
+Every segment is checked against SGP4 at points that were not used for the fit and
+the worst difference is stored with the coefficients, so the error bound travels
+with the file.'''
+
+import json
+import numpy as np
+from sgp4.api import SatrecArray, jday
+from skyfield.api import EarthSatellite
+from skyfield.timelib import Time
+from topocentric import Observer, teme_to_itrs, DAY_S
+
+SEGMENT_S = 1800.0  # Length of each polynomial segment in seconds
+DEGREE = 10         # Polynomial degree. 10 over 30 minutes is good to a few cm for LEO.
+CHECKS_PER_SEGMENT = 16
+
+def _cheb_nodes(n : int) -> np.ndarray:
+    '''Chebyshev-Gauss nodes on [-1, 1].'''
+    return np.cos(np.pi * (np.arange(n) + 0.5) / n)
+
+def _sgp4_itrs(sat_array : SatrecArray, times : Time) -> np.ndarray:
+    '''Earth-fixed positions (N, T, 3) in km for every satellite at every time.'''
+    jd, fr = jday(*times.utc)
+    errors, r, v = sat_array.sgp4(jd, fr)
+    r_itrs, _ = teme_to_itrs(r, v, times.whole, times.ut1_fraction)
+    r_itrs[errors != 0] = np.nan
+    return r_itrs
+
+def _basis(x, n : int, with_derivative : bool = False):
+    '''Chebyshev polynomials T_0..T_n-1 (and their derivatives) at x. Returns
+    arrays of shape x.shape + (n,).'''
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 0:
+        return _scalar_basis(float(x), n, with_derivative)
+    T = np.empty(x.shape + (n,))
+    T[..., 0] = 1.0
+    if n > 1:
+        T[..., 1] = x
+    for j in range(2, n):
+        T[..., j] = 2.0 * x * T[..., j - 1] - T[..., j - 2]
+    if not with_derivative:
+        return T
+    dT = np.zeros(x.shape + (n,))
+    if n > 1:
+        dT[..., 1] = 1.0
+    for j in range(2, n):
+        dT[..., j] = 2.0 * T[..., j - 1] + 2.0 * x * dT[..., j - 1] - dT[..., j - 2]
+    return T, dT
+
+def _scalar_basis(x : float, n : int, with_derivative : bool):
+    '''Same as _basis() for one time. The tracking loop asks for one time at a time
+    and plain floats are several times faster than tiny numpy arrays.'''
+    T, dT = [1.0, x], [0.0, 1.0]
+    for j in range(2, n):
+        T.append(2.0 * x * T[j - 1] - T[j - 2])
+        dT.append(2.0 * T[j - 1] + 2.0 * x * dT[j - 1] - dT[j - 2])
+    if not with_derivative:
+        return np.array(T[:n])
+    return np.array(T[:n]), np.array(dT[:n])
+
+def build_ephemeris(filename : str, sats : list[EarthSatellite], t_start : Time, duration_s : float,
+                    segment_s : float = SEGMENT_S, degree : int = DEGREE):
+    '''Fits every satellite over [t_start, t_start + duration_s] and writes the
+    coefficients to filename (.npy) with the metadata next to it (.json).
+    Returns the loaded ChebyshevEphemeris.'''
+    num_segments = int(np.ceil(duration_s / segment_s))
+    n = degree + 1
+    ts = t_start.ts
+    seg_start = np.arange(num_segments) * segment_s
+
+    # Fit points are the Chebyshev nodes, check points fall in between them
+    nodes = _cheb_nodes(n)
+    checks = np.linspace(-1.0, 1.0, CHECKS_PER_SEGMENT)
+    x = np.concatenate([nodes, checks])
+    offsets = (seg_start[:, None] + (x + 1.0) * segment_s / 2.0).ravel()
+    times = ts.tt_jd(t_start.whole, t_start.tt_fraction + offsets / DAY_S)
+
+    sat_array = SatrecArray([sat.model for sat in sats])
+    r = _sgp4_itrs(sat_array, times).reshape(len(sats), num_segments, len(x), 3)
+    r_fit, r_check = r[:, :, :n], r[:, :, n:]
+
+    # Discrete Chebyshev transform: c_j = 2/n sum_k f(x_k) T_j(x_k), with c_0 halved
+    T = np.cos(np.outer(np.arange(n), np.arccos(nodes)))    # (n coeffs, n nodes)
+    coeffs = np.einsum('jk,...kd->...dj', T, r_fit) * (2.0 / n)
+    coeffs[..., 0] /= 2.0
+
+    fitted = np.einsum('...dj,cj->...cd', coeffs, _basis(checks, n))
+    error_km = np.linalg.norm(fitted - r_check, axis=-1).max(axis=-1)
+
+    stored = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=coeffs.shape)
+    stored[:] = coeffs
+    stored.flush()
+    del stored
+    meta = {'t0_whole': float(t_start.whole), 't0_tt_fraction': float(t_start.tt_fraction),
+            'segment_s': segment_s, 'satnums': [int(sat.model.satnum) for sat in sats],
+            'names': [sat.name for sat in sats], 'error_km': np.nan_to_num(error_km, nan=-1.0).tolist()}
+    with open(_meta_name(filename), 'w') as f:
+        json.dump(meta, f)
+    return ChebyshevEphemeris(filename)
+
+def _meta_name(filename : str) -> str:
+    return filename[:-4] + '.json' if filename.endswith('.npy') else filename + '.json'
+
+class ChebyshevEphemeris:
+    '''A fitted ephemeris file, memory-mapped read-only.'''
+
+    def __init__(self, filename : str):
+        # (sats, segments, 3, n). Viewed as a plain array to skip the per-index
+        # overhead of np.memmap. The data still comes straight from the mapping.
+        self.coeffs = np.load(filename, mmap_mode='r').view(np.ndarray)
+        with open(_meta_name(filename)) as f:
+            meta = json.load(f)
+        self.t0_whole = meta['t0_whole']
+        self.t0_tt_fraction = meta['t0_tt_fraction']
+        self.segment_s = meta['segment_s']
+        self.satnums = meta['satnums']
+        self.names = meta['names']
+        # Worst fit error for each satellite and segment. -1 means SGP4 failed there.
+        self.error_km = np.array(meta['error_km'])
+        self.index = {satnum: ndx for ndx, satnum in enumerate(self.satnums)}
+        self.duration_s = self.coeffs.shape[1] * self.segment_s
+
+    def max_error_km(self, sat_ndx : int = None) -> float:
+        '''Worst fit error over the whole file or for one satellite.'''
+        err = self.error_km if sat_ndx is None else self.error_km[sat_ndx]
+        return float(err.max())
+
+    def _seconds(self, t : Time) -> np.ndarray:
+        return ((t.whole - self.t0_whole) + (t.tt_fraction - self.t0_tt_fraction)) * DAY_S
+
+    def position_itrs(self, sat_ndx : int, t : Time, with_velocity : bool = False):
+        '''Earth-fixed position in km, shape (..., 3) for a time array. With
+        with_velocity, also returns the velocity in km/s.'''
+        dt = np.asarray(self._seconds(t))
+        if np.any(dt < 0) or np.any(dt > self.duration_s):
+            raise ValueError('Time is outside of the ephemeris')
+        seg = np.minimum((dt // self.segment_s).astype(int), self.coeffs.shape[1] - 1)
+        x = 2.0 * (dt - seg * self.segment_s) / self.segment_s - 1.0
+        c = self.coeffs[sat_ndx, seg]   # (..., 3, n)
+        n = c.shape[-1]
+        if not with_velocity:
+            return np.einsum('...dj,...j->...d', c, _basis(x, n))
+        T, dT = _basis(x, n, with_derivative=True)
+        pos = np.einsum('...dj,...j->...d', c, T)
+        vel = np.einsum('...dj,...j->...d', c, dT) * (2.0 / self.segment_s)
+        return pos, vel
+
+    def look_angles(self, sat_ndx : int, observer : Observer, t : Time):
+        '''(az, el, range_km, range_rate_km_s) of one satellite for a time array.'''
+        pos, vel = self.position_itrs(sat_ndx, t, with_velocity=True)
+        return observer.look_angles(pos, vel)
+
+if __name__ == '__main__':
+    # Benchmark against Skyfield using the saved test data so the numbers are repeatable
+    import time
+    from skyfield.api import load, wgs84
+
+    ts = load.timescale()
+    with open('tests/amateur-241102.json') as f:
+        sats = [EarthSatellite.from_omm(ts, fields) for fields in json.load(f)]
+    obs_pos = wgs84.latlon(latitude_degrees=38.9596, longitude_degrees=-104.7695, elevation_m=2092)
+    observer = Observer(obs_pos)
+    t0 = Time(tt=2460617.3960255613, ts=ts)
+
+    start = time.perf_counter()
+    eph = build_ephemeris('cheb_ephemeris.npy', sats, t0, 6 * 3600)
+    print(f'Fit {len(sats)} satellites over 6 hours in {time.perf_counter() - start:.2f} s')
+    print(f'Worst fit error against SGP4 {eph.max_error_km() * 1000:.3f} m')
+
+    # The way a tracking loop uses it: one time per call
+    sat = sats[0]
+    difference = sat - obs_pos
+    samples = [t0 + k / 86400 for k in range(1000)]
+    start = time.perf_counter()
+    for t in samples:
+        difference.at(t).altaz()
+    sgp4_us = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for t in samples:
+        eph.look_angles(0, observer, t)
+    cheb_us = (time.perf_counter() - start) * 1000
+    print(f'One sample per call:  sat.at() {sgp4_us:6.1f} us   Chebyshev {cheb_us:6.1f} us')
+
+    # Whole arrays at once
+    samples = t0 + np.linspace(0, 6 / 24, 21600)
+    start = time.perf_counter()
+    alt, az, distance = difference.at(samples).altaz()
+    sgp4_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    cheb_az, cheb_el, cheb_range, _ = eph.look_angles(0, observer, samples)
+    cheb_ms = (time.perf_counter() - start) * 1000
+    err = np.max(np.abs(cheb_el - alt.degrees))
+    print(f'{len(samples)} samples per call:  sat.at() {sgp4_ms:6.1f} ms   Chebyshev {cheb_ms:6.1f} ms')
+    print(f'Max elevation difference from Skyfield {err:.6f} deg')
@@ -4,10 +4,14 @@ and positions that can be sent to a rotator.'''
 
 from datetime import datetime
 from typing import List
+import numpy as np
 from skyfield.api import EarthSatellite, Time
 from skyfield.api import wgs84
+from skyfield.units import Angle
 from SatellitePass import SatellitePass
 from rotator_position import RotatorPosition
+from pchip import UniformPchip
+from trajectory import Trajectory
 
 class LookPlan():
     '''Holds everything you need to command a rotator to follow a satellite pass.'''
@@ -18,10 +22,19 @@ class LookPlan():
                  obs_pos : wgs84.latlon,   # observer poosition on Earth
                  sat_pass : SatellitePass, 
                  time_step : float, # decimal fraction of a day 
+                 interpolate : bool = False
                  ):
+        '''Steps through the pass time_step at a time. With interpolate, the steps
+        are propagated in one call and turned into smooth interpolants so that
+        position_at() can be asked about any instant without propagating again.'''
         self.obs_pos = obs_pos
         self.sat_pass = sat_pass
+        self.interpolated = interpolate
         difference = sat_pass.sat - obs_pos
+        if interpolate:
+            self._build_interpolants(difference, time_step)
+            return
+
         end_time = sat_pass.descend_time.utc_datetime()
         look_time = sat_pass.ascend_time
         self.rotator_positions = []
@@ -31,9 +44,75 @@ class LookPlan():
             self.rotator_positions.append(RotatorPosition(look_time.utc_datetime(), az, alt))
             look_time += time_step
 
+    def _build_interpolants(self, difference, time_step : float):
+        '''Samples the pass at time_step, fits shape-preserving cubics to az, el and
+        range, and measures how far off they are halfway between the samples.'''
+        ts = self.sat_pass.ascend_time.ts
+        t0 = self.sat_pass.ascend_time
+        duration = self.sat_pass.descend_time - t0
+        num_steps = int(np.ceil(duration / time_step)) + 1   # Make sure LOS is covered
+        times = ts.tt_jd(t0.tt + np.arange(num_steps) * time_step)
+        alt, az, distance = difference.at(times).altaz()
+
+        self.rotator_positions = [RotatorPosition(dt, Angle(degrees=az.degrees[ndx]), Angle(degrees=alt.degrees[ndx]))
+                                  for ndx, dt in enumerate(times.utc_datetime())]
+
+        # Everything from here on is in POSIX seconds, the same as time.time()
+        self.t0 = t0.utc_datetime().timestamp()
+        self.t_end = self.t0 + (num_steps - 1) * time_step * 86400.0
+        step_s = time_step * 86400.0
+        self._az = UniformPchip(self.t0, step_s, np.unwrap(az.degrees, period=360.0))
+        self._el = UniformPchip(self.t0, step_s, alt.degrees)
+        self._range = UniformPchip(self.t0, step_s, distance.km)
+
+        # Check against the real thing where the interpolants are least certain
+        mid_times = ts.tt_jd(times.tt[:-1] + time_step / 2.0)
+        alt, az, distance = difference.at(mid_times).altaz()
+        mid_s = self.t0 + (np.arange(num_steps - 1) + 0.5) * step_s
+        az_err = (self._az(mid_s) - az.degrees + 180.0) % 360.0 - 180.0
+        self.interp_error = (float(np.max(np.abs(az_err))),
+                             float(np.max(np.abs(self._el(mid_s) - alt.degrees))),
+                             float(np.max(np.abs(self._range(mid_s) - distance.km))))
+
+    def position_at(self, timestamp, unwrapped : bool = False):
+        '''Returns (az, el, range_km) at a POSIX timestamp (float or array) from the
+        interpolants. Azimuth is a compass angle unless unwrapped is set, in which
+        case it is continuous over the whole pass. The error estimate for each value
+        is in self.interp_error. Only available with interpolate=True.'''
+        if not self.interpolated:
+            raise RuntimeError('LookPlan was not built with interpolate=True')
+        az = self._az(timestamp)
+        if not unwrapped:
+            az = az % 360.0
+        return az, self._el(timestamp), self._range(timestamp)
+
+    def az_el_degrees(self) -> tuple[np.ndarray, np.ndarray]:
+        '''Returns the compass azimuth and elevation of every step as numpy arrays.'''
+        az = np.array([pos.az.degrees for pos in self.rotator_positions])
+        el = np.array([pos.el.degrees for pos in self.rotator_positions])
+        return az, el
+
+    def to_trajectory(self, tolerance : float = 0.05, step_s : float = 1.0, az_offset : float = 0.0):
+        '''Packs the pass into the G5500 service's compact polynomial trajectory (see
+        trajectory.py), ready for its TRACKPOLY command. With interpolate the
+        interpolants are sampled every step_s seconds, otherwise the steps are used
+        as they are. az_offset shifts the unwrapped azimuth into rotator coordinates,
+        e.g. by a whole turn from the wrap planner.'''
+        if self.interpolated:
+            t = np.append(np.arange(self.t0, self.t_end, step_s), self.t_end)
+            az, el, _ = self.position_at(t, unwrapped=True)
+        else:
+            t = np.array([pos.look_time.timestamp() for pos in self.rotator_positions])
+            az, el = self.az_el_degrees()
+            az = np.unwrap(az, period=360.0)
+        return Trajectory.fit(t, az + az_offset, el, tolerance=tolerance)
+
     def __str__(self):
         sat = self.sat_pass.sat
         s = f'LookPlan for {sat.name} ({sat.model.satnum}) from {self.obs_pos}\n'
+        if self.interpolated:
+            az_err, el_err, range_err = self.interp_error
+            s += f'Interpolation error up to Az {az_err:.3f} Elev {el_err:.3f} deg, Distance {range_err:.3f} km\n'
         for pos in self.rotator_positions:
             dt_str = pos.look_time.astimezone(LookPlan.TZ)
             s += f'{dt_str} Az = {pos.az.degrees:6.2f} Elev = {pos.el.degrees:6.2f}\n'
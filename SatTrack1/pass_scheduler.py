@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+'''Picks which passes to track when there are more than one rotator can follow.
+This is the classic weighted interval scheduling problem with a twist: after one
+pass sets, the rotator needs time to slew from where the satellite went down to
+where the next one comes up. The answer is an ordered list of passes that can be
+fed one after another to LookPlan and Rotator.execute_look_plan().'''
+
+from bisect import bisect_right
+import numpy as np
+from rotator import Rotator
+
+# A pass is worth this much for climbing all the way to the zenith...
+ELEVATION_WEIGHT = 10.0
+# ...plus this much for every minute it is above the horizon
+DURATION_WEIGHT = 1.0
+# Extra seconds between passes for relays to settle and the operator to blink
+SETUP_TIME_S = 5.0
+
+def schedule(start, end, weight, aos_az, aos_el, los_az, los_el,
+             rotator : Rotator, setup_time : float = SETUP_TIME_S) -> list[int]:
+    '''Core of the scheduler. Everything is a 1-D array with one entry per pass.
+    Times are in seconds, angles in degrees. Returns the indices of the chosen
+    passes in time order.
+
+    Sorting is O(n log n). The only pairs we check one by one are the ones that
+    end within a worst-case slew of the next start, which is a handful at most.
+    Anything older than that is compatible no matter where it finished.'''
+    start, end, weight = (np.asarray(a, dtype=float) for a in (start, end, weight))
+    aos_az, aos_el, los_az, los_el = (np.asarray(a, dtype=float) for a in (aos_az, aos_el, los_az, los_el))
+    num_passes = len(start)
+    if num_passes == 0:
+        return []
+
+    order = np.argsort(end, kind='stable')
+    start, end, weight = start[order], end[order], weight[order]
+    aos_az, aos_el, los_az, los_el = aos_az[order], aos_el[order], los_az[order], los_el[order]
+
+    max_slew = float(rotator.slew_time(rotator.az_min_deg, rotator.el_min_deg,
+                                       rotator.az_max_deg, rotator.el_max_deg)) + setup_time
+    # Last pass guaranteed to be compatible and last pass that might be
+    safe = np.searchsorted(end, start - max_slew, side='right') - 1
+    tight = np.searchsorted(end, start, side='right') - 1
+
+    ending = np.zeros(num_passes)   # best total for a schedule that ends with pass i
+    prefix = np.zeros(num_passes)   # best total for a schedule using passes 0..i
+    prefix_arg = np.full(num_passes, -1)
+    parent = np.full(num_passes, -1)
+    for i in range(num_passes):
+        best, best_prev = 0.0, -1
+        if safe[i] >= 0:
+            best, best_prev = prefix[safe[i]], prefix_arg[safe[i]]
+
+        lo, hi = safe[i] + 1, min(tight[i], i - 1) + 1
+        if lo < hi:
+            slew = rotator.slew_time(los_az[lo:hi], los_el[lo:hi], aos_az[i], aos_el[i])
+            fits = end[lo:hi] + slew + setup_time <= start[i]
+            if np.any(fits):
+                candidates = np.where(fits, ending[lo:hi], -np.inf)
+                j = int(np.argmax(candidates))
+                if candidates[j] > best:
+                    best, best_prev = candidates[j], lo + j
+
+        ending[i] = weight[i] + best
+        parent[i] = best_prev
+        if i > 0 and prefix[i - 1] >= ending[i]:
+            prefix[i], prefix_arg[i] = prefix[i - 1], prefix_arg[i - 1]
+        else:
+            prefix[i], prefix_arg[i] = ending[i], i
+
+    chosen = []
+    i = prefix_arg[-1]
+    while i >= 0:
+        chosen.append(int(order[i]))
+        i = parent[i]
+    chosen.reverse()
+    return chosen
+
+def pass_value(max_el : float, duration_s : float, priority : float = 1.0) -> float:
+    '''How much a pass is worth to us.'''
+    return priority * (ELEVATION_WEIGHT * max_el / 90.0 + DURATION_WEIGHT * duration_s / 60.0)
+
+def pass_geometry(passes, obs_pos):
+    '''Computes the arrays schedule() needs from a list of SatellitePass objects.
+    Returns (start, end, max_el, aos_az, aos_el, los_az, los_el).'''
+    num_passes = len(passes)
+    start, end = np.zeros(num_passes), np.zeros(num_passes)
+    max_el = np.zeros(num_passes)
+    aos_az, aos_el = np.zeros(num_passes), np.zeros(num_passes)
+    los_az, los_el = np.zeros(num_passes), np.zeros(num_passes)
+    for ndx, sat_pass in enumerate(passes):
+        # One propagation call per pass for rise, peak, and set together
+        ts = sat_pass.peak_time.ts
+        times = ts.tt_jd(np.array([sat_pass.ascend_time.tt, sat_pass.peak_time.tt, sat_pass.descend_time.tt]))
+        alt, az, _ = (sat_pass.sat - obs_pos).at(times).altaz()
+        start[ndx], end[ndx] = times.tt[0] * 86400.0, times.tt[2] * 86400.0
+        max_el[ndx] = alt.degrees[1]
+        aos_az[ndx], aos_el[ndx] = az.degrees[0], alt.degrees[0]
+        los_az[ndx], los_el[ndx] = az.degrees[2], alt.degrees[2]
+    return start, end, max_el, aos_az, aos_el, los_az, los_el
+
+def schedule_passes(passes, obs_pos, rotator : Rotator, priorities : dict = None,
+                    setup_time : float = SETUP_TIME_S) -> list:
+    '''Returns the best set of passes the rotator can follow, in time order.
+    priorities maps a satellite catalog number to a multiplier for its passes.
+    Satellites that aren't in the map get a priority of 1. Slews are estimated
+    from compass angles, i.e. without crossing north. That is only an estimate.
+    On a rotator with more than 360 degrees of azimuth the wrap planner may pick
+    a longer or shorter way round, so run the schedule through it to get the
+    real slews.'''
+    if priorities is None:
+        priorities = {}
+    start, end, max_el, aos_az, aos_el, los_az, los_el = pass_geometry(passes, obs_pos)
+    priority = np.array([priorities.get(p.sat.model.satnum, 1.0) for p in passes])
+    weight = pass_value(max_el, end - start, priority)
+    chosen = schedule(start, end, weight, aos_az, aos_el, los_az, los_el, rotator, setup_time)
+    return [passes[ndx] for ndx in chosen]
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+'''Shape-preserving piecewise cubic interpolation (PCHIP, Fritsch-Carlson) on a
+uniform grid. Unlike a regular cubic spline it never overshoots between samples,
+which matters for a rotator: an interpolated elevation that dips below the horizon
+or an azimuth that wiggles back and forth would be chased by the motors.
+
+Because the grid is uniform, finding the right piece is one division, so a lookup
+costs the same no matter how long the table is.'''
+
+import numpy as np
+
+class UniformPchip:
+    '''Interpolates samples y taken every step seconds starting at t0.'''
+
+    def __init__(self, t0 : float, step : float, y):
+        y = np.asarray(y, dtype=float)
+        assert(len(y) >= 2)
+        assert(step > 0)
+        self.t0 = t0
+        self.step = step
+        self.t_end = t0 + step * (len(y) - 1)
+        h = step
+        delta = np.diff(y) / h
+
+        # Slopes at the samples. Zero at local extrema, harmonic mean elsewhere.
+        d = np.zeros(len(y))
+        same_sign = delta[:-1] * delta[1:] > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            harmonic = 2.0 / (1.0 / delta[:-1] + 1.0 / delta[1:])
+        d[1:-1] = np.where(same_sign, harmonic, 0.0)
+        d[0] = self._end_slope(delta[0], delta[1] if len(delta) > 1 else delta[0])
+        d[-1] = self._end_slope(delta[-1], delta[-2] if len(delta) > 1 else delta[-1])
+
+        # Each piece is y_k + s * (d_k + s * (c2_k + s * c3_k)) with s = t - t_k
+        self.y = y[:-1]
+        self.c1 = d[:-1]
+        self.c2 = (3.0 * delta - 2.0 * d[:-1] - d[1:]) / h
+        self.c3 = (d[:-1] + d[1:] - 2.0 * delta) / (h * h)
+
+    @staticmethod
+    def _end_slope(delta0 : float, delta1 : float) -> float:
+        '''One-sided three-point slope, limited so the end pieces stay monotone.'''
+        d = (3.0 * delta0 - delta1) / 2.0
+        if np.sign(d) != np.sign(delta0):
+            return 0.0
+        if np.sign(delta0) != np.sign(delta1) and abs(d) > abs(3.0 * delta0):
+            return 3.0 * delta0
+        return d
+
+    def __call__(self, t):
+        '''Value at t, which may be a float or an array. Times outside the table are
+        clamped to the ends.'''
+        if np.ndim(t) == 0:
+            t = min(max(t, self.t0), self.t_end)
+            k = min(int((t - self.t0) / self.step), len(self.y) - 1)
+            s = t - (self.t0 + k * self.step)
+            return float(self.y[k] + s * (self.c1[k] + s * (self.c2[k] + s * self.c3[k])))
+        t = np.clip(np.asarray(t, dtype=float), self.t0, self.t_end)
+        k = np.minimum(((t - self.t0) / self.step).astype(int), len(self.y) - 1)
+        s = t - (self.t0 + k * self.step)
+        return self.y[k] + s * (self.c1[k] + s * (self.c2[k] + s * self.c3[k]))
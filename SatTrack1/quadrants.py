@@ -12,6 +12,7 @@ from SatellitePass import SatellitePass, upcoming_passes
 from rotator_position import RotatorPosition
 from look_plan import LookPlan
 from rotator import Rotator
+from wrap_planner import plan_look_plans
 
 class Globals:
     '''Encapsulates a name/value config file and turns it into a map of
@@ -123,9 +124,11 @@ if __name__ == "__main__":
         assert(False)
 
     time_step = 1 / (24 * 60)   # 1 minute
+    look_plans = []
     for sat_pass in all_passes:
         sat = sat_pass.sat
         look_plan = LookPlan(obs_pos, sat_pass, time_step=time_step)
+        look_plans.append(look_plan)
         mid_pos = int(len(look_plan.rotator_positions)/2)
         beg_ang = look_plan.rotator_positions[0].az.degrees
         mid_ang =  look_plan.rotator_positions[mid_pos].az.degrees
@@ -134,3 +137,9 @@ if __name__ == "__main__":
         print(f'\tBeg ang {beg_ang:6.2f} {quadrant(beg_ang)}')
         print(f'\tMid ang {mid_ang:6.2f} {quadrant(mid_ang)}')
         print(f'\tEnd ang {end_ang:6.2f} {quadrant(end_ang)}')
+
+    # Let the planner pick the wrap and flip mode so no pass needs an unwind
+    if look_plans:
+        rotator = Rotator(az_min_deg=0, az_max_deg=450, el_min_deg=0, el_max_deg=180, az_speed=90.0/15)
+        print()
+        print(plan_look_plans(look_plans, rotator))
@@ -2,7 +2,30 @@
 '''Provides a basic rotator intarface that can be used for testing and as a
 base class.'''
 
+import numpy as np
 from look_plan import LookPlan
+from tracker import LookPlanExecutor
+from wrap_planner import plan_look_plans
+
+def read_slew_rates(filename : str) -> dict[str, float]:
+    '''Reads the rotator_motion.txt written by the G5500 service's --characterize and
+    returns {'Az': rate, 'El': rate} in degrees/second, the slower direction of each.
+    Each line there is "Axis, Direction, Accel, Rate, Coast, CoastTime". Raises
+    ValueError if the file doesn't have both axes.'''
+    rates = {}
+    with open(filename) as f:
+        for linenum, line in enumerate(f, 1):
+            line = line.strip()
+            if line.startswith('#') or line == '':
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) != 6:
+                raise ValueError(f'{filename} line {linenum}: expected 6 fields, got {len(fields)}')
+            axis, rate = fields[0].capitalize(), float(fields[3])
+            rates[axis] = min(rate, rates.get(axis, rate))
+    if 'Az' not in rates or 'El' not in rates:
+        raise ValueError(f'{filename} needs rates for both Az and El')
+    return rates
 
 class Rotator:
     '''Provides a generic rotator interface.'''
@@ -12,30 +35,63 @@ class Rotator:
                  az_max_deg : int,
                  el_min_deg : int,
                  el_max_deg : int,
-                 az_speed : float   # degrees/second
+                 az_speed : float,  # degrees/second
+                 el_speed : float = 180.0/67  # degrees/second
                  ):
         self.az_min_deg = az_min_deg 
         self.az_max_deg = az_max_deg 
         self.el_min_deg = el_min_deg
         self.el_max_deg = el_max_deg 
         self.az_speed = az_speed 
+        self.el_speed = el_speed
         assert(self.az_min_deg < self.az_max_deg)
         assert(self.el_min_deg < self.el_max_deg)
         assert(self.az_speed > 0)
+        assert(self.el_speed > 0)
         self.positions = []
 
+    @classmethod
+    def from_motion_file(cls, filename : str, az_min_deg : int = 0, az_max_deg : int = 450,
+                         el_min_deg : int = 0, el_max_deg : int = 180):
+        '''Builds a Rotator with the measured slew rates from a rotator_motion.txt made
+        by the G5500 service's --characterize. Uses the slower direction of each axis.'''
+        rates = read_slew_rates(filename)
+        return cls(az_min_deg, az_max_deg, el_min_deg, el_max_deg, az_speed=rates['Az'], el_speed=rates['El'])
+
+    def slew_time(self, az0, el0, az1, el1):
+        '''Seconds needed to slew between two positions in rotator coordinates. Both
+        axes move at the same time so the slower axis sets the time. Works on
+        scalars or numpy arrays.'''
+        az_time = np.abs(np.asarray(az1) - az0) / self.az_speed
+        el_time = np.abs(np.asarray(el1) - el0) / self.el_speed
+        return np.maximum(az_time, el_time)
+
     def execute_look_plan(self, 
                           look_plan : LookPlan,
-                          immediate : bool = False) :
+                          immediate : bool = False,
+                          g5500 = None,
+                          rate_hz : float = 10.0):
         '''Moves the rotator to each of the specified positions at the desired
-        time. If the 'immediate' flag is True, it executes immediately.'''
+        time. If the 'immediate' flag is True, it executes immediately. g5500 is
+        the hardware backend to drive. Without one, this only reports the plan.
+        Returns the TrackingStats from the run, or None without hardware.'''
+        if not look_plan.interpolated:
+            # The tracker looks positions up between the steps so it needs interpolants
+            look_plan = LookPlan(look_plan.obs_pos, look_plan.sat_pass, time_step=10 / 86400, interpolate=True)
+        if g5500 is None:
+            print('No rotator hardware attached. This is what would be tracked:')
+            print(plan_look_plans([look_plan], self))
+            return None
         print('Executing look plan')
-        print("Wow! Wasn't that great?")
+        stats = LookPlanExecutor(g5500, self, rate_hz).run(look_plan, immediate)
+        print(stats)
+        return stats
 
     def __str__(self):
         s = f'Azimuth range = {self.az_min_deg} to {self.az_max_deg} degrees\n'
         s += f'Elevation range = {self.el_min_deg} to {self.el_max_deg} degrees\n'
-        s += f'Rate of azimuth rotation = {self.az_speed} degrees/sec'
+        s += f'Rate of azimuth rotation = {self.az_speed} degrees/sec\n'
+        s += f'Rate of elevation rotation = {self.el_speed:.2f} degrees/sec'
         s += str(self.positions)
         return s
     
@@ -0,0 +1,35 @@
+'''pytest for assigning passes to several rotators.'''
+
+import pytest
+from rotator import Rotator
+from SatellitePass import upcoming_passes
+from pass_scheduler import schedule_passes
+from antenna_assignment import assign_passes
+import test_satelite_pass   # Loads the saved satellites into pytest.amsats
+
+def rotator(el_max=180):
+    return Rotator(az_min_deg=0, az_max_deg=450, el_min_deg=0, el_max_deg=el_max, az_speed=6.0, el_speed=3.0)
+
+@pytest.fixture(scope='module')
+def all_passes():
+    passes = []
+    for sat in pytest.amsats[:60]:
+        sat_passes, _ = upcoming_passes(pytest.obs_pos, sat, 20.0, pytest.t, pytest.t_end)
+        passes += sat_passes
+    return passes
+
+def test_two_rotators_do_better_than_one(all_passes):
+    one = schedule_passes(all_passes, pytest.obs_pos, rotator())
+    two = assign_passes(all_passes, pytest.obs_pos, [rotator(), rotator(el_max=90)])
+    assigned = [p for plan in two for p in plan]
+    assert len(assigned) == len(set(map(id, assigned)))   # Nobody gets tracked twice
+    assert len(assigned) > len(one)
+
+def test_each_rotator_plan_is_in_order(all_passes):
+    plans = assign_passes(all_passes, pytest.obs_pos, [rotator(), rotator(), rotator()])
+    for plan in plans:
+        for a, b in zip(plan, plan[1:]):
+            assert a.descend_time.tt < b.ascend_time.tt
+
+def test_no_passes():
+    assert assign_passes([], pytest.obs_pos, [rotator(), rotator()]) == [[], []]
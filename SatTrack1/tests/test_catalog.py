@@ -0,0 +1,37 @@
+'''pytest for the whole-catalog snapshot.'''
+
+import time
+import numpy as np
+import pytest
+from catalog import Catalog
+import test_satelite_pass   # Loads the saved satellites into pytest.amsats
+
+def test_snapshot_matches_skyfield():
+    catalog = Catalog(pytest.amsats, pytest.obs_pos)
+    snap = catalog.snapshot(pytest.t)
+    for ndx in range(0, len(pytest.amsats), 10):
+        sat = pytest.amsats[ndx]
+        topocentric = (sat - pytest.obs_pos).at(pytest.t)
+        alt, az, distance = topocentric.altaz()
+        *_, range_rate = topocentric.frame_latlon_and_rates(pytest.obs_pos)
+        assert abs(snap.el[ndx] - alt.degrees) < 0.02
+        assert abs((snap.az[ndx] - az.degrees + 180) % 360 - 180) < 0.02 or abs(alt.degrees) > 89
+        assert abs(snap.range_km[ndx] - distance.km) < 1.0
+        assert abs(snap.range_rate[ndx] - range_rate.km_per_s) < 0.01
+
+def test_visible_is_sorted_and_above_horizon():
+    catalog = Catalog(pytest.amsats, pytest.obs_pos)
+    for minutes in range(5):
+        snap = catalog.snapshot(pytest.t + minutes / 1440)
+        up = catalog.visible(snap)
+        assert np.all(snap.el[up] > 0)
+        assert np.all(np.diff(snap.el[up]) <= 0)
+        assert len(up) == np.count_nonzero(snap.el > 0)
+
+def test_ten_thousand_objects_in_a_frame():
+    sats = (pytest.amsats * (10000 // len(pytest.amsats) + 1))[:10000]
+    catalog = Catalog(sats, pytest.obs_pos)
+    catalog.table(catalog.snapshot(pytest.t))
+    t0 = time.perf_counter()
+    catalog.table(catalog.snapshot(pytest.t + 1 / 86400))
+    assert time.perf_counter() - t0 < 0.5
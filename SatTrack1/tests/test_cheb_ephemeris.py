@@ -0,0 +1,37 @@
+'''pytest for the Chebyshev ephemeris.'''
+
+import numpy as np
+import pytest
+from cheb_ephemeris import build_ephemeris, ChebyshevEphemeris
+from topocentric import Observer
+import test_satelite_pass   # Loads the saved satellites into pytest.amsats
+
+@pytest.fixture(scope='module')
+def eph_file(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('eph') / 'eph.npy')
+    build_ephemeris(filename, pytest.amsats[:20], pytest.t, 4 * 3600)
+    return filename
+
+def test_error_bound(eph_file):
+    eph = ChebyshevEphemeris(eph_file)
+    assert 0 <= eph.max_error_km() < 0.001   # Better than a meter
+
+def test_matches_skyfield(eph_file):
+    eph = ChebyshevEphemeris(eph_file)
+    observer = Observer(pytest.obs_pos)
+    samples = pytest.t + np.linspace(0, 4 / 24, 2000)
+    for ndx in (0, 7, 19):
+        topocentric = (pytest.amsats[ndx] - pytest.obs_pos).at(samples)
+        alt, az, distance = topocentric.altaz()
+        *_, range_rate = topocentric.frame_latlon_and_rates(pytest.obs_pos)
+        cheb_az, cheb_el, cheb_range, cheb_rate = eph.look_angles(ndx, observer, samples)
+        assert np.max(np.abs(cheb_el - alt.degrees)) < 0.001
+        assert np.max(np.abs(cheb_range - distance.km)) < 0.01
+        assert np.max(np.abs(cheb_rate - range_rate.km_per_s)) < 0.001
+
+def test_single_time_and_limits(eph_file):
+    eph = ChebyshevEphemeris(eph_file)
+    many = eph.position_itrs(3, pytest.t + np.array([0.01, 0.02]))
+    assert np.allclose(eph.position_itrs(3, pytest.t + 0.02), many[1])
+    with pytest.raises(ValueError):
+        eph.position_itrs(3, pytest.t - 0.01)
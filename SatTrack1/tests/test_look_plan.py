@@ -0,0 +1,54 @@
+'''pytest for the interpolated look plan.'''
+
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from SatellitePass import upcoming_passes
+from look_plan import LookPlan
+from trajectory import Trajectory
+import test_satelite_pass   # Loads the saved satellites into pytest.amsats
+
+@pytest.fixture(scope='module')
+def sat_pass():
+    sat = next(x for x in pytest.amsats if x.model.satnum == 7530)
+    passes, _ = upcoming_passes(pytest.obs_pos, sat, 30.0, pytest.t, pytest.t_end)
+    return passes[2]   # Peaks around 52 degrees
+
+def test_interpolated_matches_exact(sat_pass):
+    look_plan = LookPlan(pytest.obs_pos, sat_pass, time_step=10 / 86400, interpolate=True)
+    az_err, el_err, range_err = look_plan.interp_error
+    assert az_err < 0.05 and el_err < 0.05 and range_err < 1.0
+
+    # Spot check at random times against Skyfield
+    ts = sat_pass.peak_time.ts
+    stamps = np.random.default_rng(3).uniform(look_plan.t0, look_plan.t_end, 50)
+    exact_times = ts.from_datetimes([datetime.fromtimestamp(s, timezone.utc) for s in stamps])
+    alt, az, distance = (sat_pass.sat - pytest.obs_pos).at(exact_times).altaz()
+    plan_az, plan_el, plan_range = look_plan.position_at(stamps)
+    assert np.max(np.abs((plan_az - az.degrees + 180) % 360 - 180)) <= az_err + 0.01
+    assert np.max(np.abs(plan_el - alt.degrees)) <= el_err + 0.01
+
+def test_azimuth_is_continuous(sat_pass):
+    look_plan = LookPlan(pytest.obs_pos, sat_pass, time_step=60 / 86400, interpolate=True)
+    stamps = np.linspace(look_plan.t0, look_plan.t_end, 5000)
+    az, _, _ = look_plan.position_at(stamps, unwrapped=True)
+    assert np.max(np.abs(np.diff(az))) < 1.0
+
+def test_scalar_lookups_are_cheap(sat_pass):
+    look_plan = LookPlan(pytest.obs_pos, sat_pass, time_step=60 / 86400, interpolate=True)
+    start = time.perf_counter()
+    for k in range(2000):
+        look_plan.position_at(look_plan.t0 + k * 0.05)
+    assert (time.perf_counter() - start) / 2000 < 0.0005
+
+def test_trajectory_round_trip(sat_pass):
+    look_plan = LookPlan(pytest.obs_pos, sat_pass, time_step=10 / 86400, interpolate=True)
+    traj = Trajectory.from_bytes(look_plan.to_trajectory(tolerance=0.05).to_bytes())
+    assert traj.t0 == look_plan.t0
+    assert len(traj.to_bytes()) < 4096
+    # Within the tolerance of the plan everywhere, not just at the fitted samples
+    stamps = np.linspace(look_plan.t0, look_plan.t_end, 5000)
+    plan_az, plan_el, _ = look_plan.position_at(stamps, unwrapped=True)
+    az, el = traj.evaluate(stamps - traj.t0)
+    assert np.max(np.abs(az - plan_az)) < 0.06 and np.max(np.abs(el - plan_el)) < 0.06
@@ -0,0 +1,79 @@
+'''pytest for the pass scheduler.'''
+
+import time
+import numpy as np
+from rotator import Rotator
+from pass_scheduler import schedule, schedule_passes
+import test_satelite_pass   # Loads the saved satellites into pytest.amsats
+import pytest
+from SatellitePass import upcoming_passes
+
+ROTATOR = Rotator(az_min_deg=0, az_max_deg=450, el_min_deg=0, el_max_deg=180, az_speed=6.0, el_speed=3.0)
+
+def brute_force(start, end, weight, aos_az, los_az):
+    '''Tries every subset. Only usable for a handful of passes.'''
+    best = 0.0
+    n = len(start)
+    for mask in range(1 << n):
+        chosen = sorted((i for i in range(n) if mask & (1 << i)), key=lambda i: start[i])
+        ok = all(end[a] + ROTATOR.slew_time(los_az[a], 0, aos_az[b], 0) + 5.0 <= start[b]
+                 for a, b in zip(chosen, chosen[1:]))
+        total = sum(weight[i] for i in chosen)
+        if ok and total > best:
+            best = total
+    return best
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(1)
+    for trial in range(20):
+        n = 9
+        start = np.sort(rng.uniform(0, 3000, n))
+        end = start + rng.uniform(120, 900, n)
+        weight = rng.uniform(1, 10, n)
+        aos_az, los_az = rng.uniform(0, 360, n), rng.uniform(0, 360, n)
+        zeros = np.zeros(n)
+        chosen = schedule(start, end, weight, aos_az, zeros, los_az, zeros, ROTATOR)
+        assert list(chosen) == sorted(chosen, key=lambda i: start[i])
+        assert np.isclose(weight[chosen].sum(), brute_force(start, end, weight, aos_az, los_az))
+
+def test_slew_time_is_respected():
+    # The second pass starts 20s after the first sets but is 180 degrees away
+    start, end = [0, 620, 700], [600, 900, 1000]
+    chosen = schedule(start, end, [5, 4, 3], [0, 180, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0], ROTATOR)
+    assert chosen == [0, 2]
+
+def test_thousands_of_passes_are_fast():
+    rng = np.random.default_rng(2)
+    n = 5000
+    start = np.sort(rng.uniform(0, 86400 * 3, n))
+    end = start + rng.uniform(120, 900, n)
+    zeros = np.zeros(n)
+    t0 = time.perf_counter()
+    chosen = schedule(start, end, rng.uniform(1, 10, n), rng.uniform(0, 360, n), zeros,
+                      rng.uniform(0, 360, n), zeros, ROTATOR)
+    assert time.perf_counter() - t0 < 1.0
+    assert len(chosen) > 0
+
+def test_schedule_real_passes():
+    all_passes = []
+    for sat in pytest.amsats[:40]:
+        sat_passes, _ = upcoming_passes(pytest.obs_pos, sat, 30.0, pytest.t, pytest.t_end)
+        all_passes += sat_passes
+    plan = schedule_passes(all_passes, pytest.obs_pos, ROTATOR)
+    assert 0 < len(plan) <= len(all_passes)
+    for a, b in zip(plan, plan[1:]):
+        assert a.descend_time.tt < b.ascend_time.tt
+
+def test_rotator_from_motion_file(tmp_path):
+    # As written by the G5500 service's --characterize
+    filename = tmp_path / 'rotator_motion.txt'
+    filename.write_text('# Axis, Direction, Accel (deg/s^2), Rate (deg/s), Coast (deg), CoastTime (s)\n'
+                        'Az, +, 20.00, 6.100, 0.900, 0.150\n'
+                        'Az, -, 20.00, 5.900, 0.900, 0.150\n'
+                        'El, +, 20.00, 2.690, 0.180, 0.067\n'
+                        'El, -, 20.00, 2.750, 0.180, 0.067\n')
+    rotator = Rotator.from_motion_file(str(filename), az_max_deg=540)
+    assert rotator.az_speed == 5.9 and rotator.el_speed == 2.69 and rotator.az_max_deg == 540
+    filename.write_text('Az, +, 20.00, 6.100, 0.900, 0.150\n')
+    with pytest.raises(ValueError):
+        Rotator.from_motion_file(str(filename))
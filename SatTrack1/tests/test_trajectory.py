@@ -0,0 +1,27 @@
+'''pytest for SatTrack1's copy of the TRACKPOLY trajectory format.'''
+
+import numpy as np
+import pytest
+from trajectory import Trajectory
+
+# Trajectory(1.7e9, [0, 10], [0, 10], [1, 1], [5, 5], [0, 0]) as G5500_srvc encodes it.
+# Its trajectory.py tests check the same bytes, so the two copies can't drift apart.
+WIRE_BYTES = bytes.fromhex('4735544a010000000200000000000040fc54d9410000000000000000000000000000803f0000a040'
+                           '0000000010270000000020410000803f0000a040000000003f58d97e')
+
+def test_wire_format():
+    traj = Trajectory(1.7e9, [0.0, 10.0], [0.0, 10.0], [1.0, 1.0], [5.0, 5.0], [0.0, 0.0])
+    assert traj.to_bytes() == WIRE_BYTES
+    again = Trajectory.from_bytes(WIRE_BYTES)
+    assert again.t0 == 1.7e9 and again.evaluate(2.5) == (2.5, 5.0)
+
+def test_fit_through_north():
+    t = np.arange(0.0, 600.0, 1.0)
+    az = (350.0 + 0.05 * t) % 360.0
+    traj = Trajectory.fit(t, az, 10.0 + 0.01 * t, t0=0.0, tolerance=0.05)
+    assert traj.max_error <= 0.05 + 1e-3
+    assert traj.evaluate(599.0)[0] > 360.0
+
+def test_damage_is_caught():
+    with pytest.raises(ValueError):
+        Trajectory.from_bytes(WIRE_BYTES[:-1] + bytes([WIRE_BYTES[-1] ^ 0xff]))
@@ -0,0 +1,53 @@
+'''pytest for the azimuth wrap and flip planner.'''
+
+import numpy as np
+from rotator import Rotator
+from wrap_planner import plan_wraps
+
+ROTATOR = Rotator(az_min_deg=0, az_max_deg=450, el_min_deg=0, el_max_deg=180, az_speed=90.0/15)
+
+def pass_track(az_start, az_end, max_el, n=30):
+    '''Fake pass that sweeps azimuth linearly and peaks in the middle.'''
+    az = np.linspace(az_start, az_end, n) % 360.0
+    el = max_el * np.sin(np.linspace(0, np.pi, n))
+    return az, el
+
+def test_no_unwind_needed():
+    az, el = pass_track(100, 200, 45)
+    plans = plan_wraps(az, el, ROTATOR)
+    assert plans.feasible[0]
+    assert not plans.flip[0]
+    assert np.allclose(plans.az[0], az)
+
+def test_uses_overlap_when_crossing_north():
+    # Clockwise through north. Starting at 300 keeps going to 420.
+    az, el = pass_track(300, 420, 45)
+    plans = plan_wraps(az, el, ROTATOR)
+    assert plans.feasible[0] and not plans.flip[0]
+    assert np.all(np.diff(plans.az[0]) > 0)
+    assert plans.az[0][-1] > 360
+
+def test_flips_when_overlap_is_not_enough():
+    # Counter-clockwise through north from 100 to 230 (i.e. -130). Neither wrap fits.
+    az, el = pass_track(100, -130, 60)
+    plans = plan_wraps(az, el, ROTATOR)
+    assert plans.feasible[0] and plans.flip[0]
+    traj_az, traj_el = plans.trajectory(0)
+    assert np.all(np.abs(np.diff(traj_az)) < 30)
+    assert traj_el.max() <= 180 and traj_el.min() >= 120
+
+def test_batch_with_padding_and_infeasible():
+    no_flip = Rotator(az_min_deg=0, az_max_deg=360, el_min_deg=0, el_max_deg=90, az_speed=6)
+    az = np.full((2, 30), np.nan)
+    el = np.full((2, 30), np.nan)
+    az[0, :20], el[0, :20] = pass_track(10, 80, 30, n=20)
+    az[1], el[1] = pass_track(300, 420, 30)
+    plans = plan_wraps(az, el, no_flip)
+    assert list(plans.feasible) == [True, False]
+    assert len(plans.trajectory(0)[0]) == 20
+
+def test_start_position_picks_closest_wrap():
+    # A pass that lives entirely in 10..60 could also be run at 370..420
+    az, el = pass_track(10, 60, 30)
+    assert plan_wraps(az, el, ROTATOR, start_az=0).az[0][0] < 360
+    assert plan_wraps(az, el, ROTATOR, start_az=440).az[0][0] > 360
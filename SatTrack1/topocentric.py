@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+'''Bare-bones frame conversions for when we propagate a whole catalog at once with
+sgp4's SatrecArray instead of going through Skyfield one satellite at a time.
+Skyfield does this properly with nutation and polar motion. We skip those since
+they are worth a few arcseconds, which is far below what a G-5500 can point to.'''
+
+import numpy as np
+from skyfield.sgp4lib import theta_GMST1982
+from skyfield.toposlib import GeographicPosition
+
+DAY_S = 86400.0
+
+def teme_to_itrs(r_teme, v_teme, jd_ut1, fraction_ut1=0.0):
+    '''Rotates SGP4 output (km and km/s, shape (..., 3)) into the Earth-fixed frame.
+    The velocity picks up the Earth's rotation so it is relative to the ground.'''
+    theta, theta_dot = theta_GMST1982(jd_ut1, fraction_ut1)
+    omega = theta_dot / DAY_S   # rad/s
+    c, s = np.cos(theta), np.sin(theta)
+    x, y, z = r_teme[..., 0], r_teme[..., 1], r_teme[..., 2]
+    vx, vy, vz = v_teme[..., 0], v_teme[..., 1], v_teme[..., 2]
+    r = np.stack([c * x + s * y, -s * x + c * y, z], axis=-1)
+    v = np.stack([c * vx + s * vy + omega * r[..., 1],
+                  -s * vx + c * vy - omega * r[..., 0],
+                  vz], axis=-1)
+    return r, v
+
+class Observer:
+    '''An observer's Earth-fixed position and local east/north/up axes.'''
+
+    def __init__(self, obs_pos : GeographicPosition):
+        self.obs_pos = obs_pos
+        self.itrs_km = np.asarray(obs_pos.itrs_xyz.km)
+        lat, lon = obs_pos.latitude.radians, obs_pos.longitude.radians
+        self.enu = np.array([
+            [-np.sin(lon), np.cos(lon), 0.0],
+            [-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)],
+            [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]])
+
+    def look_angles(self, r_itrs, v_itrs=None):
+        '''Returns (az, el, range_km, range_rate_km_s) for Earth-fixed positions of
+        shape (..., 3). Angles are in degrees. range_rate is None without velocities.'''
+        rel = r_itrs - self.itrs_km
+        e, n, u = np.moveaxis(rel @ self.enu.T, -1, 0)
+        rng = np.sqrt(e * e + n * n + u * u)
+        az = np.degrees(np.arctan2(e, n)) % 360.0
+        el = np.degrees(np.arcsin(u / rng))
+        range_rate = None
+        if v_itrs is not None:
+            range_rate = np.einsum('...i,...i->...', rel, v_itrs) / rng
+        return az, el, rng, range_rate
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+'''Follows a satellite pass with a real rotator. The tracker runs a fixed-rate loop
+paced by the monotonic clock. Every tick it looks up where the satellite will be a
+little in the future, reads where the antenna is, and switches the relays on or off
+to close the gap.
+
+The hardware is any G5500 backend from the G5500_srvc folder (or anything else with
+the same read_sensors/move_*/stop_* methods). Nothing here imports it so SatTrack1
+keeps working without the hardware packages installed.'''
+
+from dataclasses import dataclass, field
+import logging
+import time
+import numpy as np
+from look_plan import LookPlan
+from wrap_planner import plan_look_plans
+
+logger = logging.getLogger('tracker')
+
+RATE_HZ = 10.0        # Control loop rate
+DEADBAND_DEG = 1.0    # Start moving an axis when it is this far behind
+MAX_LEAD_S = 3.0      # Never look further ahead than this
+
+@dataclass
+class TickRecord:
+    '''What happened on one tick of the control loop.'''
+    tick : int
+    jitter_s : float    # How late the tick started compared to its schedule
+    target_az : float   # Where the satellite was (rotator coordinates)
+    target_el : float
+    az : float          # Where the antenna was
+    el : float
+
+    @property
+    def az_error(self) -> float:
+        return self.target_az - self.az
+
+    @property
+    def el_error(self) -> float:
+        return self.target_el - self.el
+
+@dataclass
+class TrackingStats:
+    '''Summary of a tracking run.'''
+    ticks : list = field(default_factory=list)
+    overruns : int = 0   # Ticks skipped because the loop fell behind
+
+    def __str__(self):
+        if not self.ticks:
+            return 'No ticks recorded'
+        jitter = np.array([t.jitter_s for t in self.ticks]) * 1000.0
+        az_err = np.array([t.az_error for t in self.ticks])
+        el_err = np.array([t.el_error for t in self.ticks])
+        s = f'{len(self.ticks)} ticks, {self.overruns} overruns\n'
+        s += f'Jitter mean {jitter.mean():.2f} ms, max {jitter.max():.2f} ms\n'
+        s += f'Az error RMS {np.sqrt(np.mean(az_err**2)):.2f} deg, max {np.max(np.abs(az_err)):.2f} deg\n'
+        s += f'El error RMS {np.sqrt(np.mean(el_err**2)):.2f} deg, max {np.max(np.abs(el_err)):.2f} deg'
+        return s
+
+class AxisDriver:
+    '''Bang-bang control of one axis with a deadband, plus the measurements used
+    to work out how far ahead the axis has to aim.'''
+
+    def __init__(self, name, move_up, move_down, stop, deadband : float, rate : float):
+        self.name = name
+        self.move_up, self.move_down, self.stop = move_up, move_down, stop
+        self.deadband = deadband
+        self.direction = 0          # -1, 0 or +1
+        self.rate = rate            # Slew rate in deg/s. Starts at the nominal rate, then measured.
+        self.lag_s = 0.0            # Measured time lost getting up to speed
+        self.on_time = None
+        self.on_pos = None
+        self.last_time = None
+        self.last_pos = None
+
+    def lead_s(self, period : float) -> float:
+        '''How far ahead to aim so the axis arrives on time.'''
+        return min(period + self.lag_s, MAX_LEAD_S)
+
+    def update(self, now : float, pos : float, error : float):
+        '''Measures the axis and switches the relays for one tick.'''
+        if self.direction != 0 and self.last_time is not None and now > self.last_time:
+            # Slew rate from successive readings, then motor lag from how far short
+            # of full speed we are since the relay closed
+            step_rate = abs(pos - self.last_pos) / (now - self.last_time)
+            if now - self.on_time > 1.0:
+                self.rate = 0.8 * self.rate + 0.2 * step_rate
+            if self.rate > 0:
+                lag = (now - self.on_time) - abs(pos - self.on_pos) / self.rate
+                self.lag_s = 0.9 * self.lag_s + 0.1 * max(0.0, lag)
+        self.last_time, self.last_pos = now, pos
+
+        want = self.direction
+        if abs(error) > self.deadband:
+            want = 1 if error > 0 else -1
+        elif abs(error) < self.deadband / 2 or np.sign(error) != self.direction:
+            want = 0
+
+        if want != self.direction:
+            if want == 0:
+                self.stop()
+            else:
+                (self.move_up if want > 0 else self.move_down)()
+                self.on_time, self.on_pos = now, pos
+            self.direction = want
+
+class LookPlanExecutor:
+    '''Drives a G5500 backend through a look plan in real time.'''
+
+    def __init__(self, g5500, rotator, rate_hz : float = RATE_HZ, deadband : float = DEADBAND_DEG,
+                 clock=time.monotonic, wall_clock=time.time, sleep=time.sleep):
+        self.g5500 = g5500
+        self.rotator = rotator
+        self.period = 1.0 / rate_hz
+        self.clock, self.wall_clock, self.sleep = clock, wall_clock, sleep
+        self.az_axis = AxisDriver('Az', g5500.move_az_right, g5500.move_az_left, g5500.stop_az_motion,
+                                  deadband, rotator.az_speed)
+        self.el_axis = AxisDriver('El', g5500.move_el_up, g5500.move_el_down, g5500.stop_el_motion,
+                                  deadband, rotator.el_speed)
+
+    def _rotator_track(self, look_plan : LookPlan, az_now : float, el_now : float):
+        '''Returns a function giving the rotator (az, el) at a POSIX time, using the
+        wrap and flip mode that avoids an unwind during the pass.'''
+        plans = plan_look_plans([look_plan], self.rotator, start_az=az_now, start_el=el_now)
+        if not plans.feasible[0]:
+            logger.warning('No wrap fits this pass. The rotator will have to unwind part way through.')
+        flip = bool(plans.flip[0])
+        plan_start = look_plan.position_at(look_plan.t0, unwrapped=True)[0] + (180.0 if flip else 0.0)
+        shift = plans.az[0, 0] - plan_start
+        el_min, el_max = self.rotator.el_min_deg, self.rotator.el_max_deg
+        az_min, az_max = self.rotator.az_min_deg, self.rotator.az_max_deg
+
+        def track(timestamp):
+            az, el, _ = look_plan.position_at(timestamp, unwrapped=True)
+            if flip:
+                az, el = az + 180.0, 180.0 - el
+            return min(max(az + shift, az_min), az_max), min(max(el, el_min), el_max)
+        return track, flip
+
+    def run(self, look_plan : LookPlan, immediate : bool = False) -> TrackingStats:
+        '''Pre-positions to AOS, waits for it, then tracks until LOS. With immediate,
+        the pass is replayed starting right now instead of at its real time.'''
+        az_now, el_now, pwr_on = self.g5500.read_sensors()
+        if not pwr_on:
+            raise RuntimeError('Rotator power is off. Cannot track.')
+        track, flip = self._rotator_track(look_plan, az_now, el_now)
+
+        # If we are late the pass has already started, so go to where it is now.
+        # Wall time is only used to line the plan up with the monotonic clock once.
+        # After that everything runs off the monotonic clock.
+        offset = self.wall_clock() - self.clock()
+        prepos_time = look_plan.t0 if immediate else max(look_plan.t0, self.clock() + offset)
+        aos_az, aos_el = track(prepos_time)
+        logger.info(f'Pre-positioning to Az {aos_az:.2f} El {aos_el:.2f} ({"flip" if flip else "normal"} mode)')
+        self.g5500.move_to(aos_az, aos_el)
+        if immediate:
+            offset = look_plan.t0 - self.clock()
+        plan_t0_mono = look_plan.t0 - offset
+        plan_end_mono = look_plan.t_end - offset
+
+        wait = plan_t0_mono - self.clock()
+        if wait > 0:
+            logger.info(f'Waiting {wait:.1f} s for AOS')
+            self.sleep(wait)
+
+        stats = TrackingStats()
+        start = max(self.clock(), plan_t0_mono)
+        tick = 0
+        try:
+            while True:
+                deadline = start + tick * self.period
+                if deadline > plan_end_mono:
+                    break
+                delay = deadline - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+                now = self.clock()
+                jitter = now - deadline
+
+                az, el, _ = self.g5500.read_sensors()
+                target_az, target_el = track(now + offset)
+                lead_az, _ = track(now + offset + self.az_axis.lead_s(self.period))
+                _, lead_el = track(now + offset + self.el_axis.lead_s(self.period))
+                self.az_axis.update(now, az, lead_az - az)
+                self.el_axis.update(now, el, lead_el - el)
+
+                record = TickRecord(tick, jitter, target_az, target_el, az, el)
+                stats.ticks.append(record)
+                logger.info(f'tick {tick} jitter {jitter * 1000:.2f} ms target {target_az:.2f},{target_el:.2f} '
+                            f'actual {az:.2f},{el:.2f} error {record.az_error:.2f},{record.el_error:.2f}')
+
+                # If we fell behind, skip the ticks we missed rather than bunching up
+                tick += 1
+                behind = int((self.clock() - (start + tick * self.period)) / self.period)
+                if behind > 0:
+                    stats.overruns += behind
+                    tick += behind
+        finally:
+            self.g5500.stop_motion()
+
+        logger.info(f'Tracking done\n{stats}')
+        return stats
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+'''Compact trajectory format for sending a whole pass to the G5500 service's
+TRACKPOLY command. This is SatTrack1's copy of G5500_srvc/trajectory.py, so the
+bytes it writes have to stay exactly what that one reads.
+
+Instead of thousands of az/el samples, the path is stored as the knots of a
+piecewise cubic Hermite curve: at each knot the time, the az and el, and how fast each is changing.
+Any two neighbouring knots define the cubic between them, and since neighbours share
+a knot the curve and its slope are continuous everywhere. Knots are only placed where
+the path needs them, so a 15 minute pass typically takes a few dozen.
+
+Azimuth is unwrapped before fitting, so a pass that goes through north is one
+smooth curve running past 360 (or below 0) rather than a jump.
+
+The binary layout, all little-endian:
+
+    Header, 24 bytes: magic b'G5TJ', version (u8), flags (u8), reserved (u16),
+        knot count (u32), start time t0 (f64, POSIX seconds), max error (f32,
+        degrees, the worst difference from the source samples, encoding included)
+    Knots, 20 bytes each: time since t0 (u32, milliseconds), az, daz/dt, el, del/dt
+        (f32, degrees and degrees per second)
+    CRC32 of everything before it (u32)
+
+    traj = Trajectory.fit(t, az, el, tolerance=0.05)
+    data = traj.to_bytes()
+    az, el = Trajectory.from_bytes(data).evaluate(seconds_since_t0)'''
+
+import bisect
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b'G5TJ'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHIdf')
+KNOT_DTYPE = np.dtype([('t_ms', '<u4'), ('az', '<f4'), ('daz', '<f4'), ('el', '<f4'), ('del', '<f4')])
+CRC = struct.Struct('<I')
+DEFAULT_TOLERANCE_DEG = 0.05
+MAX_KNOTS = 1000000
+
+def _hermite(s, h, y0, d0, y1, d1):
+    '''Cubic Hermite between (y0, slope d0) and (y1, slope d1) over a span of h, at
+    s in [0, 1]. Works on scalars or arrays.'''
+    s2 = s * s
+    s3 = s2 * s
+    return (2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * h * d0 + (3 * s2 - 2 * s3) * y1 + (s3 - s2) * h * d1
+
+class Trajectory:
+    '''A trajectory as Hermite knots. t holds the knot times in seconds since t0 and
+    t0 is POSIX time. Use fit() or from_bytes() rather than the constructor.'''
+
+    def __init__(self, t0 : float, t, az, daz, el, del_, max_error : float = 0.0):
+        self.t0 = float(t0)
+        self.t = np.asarray(t, dtype=float)
+        self.az, self.daz = np.asarray(az, dtype=float), np.asarray(daz, dtype=float)
+        self.el, self.del_ = np.asarray(el, dtype=float), np.asarray(del_, dtype=float)
+        self.max_error = max_error
+        if len(self.t) < 2:
+            raise ValueError('A trajectory needs at least two knots')
+        if np.any(np.diff(self.t) <= 0):
+            raise ValueError('Knot times must be increasing')
+        # Plain lists for single lookups, which numpy would mostly spend on overhead
+        self._knots = self.t.tolist()
+        self._rows = list(zip(self.az.tolist(), self.daz.tolist(), self.el.tolist(), self.del_.tolist()))
+
+    @classmethod
+    def fit(cls, t, az, el, tolerance : float = DEFAULT_TOLERANCE_DEG, t0 : float = None, unwrap : bool = True):
+        '''Fits a trajectory to samples. t is POSIX seconds (or seconds since t0 if
+        t0 is given). Knots go at sample times, as few as keep every sample within
+        tolerance degrees. With unwrap, az is unwrapped first.'''
+        t = np.asarray(t, dtype=float)
+        az = np.asarray(az, dtype=float)
+        el = np.asarray(el, dtype=float)
+        if len(t) < 2:
+            raise ValueError('Need at least two samples')
+        if t0 is None:
+            t0, t = t[0], t - t[0]
+        if unwrap:
+            az = np.unwrap(az, period=360.0)
+        # Slopes at the samples, which become the slopes at the knots
+        daz = np.gradient(az, t, edge_order=2) if len(t) > 2 else np.full(2, (az[1] - az[0]) / (t[1] - t[0]))
+        del_ = np.gradient(el, t, edge_order=2) if len(t) > 2 else np.full(2, (el[1] - el[0]) / (t[1] - t[0]))
+
+        def fits(i : int, j : int) -> bool:
+            '''True if one cubic from sample i to sample j stays close to all of them.'''
+            if j == i + 1:
+                return True
+            s = (t[i + 1:j] - t[i]) / (t[j] - t[i])
+            h = t[j] - t[i]
+            az_err = _hermite(s, h, az[i], daz[i], az[j], daz[j]) - az[i + 1:j]
+            el_err = _hermite(s, h, el[i], del_[i], el[j], del_[j]) - el[i + 1:j]
+            return max(np.max(np.abs(az_err)), np.max(np.abs(el_err))) <= tolerance
+
+        knots = [0]
+        n = len(t)
+        while knots[-1] < n - 1:
+            i = knots[-1]
+            # Double the span until it stops fitting, then bisect
+            good, step = i + 1, 1
+            while good + step < n and fits(i, good + step):
+                good += step
+                step *= 2
+            bad = min(good + step, n)
+            while bad - good > 1:
+                mid = (good + bad) // 2
+                if fits(i, mid):
+                    good = mid
+                else:
+                    bad = mid
+            knots.append(good)
+
+        knots = np.array(knots)
+        traj = cls(t0, t[knots], az[knots], daz[knots], el[knots], del_[knots])
+        # Measure after a trip through the binary format, so the bound covers that too
+        traj = cls.from_bytes(traj.to_bytes())
+        traj.max_error = traj.error_against(t, az, el)
+        return traj
+
+    def error_against(self, t, az, el) -> float:
+        '''Largest difference in degrees from samples at t (seconds since t0).'''
+        fit_az, fit_el = self.evaluate(np.asarray(t, dtype=float))
+        return float(max(np.max(np.abs(fit_az - az)), np.max(np.abs(fit_el - el))))
+
+    @property
+    def duration(self) -> float:
+        return float(self.t[-1])
+
+    def __len__(self):
+        return len(self.t)
+
+    def evaluate(self, t):
+        '''Returns (az, el) at t seconds since t0, scalar or array. Outside the knots
+        it holds the first or last position.'''
+        if np.ndim(t) == 0:
+            knots = self._knots
+            t = min(max(float(t), knots[0]), knots[-1])
+            i = min(max(bisect.bisect_right(knots, t) - 1, 0), len(knots) - 2)
+            h = knots[i + 1] - knots[i]
+            s = (t - knots[i]) / h
+            (az0, daz0, el0, del0), (az1, daz1, el1, del1) = self._rows[i], self._rows[i + 1]
+            return _hermite(s, h, az0, daz0, az1, daz1), _hermite(s, h, el0, del0, el1, del1)
+        t = np.clip(np.asarray(t, dtype=float), self.t[0], self.t[-1])
+        i = np.clip(np.searchsorted(self.t, t, side='right') - 1, 0, len(self.t) - 2)
+        h = self.t[i + 1] - self.t[i]
+        s = (t - self.t[i]) / h
+        az = _hermite(s, h, self.az[i], self.daz[i], self.az[i + 1], self.daz[i + 1])
+        el = _hermite(s, h, self.el[i], self.del_[i], self.el[i + 1], self.del_[i + 1])
+        return az, el
+
+    def shifted(self, az_offset : float):
+        '''The same trajectory with az_offset degrees added to the azimuth, e.g. a
+        whole turn to put it in rotator coordinates.'''
+        return Trajectory(self.t0, self.t, self.az + az_offset, self.daz, self.el, self.del_, self.max_error)
+
+    def sample(self, step_s : float):
+        '''Returns (t, az, el) every step_s seconds from the first knot to the last.'''
+        t = np.append(np.arange(0.0, self.duration, step_s), self.duration)
+        return (t,) + self.evaluate(t)
+
+    def to_bytes(self) -> bytes:
+        knots = np.empty(len(self.t), dtype=KNOT_DTYPE)
+        knots['t_ms'] = np.round(self.t * 1000.0)
+        knots['az'], knots['daz'] = self.az, self.daz
+        knots['el'], knots['del'] = self.el, self.del_
+        body = HEADER.pack(MAGIC, VERSION, 0, 0, len(knots), self.t0, self.max_error) + knots.tobytes()
+        return body + CRC.pack(zlib.crc32(body))
+
+    @classmethod
+    def from_bytes(cls, data : bytes):
+        '''Decodes to_bytes(). Raises ValueError if it is damaged or not a trajectory.'''
+        if len(data) < HEADER.size + CRC.size:
+            raise ValueError('Trajectory is too short')
+        body, (crc,) = data[:-CRC.size], CRC.unpack(data[-CRC.size:])
+        if zlib.crc32(body) != crc:
+            raise ValueError('Trajectory checksum does not match')
+        magic, version, flags, _, count, t0, max_error = HEADER.unpack_from(body)
+        if magic != MAGIC:
+            raise ValueError('Not a trajectory')
+        if version != VERSION:
+            raise ValueError(f'Trajectory version {version} is not supported')
+        if len(body) != HEADER.size + count * KNOT_DTYPE.itemsize or count > MAX_KNOTS:
+            raise ValueError('Trajectory length does not match its knot count')
+        knots = np.frombuffer(body, dtype=KNOT_DTYPE, offset=HEADER.size)
+        return cls(t0, knots['t_ms'] / 1000.0, knots['az'], knots['daz'], knots['el'], knots['del'], float(max_error))
+
+    def __str__(self):
+        return f'Trajectory of {len(self)} knots over {self.duration:.1f} s, max error {self.max_error:.3f} deg'
+
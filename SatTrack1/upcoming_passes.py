@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 '''Prints a list of upcoming passes for amateur radio satellites.'''
 
-from os import environ
+from os import environ, path
 from datetime import datetime, timezone
 import pytz
 import json
@@ -12,6 +12,11 @@ from SatellitePass import SatellitePass, upcoming_passes
 from rotator_position import RotatorPosition
 from look_plan import LookPlan
 from rotator import Rotator
+from pass_scheduler import schedule_passes
+
+# Written by the G5500 service's --characterize. Set motion_file in observer.txt to
+# use one somewhere else.
+MOTION_FILE = path.join(path.dirname(path.abspath(__file__)), '..', 'G5500_srvc', 'rotator_motion.txt')
 
 class Globals:
     '''Encapsulates a name/value config file and turns it into a map of
@@ -121,26 +126,38 @@ if __name__ == "__main__":
         print(f'{pass_num} {sat_pass}')
         pass_num += 1
 
-    # Let the user select a pass to track
-    pass_num = 0
-    while not(0 < pass_num <= len(all_passes)):
-        pass_num = int(input("Choose a pass to watch: ")) 
-    pass_num -= 1 # put it back to a zero index
-
-    sat_pass = all_passes[pass_num]
-    print(f"You selected {sat_pass.sat.name}")
-    print(sat_pass)
-    sat = sat_pass.sat
-
-    # Create and print the look plan
-    time_step = 1 / (24 * 60)   # 1 minute
-    look_plan = LookPlan(obs_pos, sat_pass, time_step=time_step)
-    print(look_plan)
-
     rotator = Rotator(az_min_deg=0, 
                     az_max_deg=540, 
                     el_min_deg=0, 
                     el_max_deg=180, 
                     az_speed=90.0/15)  # unloaded speed of the Yaesu G-5500
-    
-    rotator.execute_look_plan(look_plan)
+
+    # Use the measured slew rates instead if the rotator has been characterized
+    motion_file = getattr(Globals.vars, 'motion_file', MOTION_FILE)
+    if path.exists(motion_file):
+        rotator = Rotator.from_motion_file(motion_file, az_max_deg=540)
+        print(f'Using measured slew rates from {motion_file}')
+    else:
+        print(f'No motion file at {motion_file}. Using default slew rates.')
+
+    # Let the user select a pass to track or let the scheduler pick them all
+    pass_num = -1
+    while not(0 <= pass_num <= len(all_passes)):
+        pass_num = int(input("Choose a pass to watch (0 to schedule them all): ")) 
+
+    if pass_num == 0:
+        selected_passes = schedule_passes(all_passes, obs_pos, rotator)
+        print(f'Scheduled {len(selected_passes)} of {len(all_passes)} passes')
+    else:
+        selected_passes = [all_passes[pass_num - 1]] # put it back to a zero index
+
+    for sat_pass in selected_passes:
+        print(f"Tracking {sat_pass.sat.name}")
+        print(sat_pass)
+
+        # Create and print the look plan
+        time_step = 1 / (24 * 60)   # 1 minute
+        look_plan = LookPlan(obs_pos, sat_pass, time_step=time_step)
+        print(look_plan)
+
+        rotator.execute_look_plan(look_plan)
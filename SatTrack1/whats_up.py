@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+'''A "top" for the sky. Shows every satellite in a group that is above the horizon
+right now with its azimuth, elevation, range and range-rate, highest first, and
+refreshes it once a second or faster.'''
+
+import time
+import pytz
+from skyfield.api import load, wgs84, EarthSatellite
+from catalog import Catalog
+from tracking_satellites import load_from_file_or_url
+import argparse_config_file
+
+CONFIG_FILE = 'observer.txt'
+
+def run_live_table(catalog : Catalog, ts, refresh_hz : float = 1.0, max_rows : int = 40, tz=None):
+    '''Redraws the table at refresh_hz until interrupted.'''
+    period = 1.0 / refresh_hz
+    next_frame = time.monotonic()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            snap = catalog.snapshot(ts.now())
+            s = catalog.table(snap, max_rows, tz)
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            # Home the cursor and clear the screen before drawing
+            print('\033[H\033[J' + s + f'\nFrame took {elapsed_ms:.1f} ms. Ctrl-C to quit.', flush=True)
+            next_frame += period
+            time.sleep(max(0.0, next_frame - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+
+# Define the set of command-line arguments
+parser = argparse_config_file.ArgumentParserWithConfig(description=__doc__)
+parser.add_argument('--elevation_m', type=float, default=0)
+parser.add_argument('--longitude', type=float, default=0)
+parser.add_argument('--latitude', type=float, default=0)
+parser.add_argument('--timezone', type=str, default="UTC")
+parser.add_argument('--group', type=str, default="amateur", help='Celestrak group to show')
+parser.add_argument('--rate', type=float, default=1.0, help='Refreshes per second')
+parser.add_argument('--rows', type=int, default=40, help='Maximum number of rows to show')
+
+if __name__ == "__main__":
+    # Load configuration file and apply command-line overrides
+    try:
+        args = parser.load_args_and_overrides(CONFIG_FILE)
+    except FileNotFoundError as e:
+        print(e)
+        print('Using defaults and command-line only')
+        args = parser.parse_args()
+
+    ts = load.timescale()
+    sats = [EarthSatellite.from_omm(ts, fields) for fields in load_from_file_or_url(args.group)]
+    obs_pos = wgs84.latlon(latitude_degrees=args.latitude,
+                           longitude_degrees=args.longitude,
+                           elevation_m=args.elevation_m)
+    run_live_table(Catalog(sats, obs_pos), ts, args.rate, args.rows, pytz.timezone(args.timezone))
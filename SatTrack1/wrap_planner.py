@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+'''Plans how the rotator should follow each pass so that it never has to unwind
+in the middle of tracking. The G-5500 covers 0 to 450 degrees of azimuth and 0 to
+180 degrees of elevation. That gives us two tools to work with:
+
+  - The 360 to 450 degree overlap. A pass that crosses north can often be tracked
+    without hitting a stop if we start it one full turn higher or lower.
+  - Flip mode. Pointing at (az, el) is the same as pointing at (az + 180, 180 - el)
+    so a pass that crosses north can be followed by looking "over the top" from
+    the south side instead.
+
+For every pass we try both representations with every useful wrap offset, throw
+out the ones that would run past a limit, and keep the cheapest. All of the
+candidate passes are handled in one batch of numpy array operations.'''
+
+from dataclasses import dataclass
+import numpy as np
+
+# Flip mode works fine but it puts the elevation axis near the end of its travel
+# so we only use it when it buys us something. This is the tie-breaker in seconds.
+FLIP_PENALTY_S = 1.0
+
+# Wrap offsets to try. Compass azimuths are in [0, 360) to start with so there is
+# no point looking further out than this with a 450 degree rotator.
+WRAP_OFFSETS = np.array([-360.0, 0.0, 360.0, 720.0])
+
+# Rise and set times put the satellite right on the horizon, give or take a hair.
+# Elevations this close to a limit are clamped rather than treated as out of range.
+EL_TOLERANCE_DEG = 0.5
+
+@dataclass
+class WrapPlans:
+    '''The plan for a batch of passes. Row i of each array belongs to pass i.'''
+    flip : np.ndarray       # (P,) True if the pass is followed in flip mode
+    offset : np.ndarray     # (P,) Degrees added to the unwrapped azimuth track
+    feasible : np.ndarray   # (P,) False if no candidate fits inside the limits
+    az : np.ndarray         # (P, N) Rotator azimuth in degrees, continuous
+    el : np.ndarray         # (P, N) Rotator elevation in degrees
+    n_valid : np.ndarray    # (P,) Number of real samples in each row
+
+    def __len__(self):
+        return len(self.flip)
+
+    def trajectory(self, ndx : int) -> tuple[np.ndarray, np.ndarray]:
+        '''Returns the rotator (az, el) trajectory for one pass without the padding.'''
+        n = self.n_valid[ndx]
+        return self.az[ndx, :n], self.el[ndx, :n]
+
+    def __str__(self):
+        s = ''
+        for ndx in range(len(self)):
+            az, el = self.trajectory(ndx)
+            mode = 'flip' if self.flip[ndx] else 'normal'
+            ok = '' if self.feasible[ndx] else ' UNWIND NEEDED'
+            s += f'{ndx:3} {mode:6} Az {az[0]:6.2f} -> {az[-1]:6.2f}  El {el[0]:6.2f} -> {el[-1]:6.2f}{ok}\n'
+        return s
+
+def plan_wraps(az, el, rotator, start_az=None, start_el=0.0, flip_penalty=FLIP_PENALTY_S) -> WrapPlans:
+    '''Picks the azimuth wrap and flip mode for a batch of passes.
+
+    az and el are (P, N) arrays of compass azimuth and elevation in degrees, one row
+    per pass. Shorter passes are padded at the end with NaN. The rotator supplies the
+    limits and slew rates. If start_az/start_el are given (scalars or one per pass),
+    the plan also minimizes the time needed to get to the start of each pass.'''
+    az = np.atleast_2d(np.asarray(az, dtype=float))
+    el = np.atleast_2d(np.asarray(el, dtype=float))
+    assert(az.shape == el.shape)
+    num_passes, num_samples = az.shape
+
+    # Pad by repeating the last real sample so the padding adds no travel
+    n_valid = np.count_nonzero(~np.isnan(az), axis=1)
+    if np.any(n_valid == 0):
+        raise ValueError('Every pass needs at least one sample')
+    fill_ndx = np.minimum(np.arange(num_samples), (n_valid - 1)[:, None])
+    az = np.take_along_axis(az, fill_ndx, axis=1)
+    el = np.take_along_axis(el, fill_ndx, axis=1)
+
+    # Axis 1 of the candidate arrays is the representation: 0 = normal, 1 = flipped
+    cand_az = np.stack([az % 360.0, (az + 180.0) % 360.0], axis=1)
+    cand_el = np.stack([el, 180.0 - el], axis=1)
+
+    # Unwrap each track so it is continuous and starts in [0, 360)
+    track = np.unwrap(cand_az, period=360.0, axis=-1)
+    track -= np.floor(track[..., :1] / 360.0) * 360.0
+    lo = track.min(axis=-1)[..., None] + WRAP_OFFSETS   # (P, 2, K)
+    hi = track.max(axis=-1)[..., None] + WRAP_OFFSETS
+
+    el_ok = (cand_el.min(axis=-1) >= rotator.el_min_deg - EL_TOLERANCE_DEG) & \
+            (cand_el.max(axis=-1) <= rotator.el_max_deg + EL_TOLERANCE_DEG)
+    cand_el = np.clip(cand_el, rotator.el_min_deg, rotator.el_max_deg)
+    feasible = (lo >= rotator.az_min_deg) & (hi <= rotator.az_max_deg) & el_ok[..., None]
+
+    # Cost of each candidate in seconds. Stay near the native range when nothing
+    # else decides it.
+    cost = np.abs(WRAP_OFFSETS) * 1e-6 + np.array([0.0, flip_penalty])[:, None]
+    cost = np.broadcast_to(cost, feasible.shape).copy()
+    if start_az is not None:
+        start_az = np.broadcast_to(np.asarray(start_az, dtype=float), (num_passes,))
+        start_el = np.broadcast_to(np.asarray(start_el, dtype=float), (num_passes,))
+        first_az = track[..., :1] + WRAP_OFFSETS
+        first_el = cand_el[..., :1]
+        cost += rotator.slew_time(start_az[:, None, None], start_el[:, None, None], first_az, first_el)
+    cost[~feasible] = np.inf
+
+    best = np.argmin(cost.reshape(num_passes, -1), axis=1)
+    rep, k = np.divmod(best, len(WRAP_OFFSETS))
+    any_ok = feasible.reshape(num_passes, -1).any(axis=1)
+
+    rows = np.arange(num_passes)
+    offset = WRAP_OFFSETS[k]
+    plan_az = track[rows, rep] + offset[:, None]
+    plan_el = cand_el[rows, rep]
+
+    # Nothing fits. Fall back to the plain compass angles folded into the rotator's
+    # range. That track is not continuous and the rotator will have to unwind.
+    if not np.all(any_ok):
+        bad = ~any_ok
+        rep[bad] = 0
+        offset[bad] = 0.0
+        plan_az[bad] = rotator.az_min_deg + (az[bad] - rotator.az_min_deg) % 360.0
+        plan_el[bad] = np.clip(el[bad], rotator.el_min_deg, rotator.el_max_deg)
+
+    return WrapPlans(flip=rep == 1, offset=offset, feasible=any_ok,
+                     az=plan_az, el=plan_el, n_valid=n_valid)
+
+def plan_look_plans(look_plans, rotator, start_az=None, start_el=0.0) -> WrapPlans:
+    '''Convenience wrapper around plan_wraps() for a list of LookPlan objects.'''
+    num_samples = max(len(lp.rotator_positions) for lp in look_plans)
+    az = np.full((len(look_plans), num_samples), np.nan)
+    el = np.full((len(look_plans), num_samples), np.nan)
+    for ndx, look_plan in enumerate(look_plans):
+        plan_az, plan_el = look_plan.az_el_degrees()
+        az[ndx, :len(plan_az)] = plan_az
+        el[ndx, :len(plan_el)] = plan_el
+    return plan_wraps(az, el, rotator, start_az, start_el)